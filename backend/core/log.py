@@ -0,0 +1,116 @@
+"""
+Logging setup: JSON records handed to a background thread.
+
+Request threads and the event loop only put records on an in-memory queue
+(QueueHandler); a QueueListener thread formats them as JSON lines and does
+the actual writing to stdout and, optionally, a rotating file. Every record
+carries the id of the request (or Celery task) that produced it.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that owns its QueueListener and output handlers.
+
+    The listener thread does not survive fork(), so it is restarted in every
+    child (gunicorn and Celery prefork workers) and stopped at exit, flushing
+    what is left in the queue.
+    """
+
+    def __init__(self, filename=None, max_bytes=50 * 1024 * 1024, backup_count=5):
+        super().__init__(queue.SimpleQueue())
+        formatter = JsonFormatter()
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if filename:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8",
+            ))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.addFilter(RequestIdFilter())
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers)
+        self.listener.start()
+        os.register_at_fork(after_in_child=self._restart_listener)
+        atexit.register(self.listener.stop)
+
+    def _restart_listener(self):
+        self.queue = queue.SimpleQueue()
+        self.listener.queue = self.queue
+        self.listener._thread = None
+        self.listener.start()
+
+    def prepare(self, record):
+        # Resolve the message and traceback in the calling thread, since args
+        # may not be safe to format later, but leave the JSON to the listener.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# ----------------------------
+# Celery: carry the request id into tasks
+# ----------------------------
+@before_task_publish.connect
+def stamp_request_id(headers=None, **kwargs):
+    if headers is not None and request_id_var.get():
+        headers["request_id"] = request_id_var.get()
+
+
+@task_prerun.connect
+def set_task_request_id(task_id=None, task=None, **kwargs):
+    request_id_var.set(getattr(task.request, "request_id", None) or task_id)
+
+
+@task_postrun.connect
+def clear_task_request_id(**kwargs):
+    request_id_var.set(None)
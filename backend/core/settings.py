@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'requests_app',
     'ninja',
@@ -38,6 +39,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'requests_app.middleware.RequestIdMiddleware',
+    'requests_app.middleware.ReplicaRoutingMiddleware',
+    'requests_app.middleware.MetricsMiddleware',
+    'requests_app.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -94,6 +99,24 @@ DATABASES = {
     }
 }
 
+# Optional streaming replica for the reads of GET requests (see requests_app/replica.py)
+if os.environ.get('REPLICA_POSTGRES_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['REPLICA_POSTGRES_HOST'],
+        'PORT': os.environ.get('REPLICA_POSTGRES_PORT', DATABASES['default']['PORT']),
+        'USER': os.environ.get('REPLICA_POSTGRES_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('REPLICA_POSTGRES_PASSWORD', DATABASES['default']['PASSWORD']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['requests_app.replica.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5))
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# requests_app's migrations are generated at container start (see core/test_runner.py)
+TEST_RUNNER = 'core.test_runner.ModelSchemaTestRunner'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -131,6 +154,26 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Local mirror of the files uploaded through WP (see requests_app/attachments.py)
+ATTACHMENT_CHUNK_SIZE = int(os.environ.get('ATTACHMENT_CHUNK_SIZE', 64 * 1024))
+ATTACHMENT_MAX_BYTES = int(os.environ.get('ATTACHMENT_MAX_BYTES', 50 * 1024 * 1024))
+ATTACHMENT_DOWNLOAD_TIMEOUT = int(os.environ.get('ATTACHMENT_DOWNLOAD_TIMEOUT', 30))
+ATTACHMENT_MAX_ATTEMPTS = int(os.environ.get('ATTACHMENT_MAX_ATTEMPTS', 5))
+ATTACHMENT_RETRY_BASE_SECONDS = int(os.environ.get('ATTACHMENT_RETRY_BASE_SECONDS', 60))
+# Chunked uploads (see requests_app/uploads.py): largest PUT accepted and how
+# long an idle upload can still be resumed
+ATTACHMENT_UPLOAD_MAX_CHUNK = int(os.environ.get('ATTACHMENT_UPLOAD_MAX_CHUNK', 5 * 1024 * 1024))
+ATTACHMENT_UPLOAD_EXPIRY_HOURS = int(os.environ.get('ATTACHMENT_UPLOAD_EXPIRY_HOURS', 24))
+# Previews of images and PDFs (see requests_app/previews.py), longest side in px
+ATTACHMENT_THUMBNAIL_SIZE = int(os.environ.get('ATTACHMENT_THUMBNAIL_SIZE', 240))
+ATTACHMENT_PREVIEW_SIZE = int(os.environ.get('ATTACHMENT_PREVIEW_SIZE', 1200))
+ATTACHMENT_PREVIEW_QUALITY = int(os.environ.get('ATTACHMENT_PREVIEW_QUALITY', 75))
+# Hand downloads to the front proxy (see requests_app/downloads.py): '' streams
+# from Django, 'X-Accel-Redirect' for nginx, 'X-Sendfile' for Apache/lighttpd
+ATTACHMENT_SENDFILE_HEADER = os.environ.get('ATTACHMENT_SENDFILE_HEADER', '')
+# nginx 'internal' location aliased to MEDIA_ROOT
+ATTACHMENT_ACCEL_PREFIX = os.environ.get('ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -209,39 +252,42 @@ NINJA_JWT = {
 #     ldap.OPT_X_TLS_REQUIRE_CERT: ldap.OPT_X_TLS_NEVER,
 # }
 
+# JSON logs written from a background thread (see core/log.py).
+# LOG_LEVELS sets per-logger levels, e.g. "requests_app.provisioning=DEBUG,django.db.backends=DEBUG"
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = {
+    'django_auth_ldap': 'WARNING',
+    'ldap': 'WARNING',
+    **{
+        name.strip(): level.strip().upper()
+        for name, level in (
+            item.split('=', 1) for item in os.environ.get('LOG_LEVELS', '').split(',') if '=' in item
+        )
+    },
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
-        },
-    },
     'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
-        },
-        'file': {
-            'class': 'logging.FileHandler',
-            'filename': 'ldap_debug.log',
-            'formatter': 'verbose',
+        'background': {
+            '()': 'core.log.BackgroundHandler',
+            'filename': os.environ.get('LOG_FILE') or None,
+            'max_bytes': int(os.environ.get('LOG_FILE_MAX_BYTES', 50 * 1024 * 1024)),
+            'backup_count': int(os.environ.get('LOG_FILE_BACKUP_COUNT', 5)),
         },
     },
+    'root': {
+        'handlers': ['background'],
+        'level': LOG_LEVEL,
+    },
     'loggers': {
-        'django_auth_ldap': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
-        },
-        'ldap': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
-        },
+        # Django's own console handler would write synchronously; send it to the root handler instead
+        'django': {'handlers': [], 'level': LOG_LEVEL, 'propagate': True},
+        **{name: {'level': level} for name, level in LOG_LEVELS.items()},
     },
 }
 
-
 # Email Configuration for 2FA (Development)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST', '')
@@ -252,9 +298,123 @@ EMAIL_USE_SSL = False
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Cache (shared between web and Celery processes)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0')),
+        'KEY_PREFIX': 'clientes',
+    }
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
\ No newline at end of file
+CELERY_RESULT_SERIALIZER = 'json'
+
+# Routing: 2FA codes go to their own queue so they never wait behind bulk mail.
+# Run one worker per queue group, e.g.:
+#   celery -A core worker -Q auth --concurrency=2 --prefetch-multiplier=1 -O fair
+#   celery -A core worker -Q default,bulk --prefetch-multiplier=4
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'send_2fa_email_task': {'queue': 'auth'},
+    'send_welcome_email_task': {'queue': 'bulk'},
+    'send_rejection_email_task': {'queue': 'bulk'},
+    'send_email_batch_task': {'queue': 'bulk'},
+    'dispatch_email_outbox_task': {'queue': 'bulk'},
+    'reconcile_web_users_task': {'queue': 'bulk'},
+    'mirror_attachments_task': {'queue': 'bulk'},
+    'generate_previews_task': {'queue': 'bulk'},
+    'archive_requests_task': {'queue': 'bulk'},
+}
+# Nobody reads the return value of the email tasks; tasks that need their
+# result stored opt back in with ignore_result=False.
+CELERY_TASK_IGNORE_RESULT = True
+# Keep the JSON logging from core/log.py in workers
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+# Queue latency above this is logged as a warning (see requests_app/metrics.py)
+CELERY_QUEUE_LATENCY_WARN_SECONDS = float(os.environ.get('CELERY_QUEUE_LATENCY_WARN_SECONDS', 5))
+
+# Per-worker cache of existing CM_WEB.WEB_USER.USER_COD values (see requests_app/user_cod_index.py)
+USER_COD_INDEX_ENABLED = os.environ.get('USER_COD_INDEX_ENABLED', 'False') == 'True'
+USER_COD_INDEX_ARRAYSIZE = int(os.environ.get('USER_COD_INDEX_ARRAYSIZE', 5000))
+USER_COD_INDEX_REFRESH_SECONDS = int(os.environ.get('USER_COD_INDEX_REFRESH_SECONDS', 60))
+USER_COD_INDEX_RELOAD_SECONDS = int(os.environ.get('USER_COD_INDEX_RELOAD_SECONDS', 3600))
+
+# Bulk reconciliation of completed requests against CM_WEB.WEB_USER
+RECONCILE_CHUNK_SIZE = int(os.environ.get('RECONCILE_CHUNK_SIZE', 500))
+RECONCILE_ARRAYSIZE = int(os.environ.get('RECONCILE_ARRAYSIZE', 5000))
+
+# Archival of closed requests (see requests_app/archive.py): completed and
+# rejected requests idle for this many days, plus soft-deleted ones
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+
+# Live events over Redis pub/sub and SSE (see requests_app/events.py)
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+EVENTS_CHANNEL = os.environ.get('EVENTS_CHANNEL', 'requests:events')
+EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('EVENTS_KEEPALIVE_SECONDS', 15))
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+
+# Duplicate detection at ingest (see requests_app/duplicates.py). Name
+# similarity below 0.3, pg_trgm's default threshold, is never reached
+DUPLICATE_NAME_SIMILARITY = float(os.environ.get('DUPLICATE_NAME_SIMILARITY', 0.6))
+DUPLICATE_FLAG_SCORE = float(os.environ.get('DUPLICATE_FLAG_SCORE', 0.7))
+DUPLICATE_MAX_CANDIDATES = int(os.environ.get('DUPLICATE_MAX_CANDIDATES', 5))
+
+# Persistent SMTP connection per worker process (see requests_app/mail.py)
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+EMAIL_CONNECTION_IDLE_SECONDS = int(os.environ.get('EMAIL_CONNECTION_IDLE_SECONDS', 60))
+EMAIL_SEND_RETRIES = int(os.environ.get('EMAIL_SEND_RETRIES', 1))
+
+# Transactional email outbox (see requests_app/outbox.py)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 100))
+EMAIL_OUTBOX_DISPATCH_DELAY = int(os.environ.get('EMAIL_OUTBOX_DISPATCH_DELAY', 2))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 6))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get('EMAIL_OUTBOX_RETRY_BASE_SECONDS', 30))
+# How long a claimed batch is reserved for its dispatcher before another may take it
+EMAIL_OUTBOX_LEASE_SECONDS = int(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS', 300))
+# Safety net: beat runs the dispatcher this often even if no enqueue scheduled it
+EMAIL_OUTBOX_SWEEP_SECONDS = int(os.environ.get('EMAIL_OUTBOX_SWEEP_SECONDS', 60))
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-email-outbox': {
+        'task': 'dispatch_email_outbox_task',
+        'schedule': EMAIL_OUTBOX_SWEEP_SECONDS,
+    },
+}
+
+# 2FA codes: 'redis' keeps them in the cache (falls back to the database if
+# the cache is down), 'model' stores them in the TwoFactorAuth table
+TWO_FACTOR_STORE = os.environ.get('TWO_FACTOR_STORE', 'redis')
+TWO_FACTOR_CODE_TTL = int(os.environ.get('TWO_FACTOR_CODE_TTL', 600))
+TWO_FACTOR_MAX_ATTEMPTS = int(os.environ.get('TWO_FACTOR_MAX_ATTEMPTS', 5))
+
+# Sliding-window limits for the auth endpoints: scope -> (attempts, window seconds)
+AUTH_THROTTLE_RATES = {
+    'login_ip': (int(os.environ.get('LOGIN_IP_LIMIT', 20)), 60),
+    'login_user': (int(os.environ.get('LOGIN_USER_LIMIT', 5)), 60),
+    'verify_ip': (int(os.environ.get('VERIFY_IP_LIMIT', 30)), 300),
+    'verify_user': (int(os.environ.get('VERIFY_USER_LIMIT', 10)), 300),
+}
+
+# Cached user state for JWT-authenticated requests (see requests_app/authentication.py)
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 60))
+AUTH_USER_LOCAL_CACHE_TTL = int(os.environ.get('AUTH_USER_LOCAL_CACHE_TTL', 5))
+
+
+# Prometheus /metrics endpoint; scrapers must send 'Authorization: Bearer <token>'.
+# Left empty, /metrics answers 404 unless DEBUG is on
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Request profiling (see requests_app/middleware.py): requests carrying a token from
+# 'manage.py profiling_token' in the X-Profile header, plus this fraction of all requests
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get('PROFILING_TOKEN_MAX_AGE', 3600))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 100))
+
+# Cold-start budget for django.setup() plus URL/task loading ('manage.py startup_time' and tests)
+STARTUP_IMPORT_BUDGET_SECONDS = float(os.environ.get('STARTUP_IMPORT_BUDGET_SECONDS', 2.0))
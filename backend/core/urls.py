@@ -2,19 +2,25 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from ninja import NinjaAPI
-from ninja_jwt.authentication import JWTAuth
+from requests_app.authentication import CachedJWTAuth
+from requests_app.metrics import metrics_view, timed_view
 from requests_app.api import router as requests_router, auth_router
 
 api = NinjaAPI()
+api.add_decorator(timed_view)
 
-api.add_router("/requests", requests_router, auth=JWTAuth())
+api.add_router("/requests", requests_router, auth=CachedJWTAuth())
 api.add_router("/auth", auth_router)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api.urls),
+    path('metrics', metrics_view),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # runserver served these itself; uvicorn doesn't
+    urlpatterns += staticfiles_urlpatterns()
\ No newline at end of file
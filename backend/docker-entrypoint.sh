@@ -13,6 +13,15 @@ echo "Ejecutando migraciones..."
 python manage.py migrate --noinput
 echo "✅ Migraciones completadas"
 
+# Vaciar el directorio de métricas compartido: los ficheros de una ejecución
+# anterior sumarían procesos que ya no existen. Solo lo hace el backend, que
+# arranca antes que los workers de Celery.
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ] && [ "$PROMETHEUS_MULTIPROC_CLEAN" = "True" ]; then
+  echo "Vaciando $PROMETHEUS_MULTIPROC_DIR..."
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+  rm -f "$PROMETHEUS_MULTIPROC_DIR"/*.db
+fi
+
 # Crear superusuario (si no existe)
 echo "Intentando crear superusuario..."
 if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_EMAIL" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ]; then
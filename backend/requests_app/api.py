@@ -1,9 +1,11 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from ninja import Router
-from django.shortcuts import get_object_or_404
-import oracledb
-from django.conf import settings
-from .models import UserRequest, RequestHistory, AuthorizedPerson, TwoFactorAuth
+from ninja.responses import Response
+from django.shortcuts import get_object_or_404, aget_object_or_404
+from django.http import Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from .models import UserRequest, AuthorizedPerson, Attachment, AttachmentUpload, ArchivedRequest
 from .schemas import (
     UserRequestSchema,
     UserRequestCreateSchema,
@@ -13,20 +15,39 @@ from .schemas import (
     AuthorizedPersonCreateSchema,
     MessageOut,
     ApproveRequestSchema,
+    AttachmentSchema,
+    AttachmentUploadCreateSchema,
+    AttachmentUploadSchema,
+    ArchivedRequestSchema,
 )
 from django.db.models import Count, Q
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from ninja_jwt.tokens import RefreshToken
+from .authentication import AsyncCachedJWTAuth, AsyncQueryJWTAuth
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from ninja.schema import Schema
-from .tasks import send_2fa_email_task, send_welcome_email_task, send_rejection_email_task
+from .tasks import send_2fa_email_task
+from .outbox import enqueue_email
+from .email_templates import format_users_section
+from .provisioning import provision_oracle_users
+from . import two_factor
+from .two_factor import get_two_factor_store
+from .throttling import check_rate_limits
+from . import wordpress
+from .attachments import schedule_mirror
+from .downloads import attachment_response
+from .duplicates import flag_duplicates
+from .listing import list_rows, parse_fields
+from .events import event, event_stream, publish, request_changes_events, stats_delta
+from .previews import schedule_previews
+from .history import PERSONS_FIELD, action_type_for, apply_changes, record_history
+from .uploads import OffsetMismatch, UploadError, append_chunk, finalize_upload, start_upload
+from .metrics import WP_SYNC_RECORDS, WP_SYNC_SECONDS, timed
 import random
-import uuid
 import string
-import hashlib
-from datetime import datetime, timezone, timedelta
-import requests
+from datetime import datetime
+from uuid import UUID
 import json
 from django.utils.dateparse import parse_datetime
 
@@ -41,54 +62,6 @@ def get_client_ip(request):
     return ip
 
 
-import re
-import unicodedata
-
-def generate_user_cod(contact_name: str, cursor: oracledb.Cursor) -> str:
-    """
-    Generates a unique user code from a contact name, ensuring it is uppercase,
-    contains no special characters or accents, and does not already exist in the Oracle database.
-    """
-    # Normalize string: remove accents, convert to uppercase, and remove special characters
-    nfkd_form = unicodedata.normalize('NFKD', contact_name)
-    ascii_name = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-    
-    parts = ascii_name.split()
-    if not parts:
-        return "" # Should not happen if contact_name is mandatory
-
-    first_name = parts[0]
-    last_name_initials = ""
-    if len(parts) > 1:
-        for part in parts[1:]:
-            if part:
-                last_name_initials += part[0]
-    
-    base_code = re.sub(r'[^A-Z0-9]', '', (first_name + last_name_initials).upper())
-    
-    user_code = base_code
-    counter = 1
-    
-    # Check for uniqueness in Oracle DB
-    while True:
-        try:
-            cursor.execute("SELECT 1 FROM CM_WEB.WEB_USER WHERE USER_COD = :user_cod", {'user_cod': user_code})
-            if cursor.fetchone() is None:
-                # Code is unique
-                return user_code
-            else:
-                # Code exists, generate a new one
-                user_code = f"{base_code}{counter}"
-                counter += 1
-        except oracledb.Error as e:
-            # Handle potential DB errors during check
-            error_obj, = e.args
-            print(f"Oracle DB error while checking user_code uniqueness: {error_obj.message}")
-            # As a fallback, return a potentially non-unique code with a random suffix
-            # to avoid an infinite loop in case of persistent DB issues.
-            return f"{base_code}{uuid.uuid4().hex[:4].upper()}"
-
-
 # Routers
 router = Router()
 auth_router = Router()
@@ -109,18 +82,18 @@ class VerifySchema(Schema):
 
 @auth_router.post("/login/")
 def login(request, payload: LoginSchema):
+    # Rechazar antes de calcular el hash de la contraseña
+    throttled = check_rate_limits([
+        ("login_ip", get_client_ip(request)),
+        ("login_user", payload.username.lower()),
+    ])
+    if throttled:
+        return throttled
+
     user = authenticate(username=payload.username, password=payload.password)
     if user is not None:
         code = "".join(random.choices(string.digits, k=4))
-        expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
-        two_factor_auth, created = TwoFactorAuth.objects.update_or_create(
-            user=user,
-            defaults={
-                "code": code,
-                "expires_at": expires_at,
-                "created_at": datetime.now(timezone.utc),
-            },
-        )
+        get_two_factor_store().issue(user, code)
         send_2fa_email_task.delay(user.id, code)
         return {"message": "2FA code sent to your email."}
     return {"message": "Invalid credentials."}
@@ -128,10 +101,19 @@ def login(request, payload: LoginSchema):
 
 @auth_router.post("/verify-2fa/")
 def verify_2fa(request, payload: VerifySchema):
-    user = get_object_or_404(User, username=payload.username)
-    two_factor_auth = get_object_or_404(TwoFactorAuth, user=user, code=payload.code)
-
-    if not two_factor_auth.is_expired():
+    throttled = check_rate_limits([
+        ("verify_ip", get_client_ip(request)),
+        ("verify_user", payload.username.lower()),
+    ])
+    if throttled:
+        return throttled
+
+    result = get_two_factor_store().verify(payload.username, payload.code)
+    if result == two_factor.INVALID:
+        raise Http404("No TwoFactorAuth matches the given query.")
+
+    if result == two_factor.VALID:
+        user = get_object_or_404(User, username=payload.username)
         refresh = RefreshToken.for_user(user)
         return {
             "refresh": str(refresh),
@@ -143,10 +125,10 @@ def verify_2fa(request, payload: VerifySchema):
 # ----------------------------
 # Requests
 # ----------------------------
-@router.get("/stats/", response=StatsOut)
-def get_stats(request):
+@router.get("/stats/", response=StatsOut, auth=AsyncCachedJWTAuth())
+async def get_stats(request):
     """Returns statistics about user requests."""
-    stats = UserRequest.objects.filter(active=True).aggregate(
+    stats = await UserRequest.objects.filter(active=True).aaggregate(
         pending=Count("id", filter=Q(status="Pendiente")),
         completed=Count("id", filter=Q(status="Completado")),
         rejected=Count("id", filter=Q(status="Rechazado")),
@@ -155,41 +137,61 @@ def get_stats(request):
     return stats
 
 
-import requests
-import json
-from django.utils.dateparse import parse_datetime
+@router.get("/events/", response={400: MessageOut}, auth=[AsyncCachedJWTAuth(), AsyncQueryJWTAuth()])
+async def stream_events(request):
+    """
+    Server-sent events with the changes to requests and stats (see
+    requests_app/events.py). EventSource can't send headers, so the token
+    may also come as ?token=.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI each open stream would hold a worker thread
+        return 400, {"message": "Los eventos solo están disponibles con el servidor ASGI."}
+    return StreamingHttpResponse(
+        event_stream(),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-@router.get("/", response=List[UserRequestListSchema])
-def list_requests(
-    request,
-    status: Optional[str] = None,
-    company_name: Optional[str] = None,
-    email: Optional[str] = None,
-    customer_role: Optional[str] = None,
-):
+
+async def sync_wp_requests():
     """
-    Sincroniza solicitudes desde el endpoint de WordPress
-    y devuelve las solicitudes locales filtradas.
+    Imports the WP form records that are not in the local DB yet, together
+    with their authorized persons. Existing requests are never modified.
     """
-    # 1. Fetch data from external WP endpoint
-    try:
-        response = requests.get("https://www.tcmariel.cu/wp-json/user-record/v1/records", timeout=15)
-        response.raise_for_status()
-        external_data = response.json()
-    except Exception as e:
-        print(f"[WARN] No se pudo sincronizar con WP: {e}")
-        external_data = []
-
-    # 2. Sync data with local DB
+    with timed(WP_SYNC_SECONDS, "wp"):
+        await _sync_wp_requests()
+
+
+async def _sync_wp_requests():
+    external_data = await wordpress.fetch_records()
+    if not external_data:
+        return
+    WP_SYNC_RECORDS.labels("fetched").inc(len(external_data))
+
+    # Una sola consulta para saber cuáles ya existen
+    record_ids = [int(record["id"]) for record in external_data]
+    existing_ids = {
+        pk async for pk in UserRequest.objects.filter(id__in=record_ids).values_list("id", flat=True)
+    }
+    # Las archivadas tampoco se vuelven a importar
+    existing_ids |= {
+        pk async for pk in ArchivedRequest.objects.filter(id__in=record_ids).values_list("id", flat=True)
+    }
+
+    imported_ids = []
     for record in external_data:
+        if int(record["id"]) in existing_ids:
+            continue
+
         # Parse uploaded_files (viene como string tipo JSON)
         try:
             uploaded_files = json.loads(record.get("uploaded_files", "[]"))
         except Exception:
             uploaded_files = []
 
-        # Intenta obtener la solicitud. Si no existe, la crea. No la actualiza.
-        obj, created = UserRequest.objects.get_or_create(
+        # get_or_create por si otro worker la importó entre la consulta y ahora
+        obj, created = await UserRequest.objects.aget_or_create(
             id=int(record["id"]),
             defaults={
                 "company_name": record.get("company_name", ""),
@@ -212,19 +214,10 @@ def list_requests(
         )
 
         # Si la solicitud se acaba de crear, también se crean las personas autorizadas.
-        # Si la solicitud ya existía, no se modifica nada.
         if created:
-            # Consumir el endpoint de WP para confirmar el procesamiento
-            try:
-                wp_url = f"https://www.tcmariel.cu/wp-json/user-record/v1/records/{record['id']}"
-                wp_response = requests.get(wp_url, timeout=10)
-                wp_response.raise_for_status()
-                print(f"Consumido endpoint de WP para solicitud importada {record['id']}. Estado: {wp_response.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"Fallo al consumir endpoint de WP para solicitud importada {record['id']}: {e}")
-            # 3. Sync authorized persons
-            for person in record.get("authorized_persons", []):
-                AuthorizedPerson.objects.create(
+            imported_ids.append(record["id"])
+            await AuthorizedPerson.objects.abulk_create([
+                AuthorizedPerson(
                     user_request=obj,
                     name=person.get("name", ""),
                     position=person.get("position", ""),
@@ -234,8 +227,44 @@ def list_requests(
                     operational=bool(person.get("operational", 0)),
                     associated_with=person.get("associated_with", ""),
                 )
+                for person in record.get("authorized_persons", [])
+            ])
+
+    WP_SYNC_RECORDS.labels("imported").inc(len(imported_ids))
+    await sync_to_async(flag_duplicates)([int(record_id) for record_id in imported_ids])
+    await sync_to_async(schedule_mirror)([int(record_id) for record_id in imported_ids])
+    if imported_ids:
+        await sync_to_async(publish)(
+            event("request.imported", ids=[int(record_id) for record_id in imported_ids], count=len(imported_ids)),
+            event("stats.delta", total=len(imported_ids), pending=len(imported_ids)),
+        )
+    # Consumir el endpoint de WP para confirmar el procesamiento
+    await wordpress.confirm_records(imported_ids)
+
+
+@router.get("/", response={200: List[UserRequestListSchema], 400: MessageOut}, auth=AsyncCachedJWTAuth())
+async def list_requests(
+    request,
+    status: Optional[str] = None,
+    company_name: Optional[str] = None,
+    email: Optional[str] = None,
+    customer_role: Optional[str] = None,
+    duplicates: Optional[bool] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Sincroniza solicitudes desde el endpoint de WordPress
+    y devuelve las solicitudes locales filtradas. fields= (separados por
+    comas) limita los campos de cada solicitud; id siempre se incluye.
+    """
+    try:
+        names = parse_fields(fields)
+    except ValueError as e:
+        return 400, {"message": f"Campos desconocidos: {e}"}
+
+    await sync_wp_requests()
 
-    # 4. Query local DB con filtros
+    # Query local DB con filtros
     qs = UserRequest.objects.filter(active=True)
 
     if status:
@@ -248,22 +277,23 @@ def list_requests(
         # Para buscar en un JSONField que contiene una lista de strings
         # customer_role aquí es el valor del filtro, que debería ser un solo rol
         qs = qs.filter(customer_role__contains=[customer_role])
+    if duplicates is not None:
+        # Solo las marcadas como posible duplicado (o solo las no marcadas)
+        qs = qs.filter(duplicate_score__isnull=not duplicates)
 
-    # Asegurarse de que customer_role sea una lista para cada objeto antes de devolverlo
-    # Convertir el queryset a una lista para poder modificar los objetos
-    result_list = list(qs.order_by("-created_at"))
-    for req in result_list:
-        if req.customer_role is None:
-            req.customer_role = []
-    return result_list
-
+    # Las filas ya tienen la forma de UserRequestListSchema (see listing.py)
+    return Response(await list_rows(qs.order_by("-created_at"), names))
 
 
-@router.get("/{request_id}", response=UserRequestSchema)
-def get_request(request, request_id: int):
-    """Retrieves a single user request by its ID."""
-    user_request = get_object_or_404(
-        UserRequest.objects.prefetch_related("authorized_persons", "history"),
+async def aget_request_detail(request_id):
+    """
+    Loads a request with everything UserRequestSchema reads, so the response
+    can be serialized inside an async view without lazy queries.
+    """
+    user_request = await aget_object_or_404(
+        UserRequest.objects.select_related("created_by").prefetch_related(
+            "authorized_persons", "history__changed_by", "attachments"
+        ),
         id=request_id,
     )
     # Asegurarse de que customer_role sea una lista, incluso si es None en la DB
@@ -272,6 +302,95 @@ def get_request(request, request_id: int):
     return user_request
 
 
+@router.get("/archived/{request_id}", response=ArchivedRequestSchema, auth=AsyncCachedJWTAuth())
+async def get_archived_request(request, request_id: int):
+    """Retrieves an archived request, with its history, by its original ID."""
+    return await aget_object_or_404(
+        ArchivedRequest.objects.prefetch_related("history__changed_by"), id=request_id
+    )
+
+
+@router.get("/{request_id}", response=UserRequestSchema, auth=AsyncCachedJWTAuth())
+async def get_request(request, request_id: int):
+    """Retrieves a single user request by its ID."""
+    return await aget_request_detail(request_id)
+
+
+@router.get("/{request_id}/attachments/{attachment_id}", auth=AsyncCachedJWTAuth(), url_name="download_attachment")
+async def download_attachment(request, request_id: int, attachment_id: int):
+    """
+    Serves a mirrored attachment of the request: through the front proxy
+    when ATTACHMENT_SENDFILE_HEADER is set, streamed with Range support otherwise.
+    """
+    attachment = await aget_object_or_404(Attachment, id=attachment_id, user_request_id=request_id)
+    return attachment_response(request, attachment)
+
+
+@router.get("/{request_id}/attachments/{attachment_id}/{variant}", auth=AsyncCachedJWTAuth(), url_name="attachment_preview")
+async def download_attachment_preview(request, request_id: int, attachment_id: int, variant: Literal["thumbnail", "preview"]):
+    """Serves the JPEG thumbnail or first-page preview of an image or PDF attachment."""
+    attachment = await aget_object_or_404(Attachment, id=attachment_id, user_request_id=request_id)
+    return attachment_response(request, attachment, variant)
+
+
+@router.post("/{request_id}/uploads", response={200: AttachmentUploadSchema, 400: MessageOut})
+def start_attachment_upload(request, request_id: int, payload: AttachmentUploadCreateSchema):
+    """
+    Starts a chunked upload. The file is then sent with PUT .../uploads/{id}?offset=N
+    in pieces of at most chunk_size bytes and closed with POST .../finalize.
+    """
+    user_request = get_object_or_404(UserRequest, id=request_id)
+    try:
+        return start_upload(
+            user_request,
+            payload.filename,
+            payload.size,
+            payload.sha256,
+            content_type=payload.content_type,
+            user=request.user if request.user.is_authenticated else None,
+        )
+    except UploadError as e:
+        return 400, {"message": str(e)}
+
+
+@router.get("/{request_id}/uploads/{upload_id}", response=AttachmentUploadSchema)
+def get_attachment_upload(request, request_id: int, upload_id: UUID):
+    """Returns the bytes received so far, to resume an interrupted upload."""
+    return get_object_or_404(AttachmentUpload, id=upload_id, user_request_id=request_id)
+
+
+@router.put("/{request_id}/uploads/{upload_id}", response={200: AttachmentUploadSchema, 400: MessageOut, 409: AttachmentUploadSchema})
+def upload_attachment_chunk(request, request_id: int, upload_id: UUID, offset: int):
+    """
+    Appends the raw request body at offset. A 409 carries the offset the
+    server expects, e.g. after a chunk was lost in a disconnect.
+    """
+    get_object_or_404(AttachmentUpload.objects.only("id"), id=upload_id, user_request_id=request_id)
+    if not request.META.get("CONTENT_LENGTH"):
+        return 400, {"message": "Se requiere la cabecera Content-Length."}
+    try:
+        return append_chunk(upload_id, offset, request, int(request.META["CONTENT_LENGTH"]))
+    except OffsetMismatch as e:
+        return 409, e.upload
+    except UploadError as e:
+        return 400, {"message": str(e)}
+
+
+@router.post("/{request_id}/uploads/{upload_id}/finalize", response={200: AttachmentSchema, 400: MessageOut, 409: AttachmentUploadSchema})
+def finalize_attachment_upload(request, request_id: int, upload_id: UUID):
+    """Verifies the checksum of the uploaded file and attaches it to the request."""
+    get_object_or_404(AttachmentUpload.objects.only("id"), id=upload_id, user_request_id=request_id)
+    try:
+        attachment = finalize_upload(upload_id)
+    except OffsetMismatch as e:
+        return 409, e.upload
+    if attachment is None:
+        return 400, {"message": "El SHA-256 no coincide; la subida debe repetirse desde el principio."}
+    if not attachment.preview:
+        schedule_previews([attachment])
+    return attachment
+
+
 @router.post("/", response={200: UserRequestSchema, 400: MessageOut})
 def create_request(request, payload: UserRequestCreateSchema):
     """Creates a new user request with authorized persons and uploaded files."""
@@ -292,172 +411,143 @@ def create_request(request, payload: UserRequestCreateSchema):
         AuthorizedPerson.objects.create(user_request=user_request, **person.dict())
 
     # Log creation
-    RequestHistory.objects.create(
-        user_request=user_request,
+    record_history(
+        user_request,
+        "created",
         changed_by=request.user if request.user.is_authenticated else None,
         changed_from_ip=get_client_ip(request),
-        action="Solicitud creada.",
+    )
+    if flag_duplicates([user_request.id]):
+        user_request.refresh_from_db(fields=["duplicate_score", "duplicate_candidates"])
+    if user_request.uploaded_files:
+        schedule_mirror([user_request.id])
+    publish(
+        event(
+            "request.created",
+            id=user_request.id,
+            company_name=user_request.company_name,
+            status=user_request.status,
+            created_at=user_request.created_at,
+        ),
+        stats_delta(new_status=user_request.status, total=1) if user_request.active else None,
     )
 
     return user_request
 
 
-@router.put("/{request_id}", response={200: UserRequestSchema, 400: MessageOut})
-def update_request(request, request_id: int, payload: UserRequestUpdateSchema):
+def save_request_update(user_request, changes, new_persons, outbox_messages, changed_by, changed_from_ip):
+    """
+    Persists an update in one transaction: the request, its authorized
+    persons, the history entry and the emails it triggers. Emails and live
+    events are only sent once this commits. Each email's message_key gets
+    the id of the history entry, so a retried save doesn't send twice but
+    the same transition made again later does send.
+    """
+    with transaction.atomic():
+        if new_persons is not None:
+            user_request.authorized_persons.all().delete()
+            AuthorizedPerson.objects.bulk_create(new_persons)
+        history_entry = None
+        if changes:
+            user_request.save()
+            history_entry = record_history(
+                user_request,
+                action_type_for(changes),
+                changes,
+                changed_by=changed_by,
+                changed_from_ip=changed_from_ip,
+            )
+        for message in outbox_messages:
+            if history_entry is not None:
+                message = {**message, "message_key": f"{message['message_key']}:{history_entry.id}"}
+            enqueue_email(**message)
+        if changes:
+            publish(*request_changes_events(user_request, changes))
+
+
+@router.put("/{request_id}", response={200: UserRequestSchema, 400: MessageOut}, auth=AsyncCachedJWTAuth())
+async def update_request(request, request_id: int, payload: UserRequestUpdateSchema):
     """Updates an existing user request and its authorized persons."""
-    user_request = get_object_or_404(UserRequest, id=request_id)
+    user_request = await aget_object_or_404(UserRequest, id=request_id)
     
     if user_request.status == "Completado":
         return 400, {"message": "Cannot update a completed request."}
         
-    changes = []
-
-    # Update simple fields
-    for field, value in payload.dict(exclude_unset=True, exclude={"authorized_persons"}).items():
-        old_value = getattr(user_request, field)
-        if old_value != value:
-            setattr(user_request, field, value)
-            changes.append(f"{field} cambiado de '{old_value}' a '{value}'.")
+    payload_fields = payload.dict(exclude_unset=True)
+    updates = {field: value for field, value in payload_fields.items() if field != "authorized_persons"}
+    if "customer_role" in updates and updates["customer_role"] is None:
+        updates["customer_role"] = []
+    # A non-empty customer_code completes the request
+    if updates.get("customer_code") and updates.get("status", user_request.status) != "Completado":
+        updates["status"] = "Completado"
+    # customer_code is unique across the live and the archived requests
+    if updates.get("customer_code") and await ArchivedRequest.objects.filter(customer_code=updates["customer_code"]).aexists():
+        return 400, {"message": "Ya existe una solicitud con este código de cliente."}
+    changes = apply_changes(user_request, updates)
 
-    # Check if status is being updated to "Rechazado" and send email
-    if "status" in payload.dict(exclude_unset=True) and payload.status == "Rechazado":
+    # Email the rejection when the request moves to "Rechazado"
+    outbox_messages = []
+    if any(change["field"] == "status" and change["new"] == "Rechazado" for change in changes):
         rejection_reason = payload.notes if payload.notes else "No se ha especificado un motivo."
-        send_rejection_email_task.delay(
-            company_name=user_request.company_name,
-            rejection_reason=rejection_reason,
-            recipient_email=user_request.contact_email
-        )
+        outbox_messages.append({
+            "message_key": f"reject_email:{user_request.id}",
+            "template": "reject_email",
+            "subject": f"Solicitud Rechazada: {user_request.company_name}",
+            "recipients": [user_request.contact_email],
+            "context": {
+                "company_name": user_request.company_name,
+                "rejection_reason": rejection_reason,
+            },
+        })
 
     # Handle authorized persons (replace all if provided)
+    new_persons = None
     if payload.authorized_persons is not None:
-        user_request.authorized_persons.all().delete()
-        for person in payload.authorized_persons:
-            AuthorizedPerson.objects.create(user_request=user_request, **person.dict())
-        changes.append("Personas autorizadas actualizadas.")
-
-    # Check if customer_code is being updated to a non-empty value
-    if "customer_code" in payload.dict(exclude_unset=True) and payload.customer_code:
-        if user_request.status != "Completado":
-            user_request.status = "Completado"
-            changes.append(f"Estado cambiado a '{user_request.status}'.")
-
-    # Handle customer_role explicitly
-    if "customer_role" in payload.dict(exclude_unset=True):
-        new_customer_role = payload.customer_role if payload.customer_role is not None else []
-        if user_request.customer_role != new_customer_role:
-            user_request.customer_role = new_customer_role
-            changes.append(f"customer_role cambiado de '{user_request.customer_role}' a '{new_customer_role}'.")
-
-    if "status" in payload.dict(exclude_unset=True) and payload.status == "Completado":
-        connection = None
-        cursor = None
-        try:
-            oracle_user = settings.ORACLE_DB_USER
-            oracle_password = settings.ORACLE_DB_PASSWORD
-            oracle_host = settings.ORACLE_DB_HOST
-            oracle_port = settings.ORACLE_DB_PORT
-            oracle_service_name = settings.ORACLE_DB_SERVICE_NAME
-
-            dsn = f"{oracle_host}:{oracle_port}/{oracle_service_name}"
-            oracledb.init_oracle_client()
-            connection = oracledb.connect(user=oracle_user, password=oracle_password, dsn=dsn)
-            cursor = connection.cursor()
-            
-            # Insert each authorized person into Oracle DB
-            if user_request.customer_code: # Only proceed if customer_code is available
-                created_users = []
-                insert_sql = """
-                INSERT INTO CM_WEB.WEB_USER (
-                    USER_COD, USER_NAM, COMPANY_COD, TELEPHONE, USER_PWD, EMAIL, ADDRESS, REPEAT_COUNT, REC_TIM, REC_NAM
-                ) VALUES (
-                    :user_cod, :user_nam, :company_cod, :telephone, :user_pwd, :email, :address, :repeat_count, :rec_tim, :rec_nam
-                )
-                """
-                for person in user_request.authorized_persons.all():
-                    generated_user_cod = generate_user_cod(person.name, cursor)
-                    password = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
-                    password_hash = hashlib.md5(password.encode()).hexdigest()
-                    try:
-                        cursor.execute(insert_sql, {
-                            'user_cod': generated_user_cod,
-                            'user_nam': person.name,
-                            'company_cod': user_request.customer_code,
-                            'telephone': person.phone,
-                            'user_pwd': password_hash,
-                            'email': person.email,
-                            'address': user_request.address,
-                            'rec_tim': user_request.created_at,
-                            'repeat_count': 10,
-                            'rec_nam': 'SYSTEM WEB'
-                        })
-                        print(f"Successfully inserted authorized person {person.name} for request {user_request.id} into Oracle DB.")
-
-                        # Add user to list for email
-                        created_users.append({'user': generated_user_cod, 'pass_user': password})
-
-                        # Insert into RE_USER_ROLE for each customer_role
-                        if user_request.customer_role:
-                            insert_role_sql = """
-                            INSERT INTO CM_WEB.RE_USER_ROLE (ID, USER_COD, ROLE_COD) VALUES (:id, :user_cod, :role_cod)
-                            """
-                            for role in user_request.customer_role:
-                                try:
-                                    cursor.execute(insert_role_sql, {
-                                        'id': uuid.uuid4().hex,
-                                        'user_cod': generated_user_cod,
-                                        'role_cod': role
-                                    })
-                                    print(f"Successfully inserted role {role} for user {generated_user_cod} into RE_USER_ROLE.")
-                                except oracledb.Error as e:
-                                    error_obj, = e.args
-                                    print(f"Error inserting role {role} for user {generated_user_cod} into RE_USER_ROLE: {error_obj.message}")
-                        else:
-                            print(f"No customer roles found for request {user_request.id}, skipping RE_USER_ROLE insertion for user {generated_user_cod}.")
-                    except oracledb.Error as e:
-                        error_obj, = e.args
-                        print(f"Error inserting authorized person {person.name} into Oracle DB: {error_obj.message}")
-                connection.commit()
-                print(f"All authorized persons for request {user_request.id} processed for Oracle DB.")
-
-                # Send welcome email
-                if created_users:
-                    send_welcome_email_task.delay(
-                        company_name=user_request.company_name,
-                        user_code=user_request.customer_code,
-                        users=created_users,
-                        recipient_email=user_request.contact_email
-                    )
-                    print(f"Welcome email task queued for request {user_request.id}.")
-            else:
-                print("customer_code is empty, skipping Oracle insertion for authorized persons.")
-
-        except oracledb.Error as e:
-            error_obj, = e.args
-            print(f"Error inserting into Oracle DB: {error_obj.message}")
-            # Optionally, you might want to revert the Django save or log this error more formally
-            # For now, we'll just print and continue, but in a real app, this needs careful handling.
-        except Exception as e:
-            print(f"An unexpected error occurred during Oracle insertion: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-
-    if changes:
+        new_persons = [
+            AuthorizedPerson(user_request=user_request, **person.dict())
+            for person in payload.authorized_persons
+        ]
+        changes.append({"field": PERSONS_FIELD, "old": None, "new": len(new_persons)})
+
+    if payload_fields.get("status") == "Completado":
+        if new_persons is not None:
+            persons = new_persons
+        else:
+            persons = [person async for person in user_request.authorized_persons.all()]
+        # El driver de Oracle es bloqueante (modo thick): se ejecuta en un hilo
+        # aparte para no detener el event loop mientras Oracle responde.
+        created_users = await sync_to_async(provision_oracle_users, thread_sensitive=False)(
+            user_request, persons
+        )
+
+        # Send welcome email
+        if created_users:
+            outbox_messages.append({
+                "message_key": f"welcome_email:{user_request.id}:{user_request.customer_code}",
+                "template": "welcome_email",
+                "subject": f"Alta de cliente: {user_request.company_name}",
+                "recipients": [user_request.contact_email],
+                "context": {
+                    "company_name": user_request.company_name,
+                    "user_code": user_request.customer_code,
+                    "users_section": format_users_section(created_users),
+                },
+            })
+
+    if changes or outbox_messages:
         try:
-            user_request.save()
+            await sync_to_async(save_request_update)(
+                user_request,
+                changes,
+                new_persons,
+                outbox_messages,
+                changed_by=request.user if request.user.is_authenticated else None,
+                changed_from_ip=get_client_ip(request),
+            )
         except IntegrityError:
             return 400, {"message": "Ya existe una solicitud con este código de cliente."}
-        action_log = " ".join(changes)
-        RequestHistory.objects.create(
-            user_request=user_request,
-            changed_by=request.user if request.user.is_authenticated else None,
-            changed_from_ip=get_client_ip(request),
-            action=action_log,
-        )
 
-    return user_request
+    return await aget_request_detail(request_id)
 
 
 # @router.delete("/{request_id}", response={204: None, 400: MessageOut})
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class RequestsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'requests_app'
+
+    def ready(self):
+        # Registers the signal handlers that invalidate cached JWT users
+        from . import authentication  # noqa: F401
+        # Registers the DB, Celery and in-process metrics collectors
+        from . import metrics  # noqa: F401
+        # pg_trgm must exist before the trigram index on company names is created
+        from .duplicates import create_trigram_extension
+        pre_migrate.connect(create_trigram_extension, sender=self)
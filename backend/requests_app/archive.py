@@ -0,0 +1,120 @@
+"""
+Archival of requests nobody works on anymore.
+
+Completed and rejected requests without activity for ARCHIVE_AFTER_DAYS,
+and soft-deleted ones, are moved with their authorized persons, history
+and attachment records to ArchivedRequest/ArchivedRequestHistory. Each
+batch is one transaction: rows are copied and deleted together, so a
+request is always in exactly one place. The files on disk are not
+touched; they are content-addressed and may be shared with live requests.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from .models import ArchivedRequest, ArchivedRequestHistory, RequestHistory, UserRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+ARCHIVABLE_STATUSES = ("Completado", "Rechazado")
+
+
+def archivable_requests(older_than_days=None):
+    """Requests due for archival: closed and idle, or soft-deleted."""
+    if older_than_days is None:
+        older_than_days = settings.ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    # EXISTS rather than Max(history): FOR UPDATE can't be used with GROUP BY
+    recent_change = RequestHistory.objects.filter(user_request=OuterRef("pk"), changed_at__gte=cutoff)
+    return (
+        UserRequest.objects.filter(
+            Q(active=False)
+            | Q(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff) & ~Exists(recent_change)
+        )
+        .order_by("id")
+    )
+
+
+def _row(obj):
+    """The concrete field values of a model instance, ready for a JSONField."""
+    row = {}
+    for field in obj._meta.concrete_fields:
+        value = getattr(obj, field.attname)
+        row[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return row
+
+
+def _archive_batch(request_ids, older_than_days=None):
+    with transaction.atomic():
+        # Re-checked under the lock: a request reopened or edited since it was
+        # picked stays where it is
+        requests = list(
+            archivable_requests(older_than_days).filter(id__in=request_ids)
+            .select_for_update()
+            .prefetch_related("authorized_persons", "history", "attachments")
+        )
+        archived = []
+        history = []
+        for user_request in requests:
+            data = _row(user_request)
+            data["authorized_persons"] = [_row(person) for person in user_request.authorized_persons.all()]
+            data["attachments"] = [_row(attachment) for attachment in user_request.attachments.all()]
+            archived.append(ArchivedRequest(
+                id=user_request.id,
+                company_name=user_request.company_name,
+                email=user_request.email,
+                tax_id=user_request.tax_id,
+                customer_code=user_request.customer_code,
+                status=user_request.status,
+                active=user_request.active,
+                created_at=user_request.created_at,
+                data=data,
+            ))
+            history.extend(
+                ArchivedRequestHistory(
+                    id=entry.id,
+                    user_request_id=user_request.id,
+                    changed_by_id=entry.changed_by_id,
+                    changed_at=entry.changed_at,
+                    changed_from_ip=entry.changed_from_ip,
+                    action_type=entry.action_type,
+                    changes=entry.changes,
+                    action=entry.action,
+                )
+                for entry in user_request.history.all()
+            )
+        ArchivedRequest.objects.bulk_create(archived)
+        ArchivedRequestHistory.objects.bulk_create(history)
+        UserRequest.objects.filter(id__in=[user_request.id for user_request in requests]).delete()
+    return len(archived), len(history)
+
+
+def archive_requests(older_than_days=None, batch_size=None, limit=None):
+    """
+    Archives the requests returned by archivable_requests() in batches of
+    batch_size, at most limit in total. Returns a summary dict.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    candidates = archivable_requests(older_than_days)
+    summary = {"requests": 0, "history": 0, "batches": 0}
+    last_id = 0
+    while limit is None or summary["requests"] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - summary["requests"])
+        request_ids = list(candidates.filter(id__gt=last_id).values_list("id", flat=True)[:size])
+        if not request_ids:
+            break
+        last_id = request_ids[-1]
+        requests, history = _archive_batch(request_ids, older_than_days)
+        summary["requests"] += requests
+        summary["history"] += history
+        summary["batches"] += 1
+    if summary["requests"]:
+        logger.info("Requests archived", extra=summary)
+    return summary
@@ -0,0 +1,205 @@
+"""
+Local mirror of the documents attached to requests.
+
+UserRequest.uploaded_files holds the URLs of the files on tcmariel.cu.
+sync_attachments() creates an Attachment per URL and mirror_pending()
+streams each file into MEDIA_ROOT, hashing it on the way. The finished file
+is moved to its content address, so a document sent with several requests
+is stored once, and reviews keep working while WP is down.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from celery import current_app
+from django.conf import settings
+from django.utils import timezone
+
+from . import wordpress
+from .models import Attachment, UserRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+ATTACHMENTS_DIR = "attachments"
+GENERIC_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream"}
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+def content_path(sha256):
+    """Storage name of the file with the given SHA-256, relative to MEDIA_ROOT."""
+    return f"{ATTACHMENTS_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def _filename(url):
+    return unquote(os.path.basename(urlparse(url).path))[:255] or None
+
+
+def guess_content_type(header, filename):
+    """The declared content type, or the one of the file extension when it is generic."""
+    content_type = (header or "").split(";")[0].strip().lower()
+    if content_type in GENERIC_CONTENT_TYPES and filename:
+        content_type = mimetypes.guess_type(filename)[0] or content_type
+    return content_type or "application/octet-stream"
+
+
+def _untrusted_error(url):
+    return f"{url} no pertenece a {wordpress.WP_HOST}; no se descarga."
+
+
+def sync_attachments(user_request):
+    """
+    Creates the missing Attachment rows for the URLs in uploaded_files.
+    URLs outside the WP site are recorded as failed and never fetched: they
+    come from the public form, and the worker must not be pointed at
+    internal hosts.
+    """
+    urls = [
+        url for url in user_request.uploaded_files or []
+        if isinstance(url, str) and url.startswith(("http://", "https://"))
+    ]
+    attachments = []
+    for url in urls:
+        attachment = Attachment(user_request=user_request, source_url=url, original_filename=_filename(url))
+        if not wordpress.is_wp_file_url(url):
+            attachment.status = "Fallido"
+            attachment.last_error = _untrusted_error(url)
+        attachments.append(attachment)
+    Attachment.objects.bulk_create(attachments, ignore_conflicts=True)
+
+
+def _download(url, filename):
+    """
+    Streams url into a temporary file under MEDIA_ROOT in chunks of
+    ATTACHMENT_CHUNK_SIZE. Returns (path, sha256, size, content_type).
+    """
+    tmp_dir = Path(settings.MEDIA_ROOT) / ATTACHMENTS_DIR / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out, wordpress.open_file(url, timeout=settings.ATTACHMENT_DOWNLOAD_TIMEOUT) as response:
+            content_type = guess_content_type(response.headers.get("content-type"), filename)
+            for chunk in response.iter_bytes(settings.ATTACHMENT_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge(f"{url} supera {settings.ATTACHMENT_MAX_BYTES} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size, content_type
+
+
+def store_file(tmp_path, sha256):
+    """
+    Moves a finished file to its content address and returns the storage
+    name. If that content is already stored the new copy is discarded.
+    """
+    name = content_path(sha256)
+    target = Path(settings.MEDIA_ROOT) / name
+    if target.exists():
+        os.unlink(tmp_path)
+        return name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, target)
+    return name
+
+
+def _already_mirrored(attachment):
+    """Another request's copy of the same URL, if it is on disk."""
+    other = (
+        Attachment.objects.filter(source_url=attachment.source_url, status="Descargado")
+        .exclude(pk=attachment.pk)
+        .first()
+    )
+    if other and (Path(settings.MEDIA_ROOT) / other.file.name).exists():
+        return other
+    return None
+
+
+def mirror_attachment(attachment):
+    """
+    Downloads one attachment. Returns 'downloaded', 'deduplicated', 'retry'
+    or 'failed'; failures are retried until ATTACHMENT_MAX_ATTEMPTS.
+    """
+    if not wordpress.is_wp_file_url(attachment.source_url):
+        attachment.status = "Fallido"
+        attachment.last_error = _untrusted_error(attachment.source_url)
+        attachment.save(update_fields=["status", "last_error"])
+        logger.warning("Adjunto %s con URL externa ignorado: %s", attachment.pk, attachment.source_url)
+        return "failed"
+    try:
+        other = _already_mirrored(attachment)
+        if other:
+            attachment.file.name = other.file.name
+            attachment.sha256, attachment.size, attachment.content_type = other.sha256, other.size, other.content_type
+            outcome = "deduplicated"
+        else:
+            tmp_path, sha256, size, content_type = _download(attachment.source_url, attachment.original_filename)
+            attachment.file.name = store_file(tmp_path, sha256)
+            attachment.sha256, attachment.size, attachment.content_type = sha256, size, content_type
+            outcome = "downloaded"
+    except Exception as e:
+        attachment.attempts += 1
+        attachment.last_error = str(e)
+        permanent = isinstance(e, (AttachmentTooLarge, wordpress.UntrustedFileURL))
+        failed = permanent or attachment.attempts >= settings.ATTACHMENT_MAX_ATTEMPTS
+        attachment.status = "Fallido" if failed else "Pendiente"
+        attachment.save(update_fields=["attempts", "last_error", "status"])
+        logger.warning("No se pudo descargar el adjunto %s (%s): %s", attachment.pk, attachment.source_url, e)
+        return "failed" if failed else "retry"
+
+    attachment.status = "Descargado"
+    attachment.last_error = None
+    attachment.downloaded_at = timezone.now()
+    attachment.save(update_fields=[
+        "file", "sha256", "size", "content_type", "status", "last_error", "downloaded_at",
+    ])
+    return outcome
+
+
+def mirror_pending(request_ids=None, limit=None):
+    """
+    Creates the Attachment rows of the given requests (all active requests
+    when None) and downloads the pending ones. Returns a summary dict.
+    """
+    requests = UserRequest.objects.filter(active=True).only("id", "uploaded_files")
+    if request_ids is not None:
+        requests = requests.filter(id__in=request_ids)
+    for user_request in requests.iterator(chunk_size=500):
+        sync_attachments(user_request)
+
+    pending = Attachment.objects.filter(status="Pendiente", attempts__lt=settings.ATTACHMENT_MAX_ATTEMPTS)
+    if request_ids is not None:
+        pending = pending.filter(user_request_id__in=request_ids)
+    pending = pending.order_by("attempts", "id")
+    if limit:
+        pending = pending[:limit]
+
+    summary = {"downloaded": 0, "deduplicated": 0, "retry": 0, "failed": 0}
+    for attachment in pending:
+        summary[mirror_attachment(attachment)] += 1
+    return summary
+
+
+def schedule_mirror(request_ids):
+    """Publishes a mirror_attachments_task for the given requests."""
+    if not request_ids:
+        return
+    try:
+        current_app.send_task("mirror_attachments_task", args=(list(request_ids),))
+    except Exception as e:
+        # The files stay on WP until the next run or 'manage.py mirror_attachments'
+        logger.warning("No se pudo encolar la descarga de adjuntos de %s: %s", request_ids, e)
@@ -0,0 +1,170 @@
+"""
+JWT authentication with cached user resolution.
+
+ninja_jwt loads the full auth_user row on every request. Here only the
+minimal user state (id, username, is_active, is_staff) is looked up, first
+in a per-process dict with a few seconds of TTL, then in Redis, and only
+then in Postgres. Saving or deleting a User drops its Redis entry; the
+local entry expires on its own.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from ninja.security import APIKeyQuery
+from ninja_jwt.authentication import AsyncJWTAuth, JWTAuth
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.settings import api_settings
+
+from .metrics import cache_lookup
+
+
+logger = logging.getLogger(__name__)
+
+
+USER_STATE_FIELDS = ("id", "username", "is_active", "is_staff")
+
+_local_cache = {}
+_local_lock = threading.Lock()
+
+
+def _cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def _local_get(user_id):
+    entry = _local_cache.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def _local_set(user_id, state):
+    with _local_lock:
+        _local_cache[user_id] = (time.monotonic() + settings.AUTH_USER_LOCAL_CACHE_TTL, state)
+
+
+def _to_user(state):
+    """
+    Builds a User from the cached fields, as a query with .only() would: the
+    other fields are deferred and load on first access, and save() only
+    writes the loaded ones.
+    """
+    # from_db() takes the values in the model's field order
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in state]
+    return User.from_db("default", names, [state[name] for name in names])
+
+
+def resolve_user(user_id):
+    """Returns the (partial) User for a token's user id, or None if it does not exist."""
+    state = _local_get(user_id)
+    cache_lookup("auth_user_local", state is not None)
+    if state is None:
+        try:
+            state = cache.get(_cache_key(user_id))
+        except Exception:
+            state = None
+        cache_lookup("auth_user_redis", state is not None)
+        if state is None:
+            state = User.objects.filter(pk=user_id).values(*USER_STATE_FIELDS).first()
+            if state is None:
+                return None
+            try:
+                cache.set(_cache_key(user_id), state, settings.AUTH_USER_CACHE_TTL)
+            except Exception:
+                pass
+        _local_set(user_id, state)
+    return _to_user(state)
+
+
+async def aresolve_user(user_id):
+    """Async version of resolve_user; a local hit does not leave the event loop."""
+    state = _local_get(user_id)
+    cache_lookup("auth_user_local", state is not None)
+    if state is None:
+        try:
+            state = await cache.aget(_cache_key(user_id))
+        except Exception:
+            state = None
+        cache_lookup("auth_user_redis", state is not None)
+        if state is None:
+            state = await User.objects.filter(pk=user_id).values(*USER_STATE_FIELDS).afirst()
+            if state is None:
+                return None
+            try:
+                await cache.aset(_cache_key(user_id), state, settings.AUTH_USER_CACHE_TTL)
+            except Exception:
+                pass
+        _local_set(user_id, state)
+    return _to_user(state)
+
+
+def invalidate_user(user_id):
+    with _local_lock:
+        _local_cache.pop(user_id, None)
+    try:
+        cache.delete(_cache_key(user_id))
+    except Exception as e:
+        logger.warning("Could not invalidate cached user %s: %s", user_id, e)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def _user_id_from_token(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+
+def _check_user(user):
+    if user is None:
+        raise AuthenticationFailed(_("User not found"))
+    if not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"))
+    return user
+
+
+class CachedJWTAuth(JWTAuth):
+    def get_user(self, validated_token):
+        return _check_user(resolve_user(_user_id_from_token(validated_token)))
+
+
+class AsyncCachedJWTAuth(AsyncJWTAuth):
+    async def async_jwt_authenticate(self, request, token):
+        request.user = AnonymousUser()
+        # Token validation is pure CPU work, no need for a thread hop
+        validated_token = self.get_validated_token(token)
+        user = _check_user(await aresolve_user(_user_id_from_token(validated_token)))
+        request.user = user
+        return user
+
+
+class AsyncQueryJWTAuth(APIKeyQuery):
+    """
+    The access token in the ?token= query parameter, for clients that can't
+    set an Authorization header, like the browser's EventSource. Only for
+    long-lived GET streams: URLs end up in proxy logs.
+    """
+
+    param_name = "token"
+    is_async = True
+
+    def __init__(self):
+        super().__init__()
+        self.bearer = AsyncCachedJWTAuth()
+
+    async def authenticate(self, request, key):
+        if not key:
+            return None
+        return await self.bearer.async_jwt_authenticate(request, key)
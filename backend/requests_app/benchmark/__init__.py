@@ -0,0 +1,3 @@
+"""
+Load and benchmark suite for the API; run it with 'manage.py benchmark_api'.
+"""
@@ -0,0 +1,139 @@
+"""
+Synthetic data for the benchmark: operators, requests, authorized persons
+and history entries with roughly the proportions seen in production.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from ..duplicates import normalize_request
+from ..models import AuthorizedPerson, RequestHistory, UserRequest
+
+
+FIRST_NAMES = [
+    "Ana", "Carlos", "María", "José", "Lázaro", "Yanet", "Roberto", "Dayana",
+    "Alejandro", "Yudith", "Ernesto", "Lisandra", "Raúl", "Mayelin", "Osmany",
+]
+LAST_NAMES = [
+    "Pérez", "González", "Rodríguez", "Fernández", "López", "Martínez", "Díaz",
+    "Hernández", "Álvarez", "Suárez", "Castillo", "Ramos", "Cabrera", "Morales",
+]
+COMPANY_WORDS = [
+    "Naviera", "Logística", "Comercial", "Importadora", "Agencia", "Servicios",
+    "Caribe", "Mariel", "Atlántico", "Habana", "Global", "Trans", "Portuaria",
+]
+CITIES = ["La Habana", "Mariel", "Matanzas", "Santiago de Cuba", "Cienfuegos", "Holguín"]
+ROLES = ["AGENCIA", "IMPORTADOR", "EXPORTADOR", "TRANSPORTISTA"]
+
+# (status, weight); completed requests get a customer code and roles
+STATUS_WEIGHTS = [("Pendiente", 50), ("Completado", 35), ("Rechazado", 15)]
+PERSONS_PER_REQUEST = [(1, 30), (2, 35), (3, 20), (4, 10), (6, 5)]
+HISTORY_PER_REQUEST = [(0, 35), (1, 25), (2, 20), (4, 15), (8, 5)]
+
+OPERATOR_PASSWORD = "benchmark"
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def create_operators(count):
+    """Creates (or reuses) bench-operator-N users with a known password."""
+    operators = []
+    for i in range(count):
+        user, created = User.objects.get_or_create(
+            username=f"bench-operator-{i}",
+            defaults={"email": f"bench-operator-{i}@example.com", "is_staff": True},
+        )
+        if created:
+            user.set_password(OPERATOR_PASSWORD)
+            user.save(update_fields=["password"])
+        operators.append(user)
+    return operators
+
+
+def generate_requests(count, operators, seed=0, batch_size=1000):
+    """
+    Inserts count UserRequests with their AuthorizedPersons and RequestHistory
+    rows in batches. created_at/changed_at are spread over the last two years.
+    Returns a dict with the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    totals = {"requests": 0, "persons": 0, "history": 0}
+
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        requests = []
+        for i in range(start, start + size):
+            status = _weighted(rng, STATUS_WEIGHTS)
+            company = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)} {i}"
+            domain = f"empresa{i}.cu"
+            requests.append(UserRequest(
+                company_name=company,
+                address=f"Calle {rng.randint(1, 300)} No. {rng.randint(1, 999)}",
+                city=rng.choice(CITIES),
+                state=rng.choice(CITIES),
+                phone=f"+53 7{rng.randint(1000000, 9999999)}",
+                email=f"info@{domain}",
+                tax_id=f"{rng.randint(10000000000, 99999999999)}",
+                contact_name=_person_name(rng),
+                contact_position="Director",
+                contact_phone=f"+53 5{rng.randint(1000000, 9999999)}",
+                contact_email=f"contacto@{domain}",
+                status=status,
+                customer_code=f"B{i:07d}" if status == "Completado" else None,
+                customer_role=rng.sample(ROLES, rng.randint(1, 2)) if status == "Completado" else [],
+                created_by=rng.choice(operators) if rng.random() < 0.3 else None,
+                created_from_ip=f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                uploaded_files=[f"/uploads/{i}/doc{n}.pdf" for n in range(rng.randint(0, 3))],
+            ))
+        # bulk_create skips save(), which fills the normalized fields
+        for user_request in requests:
+            normalize_request(user_request)
+        UserRequest.objects.bulk_create(requests)
+
+        # created_at is auto_now_add, so backdate it with a second pass
+        for user_request in requests:
+            user_request.created_at = now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+        UserRequest.objects.bulk_update(requests, ["created_at"])
+
+        persons = []
+        history = []
+        for user_request in requests:
+            for n in range(_weighted(rng, PERSONS_PER_REQUEST)):
+                persons.append(AuthorizedPerson(
+                    user_request=user_request,
+                    name=_person_name(rng),
+                    position=rng.choice(["Gerente", "Especialista", "Técnico", "Director"]),
+                    phone=f"+53 5{rng.randint(1000000, 9999999)}",
+                    email=f"persona{n}.{user_request.id}@example.com" if rng.random() < 0.8 else None,
+                    informational=rng.random() < 0.7,
+                    operational=rng.random() < 0.5,
+                    associated_with=user_request.company_name[:100],
+                ))
+            for _ in range(_weighted(rng, HISTORY_PER_REQUEST)):
+                history.append(RequestHistory(
+                    user_request=user_request,
+                    changed_by=rng.choice(operators),
+                    changed_from_ip="10.0.0.1",
+                    action_type="updated",
+                    changes=[{"field": "notes", "old": None, "new": f"Revisión {rng.randint(1, 99)}"}],
+                ))
+        AuthorizedPerson.objects.bulk_create(persons, batch_size=batch_size)
+        RequestHistory.objects.bulk_create(history, batch_size=batch_size)
+        for entry in history:
+            entry.changed_at = entry.user_request.created_at + timedelta(hours=rng.randint(1, 720))
+        RequestHistory.objects.bulk_update(history, ["changed_at"], batch_size=batch_size)
+
+        totals["requests"] += len(requests)
+        totals["persons"] += len(persons)
+        totals["history"] += len(history)
+    return totals
@@ -0,0 +1,201 @@
+"""
+Scripted API scenarios run through Django's in-process ASGI client.
+
+Each scenario is a coroutine factory called once per iteration; a fixed
+number of workers pull iterations concurrently, as several operators using
+the panel at once would. Latency is measured per iteration and ORM query
+counts come from the per-request stats kept by MetricsMiddleware.
+"""
+import asyncio
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, field
+
+from django.core import mail
+from django.db import connection
+from django.test import AsyncClient
+from ninja_jwt.tokens import RefreshToken
+
+from ..models import UserRequest
+from .data import OPERATOR_PASSWORD, ROLES
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+    wall_seconds: float = 0.0
+
+    def summary(self):
+        count = len(self.latencies)
+        return {
+            "scenario": self.name,
+            "requests": count,
+            "errors": self.errors,
+            "throughput_rps": round(count / self.wall_seconds, 2) if self.wall_seconds else None,
+            "p50_ms": _ms(percentile(self.latencies, 50)),
+            "p95_ms": _ms(percentile(self.latencies, 95)),
+            "p99_ms": _ms(percentile(self.latencies, 99)),
+            "avg_queries": round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+            "max_queries": max(self.queries) if self.queries else None,
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _queries(response):
+    stats = getattr(response.asgi_request, "request_stats", None)
+    return stats["db_queries"] if stats else 0
+
+
+class BenchmarkContext:
+    """Clients, ids and counters shared by the scenarios of one run."""
+
+    def __init__(self, operators, seed=0):
+        self.rng = random.Random(seed)
+        self.operators = operators
+        # AsyncClient ignores client-level headers, so they go with every request
+        self.auth_headers = [
+            {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"} for user in operators
+        ]
+        self.http = AsyncClient()
+        self.request_ids = list(UserRequest.objects.values_list("id", flat=True))
+        self.pending_ids = list(
+            UserRequest.objects.filter(status="Pendiente").order_by("id").values_list("id", flat=True)
+        )
+        self.company_words = ["Naviera", "Caribe", "Mariel", "Global"]
+        # The customer_role filter uses a JSON containment lookup SQLite lacks
+        self.role_filter = connection.features.supports_json_field_contains
+        self.completed = 0
+
+    def operator(self):
+        """Headers of a random operator's session."""
+        return self.rng.choice(self.auth_headers)
+
+
+async def list_with_filters(ctx, i):
+    filters = [
+        {},
+        {"status": "Pendiente"},
+        {"status": "Completado", "customer_role": ctx.rng.choice(ROLES)} if ctx.role_filter else {"status": "Completado"},
+        {"company_name": ctx.rng.choice(ctx.company_words)},
+        {"email": "empresa1"},
+    ]
+    response = await ctx.http.get("/api/requests/", filters[i % len(filters)], headers=ctx.operator())
+    return response.status_code == 200, _queries(response)
+
+
+async def detail(ctx, i):
+    response = await ctx.http.get(f"/api/requests/{ctx.rng.choice(ctx.request_ids)}", headers=ctx.operator())
+    return response.status_code == 200, _queries(response)
+
+
+async def stats(ctx, i):
+    response = await ctx.http.get("/api/requests/stats/", headers=ctx.operator())
+    return response.status_code == 200, _queries(response)
+
+
+async def bulk_completion(ctx, i):
+    """Completes the next pending request, which provisions its persons in (fake) Oracle."""
+    if i >= len(ctx.pending_ids):
+        return False, 0
+    request_id = ctx.pending_ids[i]
+    response = await ctx.http.put(
+        f"/api/requests/{request_id}",
+        {"status": "Completado", "customer_code": f"BC{request_id}", "customer_role": [ctx.rng.choice(ROLES)]},
+        content_type="application/json",
+        headers=ctx.operator(),
+    )
+    ctx.completed += response.status_code == 200
+    return response.status_code == 200, _queries(response)
+
+
+async def login_2fa(ctx, i):
+    """Login followed by 2FA verification with the code taken from the sent email."""
+    user = ctx.operators[i % len(ctx.operators)]
+    login = await ctx.http.post(
+        "/api/auth/login/",
+        {"username": user.username, "password": OPERATOR_PASSWORD},
+        content_type="application/json",
+    )
+    code = _last_code_for(user.email)
+    if login.status_code != 200 or code is None:
+        return False, _queries(login)
+    verify = await ctx.http.post(
+        "/api/auth/verify-2fa/",
+        {"username": user.username, "code": code},
+        content_type="application/json",
+    )
+    return verify.status_code == 200 and "access" in verify.json(), _queries(login) + _queries(verify)
+
+
+def _last_code_for(email):
+    for message in reversed(mail.outbox):
+        if email in message.to:
+            match = re.search(r"(\d{4})", message.body)
+            return match.group(1) if match else None
+    return None
+
+
+SCENARIOS = {
+    "list": list_with_filters,
+    "detail": detail,
+    "stats": stats,
+    "bulk_completion": bulk_completion,
+    "login_2fa": login_2fa,
+}
+
+
+async def run_scenario(ctx, name, iterations, concurrency):
+    scenario = SCENARIOS[name]
+    result = ScenarioResult(name)
+    counter = iter(range(iterations))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                ok, queries = await scenario(ctx, i)
+            except Exception:
+                ok, queries = False, 0
+            result.latencies.append(time.perf_counter() - start)
+            result.queries.append(queries)
+            result.errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.wall_seconds = time.perf_counter() - start
+    return result
+
+
+def compare(results, baseline, max_regression):
+    """
+    Returns the regressions of results against a previous report: p95 latency
+    more than max_regression percent higher, or more queries per request.
+    """
+    previous = {row["scenario"]: row for row in baseline.get("scenarios", [])}
+    regressions = []
+    for row in results:
+        before = previous.get(row["scenario"])
+        if not before:
+            continue
+        if before["p95_ms"] and row["p95_ms"] > before["p95_ms"] * (1 + max_regression / 100):
+            regressions.append(f"{row['scenario']}: p95 {before['p95_ms']} ms -> {row['p95_ms']} ms")
+        if before["avg_queries"] is not None and row["avg_queries"] > before["avg_queries"] + 1:
+            regressions.append(f"{row['scenario']}: queries {before['avg_queries']} -> {row['avg_queries']}")
+    return regressions
@@ -0,0 +1,55 @@
+"""
+Serialization cost of the request list per 1000 rows.
+
+"models" is how list_requests used to build its response: full
+UserRequest instances (with created_by) validated one by one against
+UserRequestListSchema. "values" is the values_list() fast path of
+listing.py, and "values_sparse" the same with fields=id,company_name,status.
+Each includes the query and the JSON encoding; the best of the repetitions
+is kept, as the others only add noise from the machine.
+"""
+import json
+import time
+
+from asgiref.sync import async_to_sync
+from ninja.responses import NinjaJSONEncoder
+
+from ..listing import list_rows, parse_fields
+from ..models import UserRequest
+from ..schemas import UserRequestListSchema
+
+
+SPARSE_FIELDS = "id,company_name,status"
+
+
+def _models(queryset):
+    requests = list(queryset.select_related("created_by"))
+    return [UserRequestListSchema.from_orm(user_request).model_dump() for user_request in requests]
+
+
+def _values(fields=None):
+    names = parse_fields(fields)
+    return lambda queryset: async_to_sync(list_rows)(queryset, names)
+
+
+PATHS = {
+    "models": _models,
+    "values": _values(),
+    "values_sparse": _values(SPARSE_FIELDS),
+}
+
+
+def measure_serialization(rows=1000, repeat=5):
+    """Returns {"rows", "<path>_ms_per_1k"} for the first rows active requests."""
+    queryset = UserRequest.objects.filter(active=True).order_by("-created_at")[:rows]
+    count = queryset.count()
+    result = {"rows": count}
+    for name, build in PATHS.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            json.dumps(build(queryset), cls=NinjaJSONEncoder)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result[f"{name}_ms_per_1k"] = round(best * 1000 * 1000 / count, 2) if count else None
+    return result
@@ -0,0 +1,186 @@
+"""
+Local stand-ins for the external systems, so the benchmark measures this
+app and not tcmariel.cu or the Oracle server.
+
+WordPressStub is a real HTTP server, so the httpx client, timeouts and
+connection handling are exercised. FakeOracle implements the handful of
+statements provisioning and the USER_COD index issue, with an optional
+per-statement latency to emulate the network round trip.
+"""
+import json
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+from .. import provisioning, wordpress
+from ..oracle import get_driver
+
+
+class WordPressStub:
+    """
+    Serves GET /records with records_per_fetch new records per call and
+    GET /records/<id> as the import confirmation.
+    """
+
+    def __init__(self, records_per_fetch=0, latency=0.0, first_id=10_000_000):
+        self.records_per_fetch = records_per_fetch
+        self.latency = latency
+        self.next_id = first_id
+        self.fetches = 0
+        self.confirmations = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._patch = None
+
+    def _new_records(self):
+        with self._lock:
+            self.fetches += 1
+            first = self.next_id
+            self.next_id += self.records_per_fetch
+        return [
+            {
+                "id": str(record_id),
+                "company_name": f"WP Empresa {record_id}",
+                "address": "Calle 1",
+                "city": "Mariel",
+                "state": "Artemisa",
+                "phone": "+53 7000000",
+                "email": f"wp{record_id}@example.com",
+                "tax_id": str(record_id),
+                "contact_name": "Contacto WP",
+                "contact_position": "Director",
+                "contact_phone": "+53 5000000",
+                "contact_email": f"contacto{record_id}@example.com",
+                "ip_address": "10.1.1.1",
+                "uploaded_files": "[]",
+                "created_at": datetime.now().isoformat(),
+                "authorized_persons": [
+                    {"name": "Persona WP", "position": "Gerente", "phone": "1", "email": "p@example.com",
+                     "informational": 1, "operational": 0, "associated_with": "WP"},
+                ],
+            }
+            for record_id in range(first, first + self.records_per_fetch)
+        ]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if self.path.rstrip("/") == "/records":
+                    body = json.dumps(stub._new_records()).encode()
+                else:
+                    with stub._lock:
+                        stub.confirmations += 1
+                    body = b'{"ok": true}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self._server.server_port}/records"
+        self._patch = mock.patch.object(wordpress, "WP_RECORDS_URL", url)
+        self._patch.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._patch.stop()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeOracle:
+    """In-memory CM_WEB.WEB_USER / RE_USER_ROLE behind a DB-API-like connection."""
+
+    def __init__(self, existing_users=0, latency=0.0):
+        self.latency = latency
+        self.users = {f"BENCH{i}": datetime.now() for i in range(existing_users)}
+        self.roles = []
+        self.statements = 0
+        self._lock = threading.Lock()
+        self._patches = ExitStack()
+
+    def connect(self):
+        return _FakeConnection(self)
+
+    def __enter__(self):
+        self._patches.enter_context(mock.patch.object(provisioning, "get_connection", self.connect))
+        return self
+
+    def __exit__(self, *exc):
+        self._patches.close()
+
+
+class _FakeConnection:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def cursor(self):
+        return _FakeCursor(self.directory)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _FakeCursor:
+    def __init__(self, directory):
+        self.directory = directory
+        self.arraysize = 100
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        directory = self.directory
+        params = params or {}
+        if directory.latency:
+            time.sleep(directory.latency)
+        statement = " ".join(sql.split()).upper()
+        with directory._lock:
+            directory.statements += 1
+            if statement.startswith("SELECT 1 FROM CM_WEB.WEB_USER"):
+                self._rows = [(1,)] if params["user_cod"] in directory.users else []
+            elif statement.startswith("SELECT USER_COD"):
+                since = params.get("since")
+                self._rows = [
+                    (code, stamp) for code, stamp in directory.users.items() if since is None or stamp >= since
+                ]
+            elif statement.startswith("INSERT INTO CM_WEB.WEB_USER"):
+                if params["user_cod"] in directory.users:
+                    raise get_driver().IntegrityError(SimpleNamespace(message="ORA-00001: unique constraint violated"))
+                # REC_TIM: the bound value if the statement passes one, else SYSDATE
+                directory.users[params["user_cod"]] = params.get("rec_tim") or datetime.now()
+                self._rows = []
+            elif statement.startswith("INSERT INTO CM_WEB.RE_USER_ROLE"):
+                directory.roles.append((params["user_cod"], params["role_cod"]))
+                self._rows = []
+            else:
+                raise NotImplementedError(f"FakeOracle does not implement: {statement[:80]}")
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        batch, self._rows = self._rows[:size], self._rows[size:]
+        return batch
+
+    def close(self):
+        pass
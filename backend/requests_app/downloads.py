@@ -0,0 +1,142 @@
+"""
+Attachment downloads.
+
+After the permission check the bytes are normally handed to the front
+proxy: with ATTACHMENT_SENDFILE_HEADER = 'X-Accel-Redirect' nginx serves
+ATTACHMENT_ACCEL_PREFIX + the storage name from an internal location
+aliased to MEDIA_ROOT, with 'X-Sendfile' Apache/lighttpd serve the absolute
+path. Without a proxy the file is streamed in ATTACHMENT_CHUNK_SIZE blocks,
+with single byte-range requests and the content hash as ETag, so a large
+scan is never loaded into memory.
+"""
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Returns the inclusive (start, end) of a single 'bytes=' range, or None
+    when the header should be ignored and the whole file sent. Raises
+    ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None  # multiple ranges or malformed: full response, as RFC 9110 allows
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def _file_chunks(path, start, length, chunk_size):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def _afile_chunks(path, start, length, chunk_size):
+    # Django's ASGI handler would buffer a sync iterator whole, so read in a thread chunk by chunk
+    chunks = _file_chunks(path, start, length, chunk_size)
+    try:
+        while True:
+            chunk = await sync_to_async(next, thread_sensitive=False)(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def attachment_response(request, attachment, variant=None):
+    """
+    Returns the response serving a mirrored attachment, or its 'thumbnail'
+    or 'preview' when variant is given. Raises Http404 if it isn't on disk.
+    """
+    file = getattr(attachment, variant) if variant else attachment.file
+    if attachment.status != "Descargado" or not file:
+        raise Http404("El adjunto aún no está disponible.")
+    path = Path(settings.MEDIA_ROOT) / file.name
+    if not path.is_file():
+        raise Http404("El adjunto aún no está disponible.")
+
+    filename = attachment.original_filename or Path(attachment.file.name).name
+    if variant:
+        content_type = "image/jpeg"
+        filename = f"{Path(filename).stem}-{variant}.jpg"
+    else:
+        content_type = attachment.content_type or "application/octet-stream"
+
+    # The file is stored under its SHA-256, so the hash is a strong validator
+    etag = f'"{attachment.sha256}-{variant}"' if variant else f'"{attachment.sha256}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=86400",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Disposition": content_disposition_header(False, filename),
+    }
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return HttpResponseNotModified(headers={"ETag": etag, "Cache-Control": headers["Cache-Control"]})
+
+    sendfile_header = settings.ATTACHMENT_SENDFILE_HEADER
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if sendfile_header.lower() == "x-accel-redirect":
+            response[sendfile_header] = settings.ATTACHMENT_ACCEL_PREFIX + quote(file.name)
+        else:
+            response[sendfile_header] = str(path)
+        return response
+
+    size = path.stat().st_size
+    start, end, status = 0, size - 1, 200
+    headers["Accept-Ranges"] = "bytes"
+    range_header = request.headers.get("Range")
+    # If-Range: only honour the range if the client's copy is still current
+    if range_header and size and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return HttpResponse(status=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1
+    chunks = _afile_chunks if isinstance(request, ASGIRequest) else _file_chunks
+    response = StreamingHttpResponse(
+        chunks(path, start, length, settings.ATTACHMENT_CHUNK_SIZE),
+        status=status,
+        content_type=content_type,
+        headers=headers,
+    )
+    response["Content-Length"] = str(length)
+    return response
@@ -0,0 +1,160 @@
+"""
+Duplicate detection for incoming requests.
+
+Companies resend the WP form or apply again under a slightly different
+name. When a request comes in it is compared with the existing ones on its
+normalized tax_id, email and contact_email (exact matches, btree indexes)
+and on the trigram similarity of its normalized company name (pg_trgm GIN
+index), so each check is an index lookup however large the table grows.
+
+Each kind of match is a piece of evidence with a weight (the similarity
+itself for the name); the score of a candidate combines them as
+1 - prod(1 - weight). When the best score reaches DUPLICATE_FLAG_SCORE the
+request is flagged with its candidates:
+
+    duplicate_score = 0.97
+    duplicate_candidates = [{"id": 812, "score": 0.97, "reasons": ["email", "company_name"]}]
+"""
+import logging
+import re
+import unicodedata
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+
+from .models import UserRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+# Weight of an exact match on each normalized field. A shared contact alone
+# isn't enough: one gestor often files for several companies
+MATCH_WEIGHTS = {"tax_id": 1.0, "email": 0.9, "contact_email": 0.5}
+
+# Legal forms and filler words that don't tell two companies apart
+NAME_STOPWORDS = {
+    "sa", "srl", "sl", "sas", "ltda", "ltd", "inc", "llc", "corp", "cia", "co",
+    "mipyme", "cna", "empresa", "sociedad", "anonima", "de", "del", "la", "las", "el", "los", "y",
+}
+
+
+def normalize_tax_id(value):
+    return re.sub(r"[^0-9A-Z]", "", (value or "").upper())
+
+
+def normalize_email(value):
+    value = (value or "").strip().lower()
+    local, at, domain = value.partition("@")
+    # nombre+etiqueta@dominio es el mismo buzón
+    return f"{local.split('+', 1)[0]}{at}{domain}"
+
+
+def normalize_company_name(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char)).lower()
+    # S.A. -> sa, before the punctuation becomes separators
+    value = re.sub(r"[^\w\s]+", lambda match: "" if match.group() == "." else " ", value)
+    return " ".join(word for word in value.split() if word not in NAME_STOPWORDS)
+
+
+def normalize_request(user_request):
+    """Sets the normalized fields of a request from the submitted ones."""
+    user_request.tax_id_normalized = normalize_tax_id(user_request.tax_id)
+    user_request.email_normalized = normalize_email(user_request.email)
+    user_request.contact_email_normalized = normalize_email(user_request.contact_email)
+    user_request.company_name_normalized = normalize_company_name(user_request.company_name)
+
+
+def _combine(weights):
+    remaining = 1.0
+    for weight in weights:
+        remaining *= 1 - weight
+    return round(1 - remaining, 3)
+
+
+def find_candidates(user_request):
+    """
+    The existing requests that look like duplicates of user_request, as a
+    list of {"id", "score", "reasons"} with the best first.
+    """
+    others = UserRequest.objects.exclude(pk=user_request.pk)
+    limit = settings.DUPLICATE_MAX_CANDIDATES
+    evidence = {}
+
+    for field, weight in MATCH_WEIGHTS.items():
+        value = getattr(user_request, f"{field}_normalized")
+        if not value:
+            continue
+        for pk in others.filter(**{f"{field}_normalized": value}).values_list("id", flat=True)[:limit]:
+            evidence.setdefault(pk, {})[field] = weight
+
+    name = user_request.company_name_normalized
+    if name and connections[others.db].vendor == "postgresql":
+        # trigram_similar (%) uses the GIN index with pg_trgm's own threshold (0.3);
+        # the annotation then keeps only the close ones
+        similar = (
+            others.filter(company_name_normalized__trigram_similar=name)
+            .annotate(similarity=TrigramSimilarity("company_name_normalized", name))
+            .filter(similarity__gte=settings.DUPLICATE_NAME_SIMILARITY)
+            .order_by("-similarity")
+            .values_list("id", "similarity")[:limit]
+        )
+        for pk, similarity in similar:
+            evidence.setdefault(pk, {})["company_name"] = similarity
+
+    candidates = [
+        {"id": pk, "score": _combine(reasons.values()), "reasons": sorted(reasons)}
+        for pk, reasons in evidence.items()
+    ]
+    candidates.sort(key=lambda candidate: (-candidate["score"], candidate["id"]))
+    return candidates[:limit]
+
+
+def flag_duplicates(request_ids):
+    """
+    Scores the given requests against the rest and stores the result on
+    them. Returns how many were flagged.
+    """
+    flagged = 0
+    for user_request in UserRequest.objects.filter(id__in=request_ids):
+        candidates = [
+            candidate for candidate in find_candidates(user_request)
+            if candidate["score"] >= settings.DUPLICATE_FLAG_SCORE
+        ]
+        UserRequest.objects.filter(pk=user_request.pk).update(
+            duplicate_candidates=candidates,
+            duplicate_score=candidates[0]["score"] if candidates else None,
+        )
+        if candidates:
+            flagged += 1
+            logger.info(
+                "Posible solicitud duplicada %s: %s", user_request.pk, [candidate["id"] for candidate in candidates]
+            )
+    return flagged
+
+
+def backfill_normalized(batch_size=1000):
+    """Fills the normalized fields of requests saved before they existed. Returns how many."""
+    fields = ["tax_id_normalized", "email_normalized", "contact_email_normalized", "company_name_normalized"]
+    pending = UserRequest.objects.filter(company_name_normalized="").exclude(company_name="").order_by("id")
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return updated
+        for user_request in batch:
+            normalize_request(user_request)
+        UserRequest.objects.bulk_update(batch, fields)
+        updated += len(batch)
+        last_id = batch[-1].id
+
+
+def create_trigram_extension(using, **kwargs):
+    """pre_migrate handler: the GIN index on company_name_normalized needs pg_trgm."""
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
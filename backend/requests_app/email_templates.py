@@ -0,0 +1,148 @@
+"""
+Registry of the email templates in requests_app/templates/requests_app.
+
+Templates are read and validated once per worker process and pre-parsed into
+literal/placeholder segments, so rendering an email is a single join with no
+disk access. With DEBUG on, a template is re-read when its file changes.
+
+A template is a ``<name>.txt`` file using str.format placeholders; an optional
+``<name>.html`` next to it is rendered too (values HTML-escaped) and sent as
+the alternative part of a multipart message.
+"""
+import os
+import string
+import threading
+
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.utils.html import escape
+
+
+TEMPLATE_DIR = os.path.join(settings.BASE_DIR, 'requests_app', 'templates', 'requests_app')
+
+# Placeholders each template must provide; rendering fails early otherwise
+REQUIRED_FIELDS = {
+    'welcome_email': {'company_name', 'user_code', 'users_section'},
+    'reject_email': {'company_name', 'rejection_reason'},
+}
+
+
+class EmailTemplateError(Exception):
+    pass
+
+
+class CompiledTemplate:
+    """A template split once into (literal, field, format_spec, conversion) segments."""
+
+    def __init__(self, name, source, path):
+        self.name = name
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.segments = []
+        self.fields = set()
+        try:
+            for literal, field, format_spec, conversion in string.Formatter().parse(source):
+                self.segments.append((literal, field, format_spec, conversion))
+                if field is not None:
+                    if not field.isidentifier():
+                        raise EmailTemplateError(f"Unsupported placeholder '{{{field}}}' in {path}")
+                    self.fields.add(field)
+        except ValueError as e:
+            raise EmailTemplateError(f"Invalid template {path}: {e}")
+
+    def render(self, context, escape_values=False):
+        parts = []
+        for literal, field, format_spec, conversion in self.segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            value = context[field]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            value = format(value, format_spec) if format_spec else str(value)
+            parts.append(escape(value) if escape_values else value)
+        return "".join(parts)
+
+
+class TemplateRegistry:
+    def __init__(self, directory=TEMPLATE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._text = {}
+        self._html = {}
+        self._loaded = False
+
+    def _compile(self, filename):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'r', encoding='utf-8') as f:
+            return CompiledTemplate(os.path.splitext(filename)[0], f.read(), path)
+
+    def load(self):
+        """Reads, compiles and validates every template in the directory."""
+        text, html = {}, {}
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith('.txt'):
+                template = self._compile(filename)
+                text[template.name] = template
+            elif filename.endswith('.html'):
+                template = self._compile(filename)
+                html[template.name] = template
+
+        for name, required in REQUIRED_FIELDS.items():
+            if name not in text:
+                raise EmailTemplateError(f"Email template '{name}.txt' not found in {self.directory}")
+            for template in (text[name], html.get(name)):
+                if template is not None and not template.fields <= required:
+                    unknown = ", ".join(sorted(template.fields - required))
+                    raise EmailTemplateError(f"Unknown placeholders in {template.path}: {unknown}")
+
+        with self._lock:
+            self._text, self._html = text, html
+            self._loaded = True
+
+    def _is_stale(self, template):
+        try:
+            return os.path.getmtime(template.path) != template.mtime
+        except OSError:
+            return True
+
+    def _get(self, name):
+        if not self._loaded:
+            self.load()
+        template = self._text.get(name)
+        if template is None:
+            raise EmailTemplateError(f"Email template '{name}.txt' not found in {self.directory}")
+        if settings.DEBUG and (self._is_stale(template) or
+                               (name in self._html and self._is_stale(self._html[name]))):
+            self.load()
+            template = self._text[name]
+        return template, self._html.get(name)
+
+    def render(self, name, **context):
+        """Returns (text_body, html_body or None) for the named template."""
+        text_template, html_template = self._get(name)
+        fields = text_template.fields | (html_template.fields if html_template else set())
+        missing = fields - context.keys()
+        if missing:
+            raise EmailTemplateError(f"Missing values for {name}: {', '.join(sorted(missing))}")
+        html_body = html_template.render(context, escape_values=True) if html_template else None
+        return text_template.render(context), html_body
+
+
+registry = TemplateRegistry()
+
+
+def format_users_section(users):
+    """Builds the user/password table of the welcome email."""
+    return "".join(f"{user_info['user']:<12}{user_info['pass_user']}\n" for user_info in users)
+
+
+def render_email(name, **context):
+    return registry.render(name, **context)
+
+
+@worker_process_init.connect
+def load_email_templates(**kwargs):
+    registry.load()
@@ -0,0 +1,188 @@
+"""
+Live events for the panel, over Redis pub/sub and server-sent events.
+
+Writers call publish() (after their transaction commits) with one or more
+events; each is a JSON object {"type", "data"} sent on EVENTS_CHANNEL:
+
+- request.created / request.imported: a new request, from the API or WP
+- request.updated: fields changed on a request
+- request.status_changed: {"id", "old", "new"}
+- stats.delta: how the counters of /requests/stats/ moved, e.g. {"total": 1, "pending": 1}
+
+Each ASGI worker holds a single subscription (EventHub) and fans the
+messages out to its open /requests/events streams, so an idle dashboard
+costs one long-lived HTTP connection and no queries.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+# Status -> counter of StatsOut
+STATS_FIELDS = {"Pendiente": "pending", "Completado": "completed", "Rechazado": "rejected"}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _redis():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import redis
+
+                _client = redis.Redis.from_url(settings.EVENTS_REDIS_URL, socket_timeout=2)
+    return _client
+
+
+def event(event_type, **data):
+    return {"type": event_type, "data": data}
+
+
+def stats_delta(old_status=None, new_status=None, total=0):
+    """
+    The stats.delta event of a request leaving old_status and entering
+    new_status; total is +1/-1 when it starts/stops being counted.
+    """
+    delta = {"total": total}
+    if old_status in STATS_FIELDS:
+        delta[STATS_FIELDS[old_status]] = delta.get(STATS_FIELDS[old_status], 0) - 1
+    if new_status in STATS_FIELDS:
+        delta[STATS_FIELDS[new_status]] = delta.get(STATS_FIELDS[new_status], 0) + 1
+    delta = {key: value for key, value in delta.items() if value}
+    return event("stats.delta", **delta) if delta else None
+
+
+def publish(*events):
+    """
+    Sends the events once the current transaction commits (right away
+    outside one). Failures are logged: live updates are best effort and the
+    panel still reloads on demand.
+    """
+    events = [item for item in events if item]
+    if not events:
+        return
+
+    def send():
+        try:
+            pipe = _redis().pipeline(transaction=False)
+            for item in events:
+                pipe.publish(settings.EVENTS_CHANNEL, json.dumps(item, cls=DjangoJSONEncoder))
+            pipe.execute()
+        except Exception as e:
+            logger.warning("No se pudieron publicar los eventos %s: %s", [item["type"] for item in events], e)
+
+    transaction.on_commit(send)
+
+
+def request_changes_events(user_request, changes):
+    """The events of an update with the given history diff."""
+    by_field = {change["field"]: change for change in changes}
+    events = [event("request.updated", id=user_request.id, fields=list(by_field))]
+    status = by_field.get("status")
+    if status:
+        events.append(event("request.status_changed", id=user_request.id, old=status["old"], new=status["new"]))
+    # Stats only count active requests
+    old_status = status["old"] if status else user_request.status
+    was_active = by_field["active"]["old"] if "active" in by_field else user_request.active
+    if was_active and user_request.active:
+        events.append(stats_delta(old_status, user_request.status))
+    elif was_active:
+        events.append(stats_delta(old_status=old_status, total=-1))
+    elif user_request.active:
+        events.append(stats_delta(new_status=user_request.status, total=1))
+    return events
+
+
+class EventHub:
+    """
+    One Redis subscription per event loop, shared by every open stream.
+    Each stream gets a bounded queue; a client too slow to keep up loses
+    the oldest events rather than growing the worker's memory.
+    """
+
+    def __init__(self):
+        self.queues = set()
+        self.loop = None
+        self.task = None
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task is None or self.task.done():
+            self.loop = loop
+            self.task = loop.create_task(self._listen())
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    def _dispatch(self, message):
+        for queue in list(self.queues):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        retry = 1
+        while self.queues:
+            client = aioredis.Redis.from_url(settings.EVENTS_REDIS_URL)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(settings.EVENTS_CHANNEL)
+                retry = 1
+                while self.queues:
+                    message = await pubsub.get_message(timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+                    if message and message["type"] == "message":
+                        data = message["data"]
+                        self._dispatch(data.decode() if isinstance(data, bytes) else data)
+                # No await between the check above and this, so a new stream either
+                # got served by this loop or finds no task and starts another
+                self.task = None
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Suscripción a eventos interrumpida, reintento en %s s: %s", retry, e)
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, 30)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+
+hub = EventHub()
+
+
+async def event_stream():
+    """Async iterator of the SSE frames for one client, with keepalive comments."""
+    queue = hub.subscribe()
+    try:
+        # Tells the client it is connected; it should refresh once, since
+        # events published before this point are not replayed
+        yield "retry: 5000\nevent: ready\ndata: {}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            event_type = json.loads(message).get("type", "message")
+            yield f"event: {event_type}\ndata: {message}\n\n"
+    finally:
+        hub.unsubscribe(queue)
@@ -0,0 +1,77 @@
+"""
+Audit history of requests.
+
+Entries are append-only and structured: an action type plus the list of
+changed fields as {"field", "old", "new"}. The sentence shown in the panel
+is rendered when the entry is read, so the wording can change without
+touching stored rows and the rows stay queryable, e.g. who rejected what:
+
+    RequestHistory.objects.filter(
+        action_type="status_changed",
+        changed_at__gte=since,
+        changes__contains=[{"field": "status", "new": "Rechazado"}],
+    )
+"""
+from .models import RequestHistory, UserRequest
+
+
+# Pseudo-field for a replaced list of authorized persons; old/new are counts
+PERSONS_FIELD = "authorized_persons"
+
+
+def apply_changes(instance, values):
+    """
+    Sets values on instance and returns the diff of the fields that actually
+    changed, in the format stored in RequestHistory.changes.
+    """
+    changes = []
+    for field, value in values.items():
+        old_value = getattr(instance, field)
+        if old_value != value:
+            setattr(instance, field, value)
+            changes.append({"field": field, "old": old_value, "new": value})
+    return changes
+
+
+def action_type_for(changes):
+    """The action type of an update with the given diff."""
+    fields = {change["field"] for change in changes}
+    if "status" in fields:
+        return "status_changed"
+    if fields == {PERSONS_FIELD}:
+        return "persons_updated"
+    return "updated"
+
+
+def record_history(user_request, action_type, changes=(), changed_by=None, changed_from_ip=None):
+    """Appends one history entry. The only way history should be written."""
+    return RequestHistory.objects.create(
+        user_request=user_request,
+        action_type=action_type,
+        changes=list(changes),
+        changed_by=changed_by,
+        changed_from_ip=changed_from_ip,
+    )
+
+
+def _label(field):
+    if field == PERSONS_FIELD:
+        return "Personas autorizadas"
+    try:
+        return str(UserRequest._meta.get_field(field).verbose_name)
+    except Exception:
+        return field
+
+
+def _render_change(change):
+    if change["field"] == PERSONS_FIELD:
+        return f"Personas autorizadas actualizadas ({change['new']})."
+    return f"{_label(change['field'])} cambiado de '{change['old']}' a '{change['new']}'."
+
+
+def render_action(entry):
+    """The sentence shown for a history entry."""
+    if not entry.changes:
+        # Entries written before the history was structured only have the text
+        return entry.action or f"{entry.get_action_type_display()}."
+    return " ".join(_render_change(change) for change in entry.changes)
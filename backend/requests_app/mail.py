@@ -0,0 +1,166 @@
+"""
+Email dispatch through one persistent SMTP connection per worker process.
+
+send_mail opens and closes an SMTP+TLS session for every message. Here the
+connection is opened lazily (after the Celery fork), reused while it is
+fresh, and reopened once if the relay dropped it.
+"""
+import itertools
+import smtplib
+import threading
+import time
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+
+from .metrics import SMTP_CONNECTIONS, SMTP_MESSAGES, SMTP_RECONNECTS, SMTP_SEND_SECONDS
+
+
+_connection_ids = itertools.count(1)
+
+
+class PersistentMailer:
+    """Thread-safe wrapper around a long-lived Django email backend connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+        self._last_used = 0.0
+        self.connection_id = None
+        self.opened_at = None
+        self.messages_sent = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.send_seconds = 0.0
+        self.total_connections = 0
+        self.total_messages_sent = 0
+
+    def _open(self):
+        self._backend = get_connection(fail_silently=False)
+        self._backend.open()
+        self.connection_id = next(_connection_ids)
+        self.opened_at = time.time()
+        self._last_used = time.monotonic()
+        self.messages_sent = 0
+        self.send_seconds = 0.0
+        self.total_connections += 1
+        SMTP_CONNECTIONS.inc()
+
+    def _close(self):
+        if self._backend is not None:
+            try:
+                self._backend.close()
+            except Exception:
+                pass
+        self._backend = None
+
+    def _ensure_open(self):
+        idle = time.monotonic() - self._last_used
+        if self._backend is not None and idle > settings.EMAIL_CONNECTION_IDLE_SECONDS:
+            # The relay has most likely timed us out already
+            self._close()
+        if self._backend is None:
+            self._open()
+
+    def _send_one(self, message):
+        for attempt in range(settings.EMAIL_SEND_RETRIES + 1):
+            self._ensure_open()
+            try:
+                sent = self._backend.send_messages([message])
+                self._last_used = time.monotonic()
+                return sent
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError):
+                self._close()
+                if attempt == settings.EMAIL_SEND_RETRIES:
+                    raise
+                self.reconnects += 1
+                SMTP_RECONNECTS.inc()
+
+    def send_messages(self, messages):
+        """
+        Sends the messages over the shared connection, one at a time so a
+        reconnect never re-sends a message that already went out.
+        Returns the number of messages sent.
+        """
+        sent = 0
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                for message in messages:
+                    try:
+                        sent += self._send_one(message) or 0
+                    except Exception:
+                        self.failures += 1
+                        SMTP_MESSAGES.labels("failed").inc()
+                        raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.messages_sent += sent
+                self.total_messages_sent += sent
+                self.send_seconds += elapsed
+                SMTP_MESSAGES.labels("sent").inc(sent)
+                SMTP_SEND_SECONDS.observe(elapsed)
+        return sent
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def stats(self):
+        """Throughput figures for the current connection and totals for the process."""
+        return {
+            'connection_id': self.connection_id,
+            'connection_open': self._backend is not None,
+            'connection_age_seconds': round(time.time() - self.opened_at, 3) if self.opened_at else None,
+            'messages_sent': self.messages_sent,
+            'messages_per_second': round(self.messages_sent / self.send_seconds, 3) if self.send_seconds else None,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'total_connections': self.total_connections,
+            'total_messages_sent': self.total_messages_sent,
+        }
+
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+
+def get_mailer():
+    """Returns this process's PersistentMailer."""
+    global _mailer
+    if _mailer is None:
+        with _mailer_lock:
+            if _mailer is None:
+                _mailer = PersistentMailer()
+    return _mailer
+
+
+def build_message(subject, body, recipient_list, from_email=None, html_body=None):
+    """Plain text message, or text/html multipart when html_body is given."""
+    if html_body is None:
+        return EmailMessage(
+            subject=subject,
+            body=body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=recipient_list,
+        )
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+    )
+    message.attach_alternative(html_body, "text/html")
+    return message
+
+
+def send_email(subject, body, recipient_list, from_email=None, html_body=None):
+    """Drop-in for send_mail(..., fail_silently=False) over the shared connection."""
+    return get_mailer().send_messages([build_message(subject, body, recipient_list, from_email, html_body)])
+
+
+@worker_process_shutdown.connect
+def close_mailer(**kwargs):
+    if _mailer is not None:
+        _mailer.close()
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from requests_app.archive import archivable_requests, archive_requests
+
+
+class Command(BaseCommand):
+    help = "Mueve a las tablas de archivo las solicitudes completadas o rechazadas sin actividad y las eliminadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int, default=None,
+            help=f"Días sin actividad antes de archivar (por defecto ARCHIVE_AFTER_DAYS={settings.ARCHIVE_AFTER_DAYS}).",
+        )
+        parser.add_argument("--batch-size", type=int, default=None, help="Solicitudes por transacción.")
+        parser.add_argument("--limit", type=int, default=None, help="Máximo de solicitudes a archivar en esta ejecución.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo cuenta las solicitudes que se archivarían.")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            count = archivable_requests(options["older_than_days"]).count()
+            self.stdout.write(f"{count} solicitudes se archivarían.")
+            return
+
+        summary = archive_requests(
+            older_than_days=options["older_than_days"],
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['requests']} solicitudes y {summary['history']} entradas de historial archivadas "
+            f"en {summary['batches']} lotes."
+        ))
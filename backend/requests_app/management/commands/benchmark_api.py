@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import warnings
+
+from celery.exceptions import AlwaysEagerIgnored
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from core.celery import app as celery_app
+from requests_app.benchmark.data import create_operators, generate_requests
+from requests_app.benchmark.runner import SCENARIOS, BenchmarkContext, compare, run_scenario
+from requests_app.benchmark.serialization import measure_serialization
+from requests_app.benchmark.stubs import FakeOracle, WordPressStub
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos en una base de datos de prueba y mide la API "
+        "(rendimiento, p50/p95/p99 y consultas por petición)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=10000, help="Solicitudes a generar.")
+        parser.add_argument("--operators", type=int, default=10, help="Operadores (usuarios) concurrentes.")
+        parser.add_argument("--iterations", type=int, default=200, help="Peticiones por escenario.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Peticiones simultáneas.")
+        parser.add_argument(
+            "--scenarios", default=",".join(SCENARIOS),
+            help=f"Escenarios separados por comas ({', '.join(SCENARIOS)}).",
+        )
+        parser.add_argument("--wp-records", type=int, default=0, help="Registros nuevos que devuelve WP en cada consulta.")
+        parser.add_argument("--wp-latency", type=float, default=0.05, help="Latencia simulada de WP en segundos.")
+        parser.add_argument("--oracle-latency", type=float, default=0.002, help="Latencia simulada por sentencia Oracle.")
+        parser.add_argument("--oracle-users", type=int, default=50000, help="Usuarios ya existentes en el Oracle simulado.")
+        parser.add_argument("--redis", action="store_true", help="Usar la caché configurada en lugar de una en memoria.")
+        parser.add_argument(
+            "--serialization-rows", type=int, default=1000,
+            help="Filas con las que medir la serialización del listado (0 para omitirla).",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default=None, help="Fichero JSON donde guardar el reporte.")
+        parser.add_argument("--baseline", default=None, help="Reporte JSON anterior con el que comparar.")
+        parser.add_argument(
+            "--max-regression", type=float, default=20,
+            help="Porcentaje de empeoramiento del p95 tolerado frente a --baseline.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options["scenarios"].split(",") if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+        overrides = {
+            # Limits high enough that the login scenario measures the view, not the throttle
+            "AUTH_THROTTLE_RATES": {scope: (10 ** 9, 60) for scope in ("login_ip", "login_user", "verify_ip", "verify_user")},
+        }
+        if not options["redis"]:
+            overrides["CACHES"] = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+        # Tasks run inline (2FA email) or go to an in-memory broker (outbox dispatch)
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.broker_url = "memory://"
+        # Celery reads this from the environment before its own configuration
+        os.environ["CELERY_RESULT_BACKEND"] = "cache+memory://"
+        warnings.filterwarnings("ignore", category=AlwaysEagerIgnored)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(**overrides):
+                report = self._run(scenarios, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                regressions = compare(report["scenarios"], json.load(f), options["max_regression"])
+            if regressions:
+                raise CommandError("Regresiones frente a la referencia:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones frente a la referencia."))
+
+    def _run(self, scenarios, options):
+        self.stdout.write(f"Generando {options['requests']} solicitudes...")
+        operators = create_operators(options["operators"])
+        dataset = generate_requests(options["requests"], operators, seed=options["seed"])
+        self.stdout.write(
+            f"{dataset['requests']} solicitudes, {dataset['persons']} personas autorizadas, "
+            f"{dataset['history']} entradas de historial."
+        )
+
+        ctx = BenchmarkContext(operators, seed=options["seed"])
+        rows = []
+        with WordPressStub(options["wp_records"], options["wp_latency"]), \
+                FakeOracle(options["oracle_users"], options["oracle_latency"]):
+            for name in scenarios:
+                mail.outbox = []
+                result = asyncio.run(run_scenario(ctx, name, options["iterations"], options["concurrency"]))
+                rows.append(result.summary())
+                self._print_row(rows[-1])
+
+        serialization = None
+        if options["serialization_rows"]:
+            serialization = measure_serialization(options["serialization_rows"])
+            self.stdout.write(
+                f"serialización del listado ({serialization['rows']} filas), ms por 1000 filas: "
+                f"modelos {serialization['models_ms_per_1k']}  values {serialization['values_ms_per_1k']}  "
+                f"values con fields= {serialization['values_sparse_ms_per_1k']}"
+            )
+
+        return {
+            "dataset": dataset,
+            "iterations": options["iterations"],
+            "concurrency": options["concurrency"],
+            "scenarios": rows,
+            "serialization": serialization,
+        }
+
+    def _print_row(self, row):
+        self.stdout.write(
+            f"{row['scenario']:<16} {row['requests']:>6} req  {row['errors']:>4} err  "
+            f"{row['throughput_rps'] or 0:>8.1f} req/s  "
+            f"p50 {row['p50_ms'] or 0:>8.1f} ms  p95 {row['p95_ms'] or 0:>8.1f} ms  p99 {row['p99_ms'] or 0:>8.1f} ms  "
+            f"consultas {row['avg_queries'] or 0:>6.1f} (máx. {row['max_queries'] or 0})"
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from requests_app.duplicates import backfill_normalized, flag_duplicates
+from requests_app.models import UserRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Completa los campos normalizados de las solicitudes existentes y marca las que "
+        "parecen duplicadas de otra (mismo NIT o correo, o nombre de empresa parecido)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("request_ids", nargs="*", type=int, help="Solicitudes a revisar (por defecto, todas).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Solicitudes por lote.")
+
+    def handle(self, *args, **options):
+        normalized = backfill_normalized(options["batch_size"])
+        if normalized:
+            self.stdout.write(f"{normalized} solicitudes normalizadas.")
+
+        request_ids = options["request_ids"] or list(UserRequest.objects.order_by("id").values_list("id", flat=True))
+        batch_size = options["batch_size"]
+        flagged = 0
+        for start in range(0, len(request_ids), batch_size):
+            flagged += flag_duplicates(request_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f"{flagged} solicitudes marcadas como posible duplicado."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from requests_app.attachments import mirror_pending
+from requests_app.previews import missing_previews, schedule_previews
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarga a MEDIA_ROOT los archivos de las solicitudes que aún están solo en WordPress "
+        "y encola las vistas previas que falten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("request_ids", nargs="*", type=int, help="Solicitudes a procesar (por defecto, todas las activas).")
+        parser.add_argument("--limit", type=int, default=None, help="Máximo de archivos a descargar en esta ejecución.")
+
+    def handle(self, *args, **options):
+        request_ids = options["request_ids"] or None
+        summary = mirror_pending(request_ids, limit=options["limit"])
+        schedule_previews(missing_previews(request_ids))
+        message = (
+            f"{summary['downloaded']} descargados, {summary['deduplicated']} ya presentes, "
+            f"{summary['retry']} para reintentar, {summary['failed']} fallidos"
+        )
+        if summary["retry"] or summary["failed"]:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
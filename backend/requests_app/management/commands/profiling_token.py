@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from requests_app.middleware import make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Genera un valor para la cabecera X-Profile que activa el perfilado de una petición."
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
+        self.stderr.write(
+            f"Válido durante {settings.PROFILING_TOKEN_MAX_AGE} s. Los perfiles se guardan en {settings.PROFILING_DIR}."
+        )
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from requests_app.reconcile import reconcile_completed_requests
+
+
+class Command(BaseCommand):
+    help = "Compara las personas autorizadas de las solicitudes completadas con CM_WEB.WEB_USER."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=None, help="Solicitudes por consulta a Oracle (máx. 1000).")
+        parser.add_argument("--arraysize", type=int, default=None, help="Filas por viaje de red en los fetch de Oracle.")
+        parser.add_argument("--output", default=None, help="Ruta del fichero JSON donde guardar el reporte completo.")
+
+    def handle(self, *args, **options):
+        report = reconcile_completed_requests(
+            chunk_size=options["chunk_size"],
+            arraysize=options["arraysize"],
+        )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        for issue in report["issues"]:
+            self.stdout.write(json.dumps(issue, ensure_ascii=False))
+
+        summary = (
+            f"{report['requests_checked']} solicitudes, {report['persons_checked']} personas revisadas, "
+            f"{report['persons_ok']} correctas, {report['issue_count']} incidencias, "
+            f"{report['requests_without_code']} completadas sin código de cliente "
+            f"({report['duration_seconds']}s)"
+        )
+        if report["issue_count"]:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
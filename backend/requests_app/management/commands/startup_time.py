@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from requests_app.startup import STARTUP_SCRIPTS, measure_startup
+
+
+class Command(BaseCommand):
+    help = "Mide el tiempo de arranque (django.setup() y carga de URLs o tareas) de un worker en frío."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=[*STARTUP_SCRIPTS, "all"], default="all")
+        parser.add_argument("--top", type=int, default=15, help="Importaciones más lentas a mostrar.")
+        parser.add_argument(
+            "--budget", type=float, default=None,
+            help="Segundos permitidos (por defecto STARTUP_IMPORT_BUDGET_SECONDS).",
+        )
+
+    def handle(self, *args, **options):
+        budget = options["budget"] or settings.STARTUP_IMPORT_BUDGET_SECONDS
+        targets = list(STARTUP_SCRIPTS) if options["target"] == "all" else [options["target"]]
+        failures = []
+        for target in targets:
+            result = measure_startup(target)
+            self.stdout.write(f"{target}: {result['seconds']:.3f} s (presupuesto {budget:.3f} s)")
+            for name, seconds in result["slowest_imports"][:options["top"]]:
+                self.stdout.write(f"  {seconds * 1000:8.1f} ms  {name}")
+            if result["seconds"] > budget:
+                failures.append(f"{target} tarda {result['seconds']:.3f} s, por encima de {budget:.3f} s")
+            if result["lazy_modules_loaded"]:
+                failures.append(f"{target} importa al arrancar: {', '.join(result['lazy_modules_loaded'])}")
+        if failures:
+            raise CommandError("\n".join(failures))
@@ -0,0 +1,270 @@
+"""
+Prometheus metrics for the API, the external integrations and Celery.
+
+Set PROMETHEUS_MULTIPROC_DIR (shared by every gunicorn/uvicorn and Celery
+process) to aggregate metrics across processes; without it each process
+only reports its own, and the Celery and SMTP metrics, which the workers
+record, never reach /metrics. The stats of the in-memory USER_COD index are
+exported as gauges of the process serving /metrics.
+"""
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency per route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "ORM queries per request", ["route"], buckets=QUERY_COUNT_BUCKETS,
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in ORM queries per request", ["route"], buckets=LATENCY_BUCKETS,
+)
+WP_SYNC_SECONDS = Histogram(
+    "wp_sync_duration_seconds", "Duration of the WordPress sync in list_requests", buckets=LATENCY_BUCKETS,
+)
+WP_SYNC_RECORDS = Counter(
+    "wp_sync_records_total", "WordPress records seen by the sync", ["result"],
+)
+ORACLE_CONNECT_SECONDS = Histogram(
+    "oracle_connect_seconds", "Time to open an Oracle connection", buckets=LATENCY_BUCKETS,
+)
+ORACLE_PROVISIONING_SECONDS = Histogram(
+    "oracle_provisioning_seconds", "Time to provision the Oracle users of a completed request",
+    buckets=LATENCY_BUCKETS,
+)
+ORACLE_USERS_PROVISIONED = Counter(
+    "oracle_users_provisioned_total", "WEB_USER rows inserted", ["result"],
+)
+CELERY_TASK_SECONDS = Histogram(
+    "celery_task_duration_seconds", "Celery task run time", ["task"], buckets=LATENCY_BUCKETS,
+)
+CELERY_QUEUE_LATENCY_SECONDS = Histogram(
+    "celery_queue_latency_seconds", "Time between publishing a task and a worker starting it",
+    ["task"], buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_FAILURES = Counter(
+    "celery_task_failures_total", "Celery tasks that raised", ["task"],
+)
+REPLICA_FALLBACKS = Counter(
+    "db_replica_fallbacks_total", "Lag checks that sent reads back to the primary", ["reason"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by cache and result (hit/miss)", ["cache", "result"],
+)
+SMTP_MESSAGES = Counter(
+    "smtp_messages_total", "Messages handed to the SMTP relay", ["result"],
+)
+SMTP_CONNECTIONS = Counter(
+    "smtp_connections_total", "SMTP connections opened",
+)
+SMTP_RECONNECTS = Counter(
+    "smtp_reconnects_total", "SMTP connections reopened after the relay dropped them",
+)
+SMTP_SEND_SECONDS = Histogram(
+    "smtp_send_seconds", "Time to send a batch over the persistent SMTP connection", buckets=LATENCY_BUCKETS,
+)
+AUTH_THROTTLE_CHECKS = Counter(
+    "auth_throttle_checks_total", "Rate limiter checks by scope and outcome", ["scope", "outcome"],
+)
+
+
+@contextmanager
+def timed(histogram, timing=None):
+    """
+    Observes the block's duration in histogram and, if timing is given, adds
+    it to that entry of the current request's stats (see request_stats()).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed)
+        if timing is not None:
+            record_timing(timing, elapsed)
+
+
+def cache_lookup(cache_name, hit):
+    CACHE_LOOKUPS.labels(cache_name, "hit" if hit else "miss").inc()
+
+
+# ----------------------------
+# Per-request stats
+# ----------------------------
+# ORM query count/time and time spent in WordPress and Oracle for the current
+# request. The dict lives in a context variable so work done by the async ORM
+# and sync_to_async in executor threads is counted for the request that
+# issued it.
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def start_request_stats():
+    stats = {"db_queries": 0, "db": 0.0, "wp": 0.0, "oracle": 0.0, "view_start": None, "view_end": None}
+    return stats, _request_stats.set(stats)
+
+
+def finish_request_stats(token):
+    _request_stats.reset(token)
+
+
+def request_stats():
+    """The current request's stats dict, or None outside a request."""
+    return _request_stats.get()
+
+
+def record_timing(name, seconds):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[name] += seconds
+
+
+def _count_queries(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats["db_queries"] += 1
+        stats["db"] += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+def timed_view(view_func):
+    """
+    Ninja operation decorator recording when the view body starts and ends,
+    so the time ninja then spends validating and rendering the response can
+    be told apart from the view itself.
+    """
+    def mark(name):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats[name] = time.perf_counter()
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(*args, **kwargs):
+            mark("view_start")
+            try:
+                return await view_func(*args, **kwargs)
+            finally:
+                mark("view_end")
+    else:
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            mark("view_start")
+            try:
+                return view_func(*args, **kwargs)
+            finally:
+                mark("view_end")
+    return wrapper
+
+
+# ----------------------------
+# Celery
+# ----------------------------
+_task_started = {}
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers["enqueued_at"] = time.time()
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if not enqueued_at:
+        return
+    latency = max(time.time() - enqueued_at, 0.0)
+    CELERY_QUEUE_LATENCY_SECONDS.labels(task.name).observe(latency)
+    if latency > settings.CELERY_QUEUE_LATENCY_WARN_SECONDS:
+        queue = (task.request.delivery_info or {}).get("routing_key")
+        logger.warning("%s waited %.2fs in queue '%s'", task.name, latency, queue)
+
+
+@task_postrun.connect
+def record_task_end(task_id=None, task=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_SECONDS.labels(task.name).observe(time.perf_counter() - started)
+
+
+@task_failure.connect
+def record_task_failure(sender=None, **kwargs):
+    CELERY_TASK_FAILURES.labels(sender.name if sender else "unknown").inc()
+
+
+# ----------------------------
+# In-process stats as gauges
+# ----------------------------
+class InProcessStatsCollector:
+    def collect(self):
+        from .user_cod_index import _index
+
+        if _index is not None:
+            stats = _index.stats()
+            gauge = GaugeMetricFamily("user_cod_index_stats", "In-memory USER_COD index stats", labels=["stat"])
+            for name in ("size", "approx_bytes", "load_count", "refresh_count",
+                         "last_load_seconds", "last_refresh_seconds", "last_refresh_rows"):
+                if stats[name] is not None:
+                    gauge.add_metric([name], stats[name])
+            yield gauge
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition, protected by METRICS_TOKEN. Without a token
+    it is only served with DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            raise Http404
+    elif request.META.get("HTTP_AUTHORIZATION") != f"Bearer {token}":
+        return HttpResponseForbidden()
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(InProcessStatsCollector())
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    REGISTRY.register(InProcessStatsCollector())
@@ -0,0 +1,270 @@
+import cProfile
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+
+from core.log import request_id_var
+
+from .metrics import (
+    HTTP_REQUEST_DB_QUERIES, HTTP_REQUEST_DB_SECONDS, HTTP_REQUEST_SECONDS,
+    finish_request_stats, request_stats, start_request_stats,
+)
+from .replica import finish_routing, pin_after_write, start_routing
+
+
+REQUEST_ID_HEADER = "HTTP_X_REQUEST_ID"
+_request_id_re = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    Tags every log record of a request with a request id: the incoming
+    X-Request-ID (e.g. from nginx) when it looks sane, else a new one. The id
+    is echoed in the response and passed on to the Celery tasks it publishes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _request_id(request):
+        incoming = request.META.get(REQUEST_ID_HEADER, "")
+        return incoming if _request_id_re.match(incoming) else uuid.uuid4().hex
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = self._request_id(request)
+        token = request_id_var.set(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = self._request_id(request)
+        token = request_id_var.set(request.request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+
+def _route(request):
+    # The URL pattern rather than the path, so /api/requests/12 and /api/requests/13 share a series
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets ReplicaRouter tell which request a query belongs to, and pins the
+    user to the primary after a successful write (see requests_app/replica.py).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = start_routing(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = finish_routing(token)
+        pin_after_write(state, response)
+        return response
+
+    async def __acall__(self, request):
+        token = start_routing(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = finish_routing(token)
+        await sync_to_async(pin_after_write)(state, response)
+        return response
+
+
+class MetricsMiddleware:
+    """Records latency, status and ORM query count/time for every request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        stats, token = start_request_stats()
+        request.request_stats = stats
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request_stats(token)
+        self._observe(request, response, start, stats)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        stats, token = start_request_stats()
+        request.request_stats = stats
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request_stats(token)
+        self._observe(request, response, start, stats)
+        return response
+
+    @staticmethod
+    def _observe(request, response, start, stats):
+        route = _route(request)
+        if route == "metrics":
+            return
+        HTTP_REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - start
+        )
+        HTTP_REQUEST_DB_QUERIES.labels(route).observe(stats["db_queries"])
+        HTTP_REQUEST_DB_SECONDS.labels(route).observe(stats["db"])
+
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_SALT = "requests_app.profiling"
+
+# cProfile hooks a whole thread, and under ASGI every async view shares the
+# event loop thread, so only one request per process is profiled at a time.
+_profiler_lock = threading.Lock()
+
+
+def make_profile_token():
+    """Signed value for the X-Profile header, valid for PROFILING_TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign("profile")
+
+
+def _profile_requested(request):
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        try:
+            signing.TimestampSigner(salt=PROFILE_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+            return True
+        except signing.BadSignature:
+            return False
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _server_timing(stats, total):
+    entries = [
+        f'db;dur={stats["db"] * 1000:.1f};desc="{stats["db_queries"]} queries"',
+        f'wp;dur={stats["wp"] * 1000:.1f}',
+        f'oracle;dur={stats["oracle"] * 1000:.1f}',
+    ]
+    if stats["view_start"] is not None and stats["view_end"] is not None:
+        entries.append(f'view;dur={(stats["view_end"] - stats["view_start"]) * 1000:.1f}')
+        entries.append(f'serialization;dur={(time.perf_counter() - stats["view_end"]) * 1000:.1f}')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ", ".join(entries)
+
+
+def _dump_profile(profiler, request, total):
+    """Writes a .prof file (open it with snakeviz or flameprof) and keeps the newest PROFILING_MAX_FILES."""
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", _route(request)).strip("-") or "root"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{total * 1000:.0f}ms.prof"
+    profiler.dump_stats(directory / name)
+    profiles = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for old in profiles[:-settings.PROFILING_MAX_FILES]:
+        old.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests that carry a valid signed X-Profile header (see the
+    profiling_token command) or fall in the PROFILING_SAMPLE_RATE sample.
+
+    Profiled responses get a Server-Timing header with the DB, WordPress,
+    Oracle, view and serialization time collected by MetricsMiddleware, which
+    must come before this one. Work done in executor threads (async ORM,
+    Oracle) does not appear in the profile itself, only in Server-Timing,
+    while anything else the event loop ran meanwhile does. Requests that are
+    not profiled only pay for a header lookup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _profile_requested(request) or not _profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+        start = time.perf_counter()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profiler_lock.release()
+        total = time.perf_counter() - start
+        self._annotate(response, total)
+        _dump_profile(profiler, request, total)
+        return response
+
+    async def __acall__(self, request):
+        if not _profile_requested(request) or not _profiler_lock.acquire(blocking=False):
+            return await self.get_response(request)
+        start = time.perf_counter()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profiler_lock.release()
+        total = time.perf_counter() - start
+        self._annotate(response, total)
+        await sync_to_async(_dump_profile, thread_sensitive=False)(profiler, request, total)
+        return response
+
+    @staticmethod
+    def _annotate(response, total):
+        stats = request_stats()
+        if stats is not None:
+            response["Server-Timing"] = _server_timing(stats, total)
@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 import datetime
+import uuid
 
 from django.db import models
 from django.contrib.auth.models import User
@@ -45,13 +48,37 @@ class UserRequest(models.Model):
     # Archivos cargados (guardados en JSON o en relación aparte)
     uploaded_files = models.JSONField(default=list, blank=True, verbose_name="Archivos Subidos")
 
+    # Posibles duplicados (see duplicates.py): the normalized fields are
+    # kept by save(), the candidates are set at ingest
+    tax_id_normalized = models.CharField(max_length=50, blank=True, default="", db_index=True, editable=False)
+    email_normalized = models.CharField(max_length=254, blank=True, default="", db_index=True, editable=False)
+    contact_email_normalized = models.CharField(max_length=254, blank=True, default="", db_index=True, editable=False)
+    company_name_normalized = models.CharField(max_length=255, blank=True, default="", editable=False)
+    duplicate_score = models.FloatField(null=True, blank=True, verbose_name="Puntuación de Duplicado")
+    duplicate_candidates = models.JSONField(default=list, blank=True, verbose_name="Posibles Duplicados")
+
     def __str__(self):
         return f"Solicitud de {self.company_name} - {self.status}"
 
+    def save(self, *args, **kwargs):
+        from .duplicates import normalize_request
+
+        normalize_request(self)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Solicitud de Usuario"
         verbose_name_plural = "Solicitudes de Usuario"
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=["company_name_normalized"], opclasses=["gin_trgm_ops"], name="userrequest_company_trgm"),
+            # Only flagged requests are in it, so listing them stays cheap
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(duplicate_score__isnull=False),
+                name="userrequest_duplicates",
+            ),
+        ]
 
 
 class AuthorizedPerson(models.Model):
@@ -73,11 +100,26 @@ class AuthorizedPerson(models.Model):
 
 
 class RequestHistory(models.Model):
+    """
+    Append-only audit entry: an action type and the changed fields as a list
+    of {"field", "old", "new"}. Written through history.record_history();
+    the text shown is rendered from the diff by history.render_action().
+    """
+    ACTION_CHOICES = [
+        ('created', 'Solicitud creada'),
+        ('updated', 'Solicitud actualizada'),
+        ('status_changed', 'Estado cambiado'),
+        ('persons_updated', 'Personas autorizadas actualizadas'),
+    ]
+
     user_request = models.ForeignKey(UserRequest, related_name='history', on_delete=models.CASCADE, verbose_name="Solicitud de Usuario")
     changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name="Modificado por")
     changed_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Modificación")
     changed_from_ip = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP de Modificación")
-    action = models.TextField(verbose_name="Acción")
+    action_type = models.CharField(max_length=20, choices=ACTION_CHOICES, default='updated', verbose_name="Tipo de Acción")
+    changes = models.JSONField(default=list, blank=True, verbose_name="Cambios")
+    # Free text of the entries written before the history was structured
+    action = models.TextField(blank=True, default='', verbose_name="Acción")
 
     def __str__(self):
         return f"Historial de la solicitud {self.user_request.id} - {self.changed_at}"
@@ -86,6 +128,77 @@ class RequestHistory(models.Model):
         verbose_name = "Historial de Solicitud"
         verbose_name_plural = "Historial de Solicitudes"
         ordering = ['-changed_at']
+        indexes = [
+            models.Index(fields=['action_type', 'changed_at'], name='history_action_changed_idx'),
+            models.Index(fields=['changed_by', 'changed_at'], name='history_user_changed_idx'),
+        ]
+
+
+class Attachment(models.Model):
+    """
+    A document of a request. Files are stored once per content under
+    attachments/<sha256[:2]>/<sha256[2:4]>/<sha256>, so identical uploads of
+    different requests share the same file on disk; images and PDFs get a
+    thumbnail and a first-page preview next to it.
+    """
+    STATUS_CHOICES = [
+        ('Pendiente', 'Pendiente'),
+        ('Descargado', 'Descargado'),
+        ('Fallido', 'Fallido'),
+    ]
+
+    user_request = models.ForeignKey(UserRequest, on_delete=models.CASCADE, related_name='attachments', verbose_name="Solicitud")
+    file = models.FileField(upload_to='attachments/', blank=True, verbose_name="Archivo")
+    original_filename = models.CharField(max_length=255, blank=True, null=True, verbose_name="Nombre Original")
+    source_url = models.URLField(max_length=500, blank=True, null=True, verbose_name="URL de Origen")
+    sha256 = models.CharField(max_length=64, blank=True, null=True, db_index=True, verbose_name="SHA-256")
+    size = models.PositiveBigIntegerField(blank=True, null=True, verbose_name="Tamaño (bytes)")
+    content_type = models.CharField(max_length=100, blank=True, null=True, verbose_name="Tipo de Contenido")
+    thumbnail = models.FileField(blank=True, verbose_name="Miniatura")
+    preview = models.FileField(blank=True, verbose_name="Vista Previa")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pendiente', verbose_name="Estado")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    last_error = models.TextField(blank=True, null=True, verbose_name="Último Error")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    downloaded_at = models.DateTimeField(blank=True, null=True, verbose_name="Fecha de Descarga")
+
+    def __str__(self):
+        return f"{self.original_filename or self.file.name} ({self.user_request_id})"
+
+    class Meta:
+        verbose_name = "Adjunto"
+        verbose_name_plural = "Adjuntos"
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['user_request', 'source_url'], name='attachment_request_source_uniq'),
+        ]
+
+
+class AttachmentUpload(models.Model):
+    """
+    A chunked upload in progress. The bytes received so far are in a part
+    file under MEDIA_ROOT; finalizing checks them against sha256 and turns
+    them into an Attachment.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_request = models.ForeignKey(UserRequest, on_delete=models.CASCADE, related_name='uploads', verbose_name="Solicitud")
+    filename = models.CharField(max_length=255, verbose_name="Nombre del Archivo")
+    content_type = models.CharField(max_length=100, blank=True, null=True, verbose_name="Tipo de Contenido")
+    size = models.PositiveBigIntegerField(verbose_name="Tamaño (bytes)")
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+    received = models.PositiveBigIntegerField(default=0, verbose_name="Bytes Recibidos")
+    attachment = models.OneToOneField(Attachment, on_delete=models.SET_NULL, blank=True, null=True, related_name='upload', verbose_name="Adjunto")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name="Creado por")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última Actividad")
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+    class Meta:
+        verbose_name = "Subida de Adjunto"
+        verbose_name_plural = "Subidas de Adjuntos"
+
 
 class TwoFactorAuth(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -102,4 +215,86 @@ class TwoFactorAuth(models.Model):
         return timezone.now() > self.expires_at
 
     def __str__(self):
-        return f"2FA for {self.user.username}"
\ No newline at end of file
+        return f"2FA for {self.user.username}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Emails waiting to be sent. Rows are written in the same transaction as the
+    change that triggers them and drained in batches by dispatch_email_outbox_task.
+    """
+    STATUS_CHOICES = [
+        ('Pendiente', 'Pendiente'),
+        ('Enviando', 'Enviando'),
+        ('Enviado', 'Enviado'),
+        ('Fallido', 'Fallido'),
+    ]
+
+    message_key = models.CharField(max_length=255, unique=True, verbose_name="Clave del Mensaje")
+    template = models.CharField(max_length=100, verbose_name="Plantilla")
+    subject = models.CharField(max_length=255, verbose_name="Asunto")
+    recipients = models.JSONField(default=list, verbose_name="Destinatarios")
+    context = models.JSONField(default=dict, blank=True, verbose_name="Contexto")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pendiente', verbose_name="Estado")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    # While 'Enviando' this is when the dispatcher's claim expires
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próximo Intento")
+    last_error = models.TextField(blank=True, null=True, verbose_name="Último Error")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name="Fecha de Envío")
+
+    def __str__(self):
+        return f"{self.template} para {', '.join(self.recipients)} - {self.status}"
+
+    class Meta:
+        verbose_name = "Correo en Cola"
+        verbose_name_plural = "Correos en Cola"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_pending_idx'),
+        ]
+
+
+class ArchivedRequest(models.Model):
+    """
+    A request moved out of the hot tables by archive.archive_requests().
+    The id is the original one; the columns needed to find it are kept and
+    everything else (all fields, authorized persons, attachments) is in data.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID")
+    company_name = models.CharField(max_length=255, verbose_name="Nombre de la Empresa")
+    email = models.EmailField(verbose_name="Correo Electrónico")
+    tax_id = models.CharField(max_length=50, db_index=True, verbose_name="NIT / Registro Fiscal")
+    customer_code = models.CharField(max_length=100, blank=True, null=True, unique=True, verbose_name="Código de Cliente")
+    status = models.CharField(max_length=20, blank=True, null=True, verbose_name="Estado")
+    active = models.BooleanField(default=True, verbose_name="Activo")
+    created_at = models.DateTimeField(verbose_name="Fecha de Creación")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Archivo")
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Datos")
+
+    def __str__(self):
+        return f"Solicitud archivada de {self.company_name} - {self.status}"
+
+    class Meta:
+        verbose_name = "Solicitud Archivada"
+        verbose_name_plural = "Solicitudes Archivadas"
+        ordering = ['-created_at']
+
+
+class ArchivedRequestHistory(models.Model):
+    """RequestHistory entries of an archived request, unchanged."""
+    user_request = models.ForeignKey(ArchivedRequest, related_name='history', on_delete=models.CASCADE, verbose_name="Solicitud Archivada")
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name="Modificado por")
+    changed_at = models.DateTimeField(verbose_name="Fecha de Modificación")
+    changed_from_ip = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP de Modificación")
+    action_type = models.CharField(max_length=20, choices=RequestHistory.ACTION_CHOICES, default='updated', verbose_name="Tipo de Acción")
+    changes = models.JSONField(default=list, blank=True, verbose_name="Cambios")
+    action = models.TextField(blank=True, default='', verbose_name="Acción")
+
+    class Meta:
+        verbose_name = "Historial de Solicitud Archivada"
+        verbose_name_plural = "Historial de Solicitudes Archivadas"
+        ordering = ['-changed_at']
+        indexes = [
+            models.Index(fields=['action_type', 'changed_at'], name='archived_history_action_idx'),
+        ]
@@ -0,0 +1,42 @@
+"""
+Connection helpers for the CM_WEB Oracle schema.
+
+python-oracledb is only imported on first use, so web and Celery workers
+that never talk to Oracle do not pay for loading the driver.
+"""
+from django.conf import settings
+
+from .metrics import ORACLE_CONNECT_SECONDS, timed
+
+
+_client_initialized = False
+
+
+def get_driver():
+    """Returns the oracledb module, importing it on first call."""
+    import oracledb
+
+    return oracledb
+
+
+def get_dsn():
+    """Builds the Easy Connect string from the ORACLE_DB_* settings."""
+    return f"{settings.ORACLE_DB_HOST}:{settings.ORACLE_DB_PORT}/{settings.ORACLE_DB_SERVICE_NAME}"
+
+
+def get_connection():
+    """
+    Opens a new connection to Oracle in thick mode. The Oracle client is
+    initialized once per process.
+    """
+    global _client_initialized
+    oracledb = get_driver()
+    if not _client_initialized:
+        oracledb.init_oracle_client()
+        _client_initialized = True
+    with timed(ORACLE_CONNECT_SECONDS):
+        return oracledb.connect(
+            user=settings.ORACLE_DB_USER,
+            password=settings.ORACLE_DB_PASSWORD,
+            dsn=get_dsn(),
+        )
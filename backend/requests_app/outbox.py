@@ -0,0 +1,153 @@
+"""
+Transactional email outbox.
+
+enqueue_email() must be called inside the transaction that makes the change
+the email talks about: if that transaction rolls back, the email is never
+sent. After commit a single dispatcher run is scheduled (debounced through
+the cache), which sends every due message over the worker's shared SMTP
+connection. A periodic run from Celery beat (CELERY_BEAT_SCHEDULE) picks up
+whatever a lost schedule left behind, e.g. while the broker was down.
+"""
+import logging
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .email_templates import render_email
+from .mail import build_message, get_mailer
+from .models import EmailOutbox
+
+
+logger = logging.getLogger(__name__)
+
+
+DISPATCH_SCHEDULED_KEY = "email-outbox:dispatch-scheduled"
+
+
+def enqueue_email(message_key, template, subject, recipients, context):
+    """
+    Adds a message to the outbox unless one with the same message_key
+    already exists. Returns the EmailOutbox row.
+    """
+    message, created = EmailOutbox.objects.get_or_create(
+        message_key=message_key,
+        defaults={
+            "template": template,
+            "subject": subject,
+            "recipients": recipients,
+            "context": context,
+        },
+    )
+    if created:
+        # robust: the change has already committed, a broker error must not turn it into a 500
+        transaction.on_commit(schedule_dispatch, robust=True)
+    return message
+
+
+def schedule_dispatch(countdown=None):
+    """Publishes one dispatcher run unless one is already scheduled."""
+    if countdown is None:
+        countdown = settings.EMAIL_OUTBOX_DISPATCH_DELAY
+    try:
+        if not cache.add(DISPATCH_SCHEDULED_KEY, True, timeout=int(countdown) + 30):
+            return
+    except Exception as e:
+        # Without the cache we may publish a few extra runs, which is harmless
+        logger.warning("Email outbox dispatch debounce unavailable: %s", e)
+    try:
+        current_app.send_task("dispatch_email_outbox_task", countdown=countdown)
+    except Exception as e:
+        # Release the debounce so the next enqueue can schedule again; until
+        # then the periodic run from beat sends the pending messages
+        logger.warning("Could not schedule the email outbox dispatch: %s", e)
+        try:
+            cache.delete(DISPATCH_SCHEDULED_KEY)
+        except Exception:
+            pass
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size):
+    """
+    Marks up to batch_size due messages as 'Enviando' with a lease of
+    EMAIL_OUTBOX_LEASE_SECONDS and returns them. The row locks only last this
+    short transaction; a claim whose worker died is due again once the lease
+    expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(status="Pendiente") | Q(status="Enviando"), next_attempt_at__lte=now)
+            .order_by("id")[:batch_size]
+        )
+        EmailOutbox.objects.filter(id__in=[message.id for message in batch]).update(
+            status="Enviando",
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS),
+        )
+    return batch
+
+
+def _record(message, **fields):
+    # Only while our claim holds; each result is saved right after its send,
+    # so a later failure can't roll a delivered message back to pending
+    EmailOutbox.objects.filter(pk=message.pk, status="Enviando").update(**fields)
+
+
+def dispatch_pending(batch_size=None):
+    """
+    Sends up to batch_size due messages. Failed messages are retried with
+    exponential backoff and marked 'Fallido' after EMAIL_OUTBOX_MAX_ATTEMPTS.
+    Returns a summary dict.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    try:
+        cache.delete(DISPATCH_SCHEDULED_KEY)
+    except Exception:
+        pass
+
+    summary = {"sent": 0, "retried": 0, "dead": 0}
+    batch = claim_batch(batch_size)
+    mailer = get_mailer() if batch else None
+    for message in batch:
+        try:
+            body, html_body = render_email(message.template, **message.context)
+            mailer.send_messages([
+                build_message(message.subject, body, message.recipients, html_body=html_body)
+            ])
+        except Exception as e:
+            attempts = message.attempts + 1
+            if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                # Nothing will send it anymore, so its passwords go too
+                _record(message, status="Fallido", attempts=attempts, last_error=str(e), context={})
+                summary["dead"] += 1
+                logger.error("Email %s moved to dead letter after %s attempts: %s", message.message_key, attempts, e)
+            else:
+                _record(
+                    message, status="Pendiente", attempts=attempts, last_error=str(e),
+                    next_attempt_at=timezone.now() + _retry_delay(attempts),
+                )
+                summary["retried"] += 1
+            continue
+        # The context can hold generated passwords; drop it once delivered
+        _record(message, status="Enviado", sent_at=timezone.now(), last_error=None, context={})
+        summary["sent"] += 1
+
+    # Keep draining, or come back when the earliest retry is due
+    if len(batch) == batch_size:
+        schedule_dispatch(countdown=0)
+    else:
+        next_attempt = EmailOutbox.objects.filter(status__in=["Pendiente", "Enviando"]).aggregate(
+            next_at=Min("next_attempt_at")
+        )["next_at"]
+        if next_attempt is not None:
+            schedule_dispatch(countdown=max((next_attempt - timezone.now()).total_seconds(), 0))
+    return summary
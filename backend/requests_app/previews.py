@@ -0,0 +1,136 @@
+"""
+Thumbnails and first-page previews of image and PDF attachments.
+
+Both are JPEGs stored next to the content-addressed file
+(<sha256>.thumb.jpg and <sha256>.preview.jpg), so a document attached to
+several requests is rendered once. Pillow and pypdfium2 are imported on
+first use: only the worker that renders previews pays for them.
+"""
+import logging
+import os
+from io import BytesIO
+from pathlib import Path
+
+from celery import current_app
+from django.conf import settings
+
+from .attachments import content_path
+from .models import Attachment
+
+
+logger = logging.getLogger(__name__)
+
+
+PDF_CONTENT_TYPES = {"application/pdf", "application/x-pdf"}
+
+
+def has_preview(content_type):
+    content_type = content_type or ""
+    return content_type.startswith("image/") or content_type in PDF_CONTENT_TYPES
+
+
+def thumbnail_path(sha256):
+    return f"{content_path(sha256)}.thumb.jpg"
+
+
+def preview_path(sha256):
+    return f"{content_path(sha256)}.preview.jpg"
+
+
+def _open_image(path):
+    from PIL import Image, ImageOps
+
+    image = Image.open(path)
+    # JPEG decoders can downscale while decoding, far cheaper than a full decode
+    image.draft("RGB", (settings.ATTACHMENT_PREVIEW_SIZE, settings.ATTACHMENT_PREVIEW_SIZE))
+    return ImageOps.exif_transpose(image)
+
+
+def _render_pdf_page(path):
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        page = pdf[0]
+        scale = settings.ATTACHMENT_PREVIEW_SIZE / max(page.get_size())
+        return page.render(scale=scale).to_pil()
+    finally:
+        pdf.close()
+
+
+def _to_jpeg(image, size):
+    from PIL import Image
+
+    image = image.copy()
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if image.mode != "RGB":
+        # Transparent areas on white, as they look in a viewer
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    out = BytesIO()
+    image.save(out, "JPEG", quality=settings.ATTACHMENT_PREVIEW_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def render_previews(attachment):
+    """
+    Writes the thumbnail and preview of an attachment unless its content
+    already has them, and records them on the row. Returns False when the
+    type has no preview.
+    """
+    if not has_preview(attachment.content_type) or not attachment.sha256:
+        return False
+    media_root = Path(settings.MEDIA_ROOT)
+    thumbnail, preview = thumbnail_path(attachment.sha256), preview_path(attachment.sha256)
+
+    if not ((media_root / thumbnail).exists() and (media_root / preview).exists()):
+        source = media_root / attachment.file.name
+        if attachment.content_type in PDF_CONTENT_TYPES:
+            image = _render_pdf_page(str(source))
+        else:
+            image = _open_image(source)
+        for name, size in ((preview, settings.ATTACHMENT_PREVIEW_SIZE), (thumbnail, settings.ATTACHMENT_THUMBNAIL_SIZE)):
+            target = media_root / name
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(_to_jpeg(image, size))
+            tmp.replace(target)
+
+    attachment.thumbnail.name = thumbnail
+    attachment.preview.name = preview
+    attachment.save(update_fields=["thumbnail", "preview"])
+    return True
+
+
+def generate_previews(attachment_ids):
+    """Renders the missing previews of the given attachments. Returns a summary dict."""
+    summary = {"rendered": 0, "skipped": 0, "failed": 0}
+    attachments = Attachment.objects.filter(id__in=attachment_ids, status="Descargado", preview="")
+    for attachment in attachments:
+        try:
+            summary["rendered" if render_previews(attachment) else "skipped"] += 1
+        except Exception as e:
+            # A corrupt or encrypted file just stays without preview
+            summary["failed"] += 1
+            logger.warning("No se pudo generar la vista previa del adjunto %s: %s", attachment.pk, e)
+    return summary
+
+
+def missing_previews(request_ids=None):
+    """Mirrored attachments without previews, of the given requests or all."""
+    attachments = Attachment.objects.filter(status="Descargado", preview="").only("id", "content_type")
+    if request_ids is not None:
+        attachments = attachments.filter(user_request_id__in=request_ids)
+    return attachments
+
+
+def schedule_previews(attachments):
+    """Publishes a generate_previews_task for the attachments that can have one."""
+    attachment_ids = [attachment.id for attachment in attachments if has_preview(attachment.content_type)]
+    if not attachment_ids:
+        return
+    try:
+        current_app.send_task("generate_previews_task", args=(attachment_ids,))
+    except Exception as e:
+        logger.warning("No se pudo encolar la generación de vistas previas de %s: %s", attachment_ids, e)
@@ -0,0 +1,199 @@
+"""
+Provisioning of CM_WEB.WEB_USER / CM_WEB.RE_USER_ROLE rows for completed requests.
+"""
+import hashlib
+import logging
+import random
+import re
+import string
+import time
+import unicodedata
+import uuid
+from typing import TYPE_CHECKING
+
+from .metrics import ORACLE_PROVISIONING_SECONDS, ORACLE_USERS_PROVISIONED, record_timing
+from .oracle import get_connection, get_driver
+from .user_cod_index import get_user_cod_index
+
+if TYPE_CHECKING:
+    import oracledb
+
+
+logger = logging.getLogger(__name__)
+
+
+# Number of USER_COD candidates tried before giving up on a WEB_USER insert
+USER_COD_INSERT_ATTEMPTS = 3
+
+# REC_TIM is the insert time: the incremental refresh of user_cod_index.py
+# finds new codes by it, so it must not be back-dated to the request's date
+INSERT_USER_SQL = """
+INSERT INTO CM_WEB.WEB_USER (
+    USER_COD, USER_NAM, COMPANY_COD, TELEPHONE, USER_PWD, EMAIL, ADDRESS, REPEAT_COUNT, REC_TIM, REC_NAM
+) VALUES (
+    :user_cod, :user_nam, :company_cod, :telephone, :user_pwd, :email, :address, :repeat_count, SYSDATE, :rec_nam
+)
+"""
+
+INSERT_ROLE_SQL = """
+INSERT INTO CM_WEB.RE_USER_ROLE (ID, USER_COD, ROLE_COD) VALUES (:id, :user_cod, :role_cod)
+"""
+
+
+def generate_user_cod(contact_name: str, cursor: "oracledb.Cursor") -> str:
+    """
+    Generates a unique user code from a contact name, ensuring it is uppercase,
+    contains no special characters or accents, and does not already exist in the Oracle database.
+    """
+    oracledb = get_driver()
+
+    # Normalize string: remove accents, convert to uppercase, and remove special characters
+    nfkd_form = unicodedata.normalize('NFKD', contact_name)
+    ascii_name = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+    
+    parts = ascii_name.split()
+    if not parts:
+        return "" # Should not happen if contact_name is mandatory
+
+    first_name = parts[0]
+    last_name_initials = ""
+    if len(parts) > 1:
+        for part in parts[1:]:
+            if part:
+                last_name_initials += part[0]
+    
+    base_code = re.sub(r'[^A-Z0-9]', '', (first_name + last_name_initials).upper())
+    
+    counter = 0
+
+    # Consult the per-process index first so Oracle only confirms the final choice
+    index = get_user_cod_index()
+    if index is not None:
+        try:
+            index.refresh(cursor)
+        except oracledb.Error as e:
+            error_obj, = e.args
+            logger.error("Oracle DB error while refreshing USER_COD index: %s", error_obj.message)
+            index = None
+
+    # Check for uniqueness in Oracle DB
+    while True:
+        if index is not None:
+            user_code, counter = index.next_free(base_code, counter)
+        else:
+            user_code = base_code if counter == 0 else f"{base_code}{counter}"
+        try:
+            cursor.execute("SELECT 1 FROM CM_WEB.WEB_USER WHERE USER_COD = :user_cod", {'user_cod': user_code})
+            if cursor.fetchone() is None:
+                # Code is unique
+                return user_code
+            else:
+                # Code exists, generate a new one
+                if index is not None:
+                    index.add(user_code)
+                counter += 1
+        except oracledb.Error as e:
+            # Handle potential DB errors during check
+            error_obj, = e.args
+            logger.error("Oracle DB error while checking user_code uniqueness: %s", error_obj.message)
+            # As a fallback, return a potentially non-unique code with a random suffix
+            # to avoid an infinite loop in case of persistent DB issues.
+            return f"{base_code}{uuid.uuid4().hex[:4].upper()}"
+
+
+def provision_oracle_users(user_request, persons):
+    """
+    Inserts a WEB_USER row, plus one RE_USER_ROLE row per customer role, for
+    each authorized person of a completed request.
+
+    This is blocking driver code (thick mode is required for the 11g server),
+    so async views must run it in a worker thread. Returns the created users
+    as [{'user': USER_COD, 'pass_user': plain password}] for the welcome email.
+    """
+    oracledb = get_driver()
+    created_users = []
+    if not user_request.customer_code:  # Only proceed if customer_code is available
+        logger.warning("customer_code is empty, skipping Oracle insertion for authorized persons of request %s.", user_request.id)
+        return created_users
+
+    connection = None
+    cursor = None
+    start = time.perf_counter()
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+
+        # Insert each authorized person into Oracle DB
+        user_cod_index = get_user_cod_index()
+        for person in persons:
+            password = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
+            password_hash = hashlib.md5(password.encode()).hexdigest()
+            try:
+                # The WEB_USER primary key is the safety net: if another
+                # worker took the code in the meantime, pick the next one.
+                for attempt in range(USER_COD_INSERT_ATTEMPTS):
+                    generated_user_cod = generate_user_cod(person.name, cursor)
+                    try:
+                        cursor.execute(INSERT_USER_SQL, {
+                            'user_cod': generated_user_cod,
+                            'user_nam': person.name,
+                            'company_cod': user_request.customer_code,
+                            'telephone': person.phone,
+                            'user_pwd': password_hash,
+                            'email': person.email,
+                            'address': user_request.address,
+                            'repeat_count': 10,
+                            'rec_nam': 'SYSTEM WEB'
+                        })
+                        break
+                    except oracledb.IntegrityError:
+                        if user_cod_index is not None:
+                            user_cod_index.add(generated_user_cod)
+                        if attempt == USER_COD_INSERT_ATTEMPTS - 1:
+                            raise
+                if user_cod_index is not None:
+                    user_cod_index.add(generated_user_cod)
+                logger.debug("Inserted authorized person %s (%s) for request %s into WEB_USER.", person.name, generated_user_cod, user_request.id)
+
+                # Add user to list for email
+                created_users.append({'user': generated_user_cod, 'pass_user': password})
+                ORACLE_USERS_PROVISIONED.labels('created').inc()
+
+                # Insert into RE_USER_ROLE for each customer_role
+                if user_request.customer_role:
+                    for role in user_request.customer_role:
+                        try:
+                            cursor.execute(INSERT_ROLE_SQL, {
+                                'id': uuid.uuid4().hex,
+                                'user_cod': generated_user_cod,
+                                'role_cod': role
+                            })
+                            logger.debug("Inserted role %s for user %s into RE_USER_ROLE.", role, generated_user_cod)
+                        except oracledb.Error as e:
+                            error_obj, = e.args
+                            logger.error("Error inserting role %s for user %s into RE_USER_ROLE: %s", role, generated_user_cod, error_obj.message)
+                else:
+                    logger.warning("No customer roles found for request %s, skipping RE_USER_ROLE insertion for user %s.", user_request.id, generated_user_cod)
+            except oracledb.Error as e:
+                error_obj, = e.args
+                ORACLE_USERS_PROVISIONED.labels('failed').inc()
+                logger.error("Error inserting authorized person %s into Oracle DB: %s", person.name, error_obj.message)
+        connection.commit()
+        logger.info("Provisioned %s of %s authorized persons for request %s in Oracle.", len(created_users), len(persons), user_request.id)
+
+    except oracledb.Error as e:
+        error_obj, = e.args
+        logger.error("Error inserting into Oracle DB: %s", error_obj.message)
+        # The request stays saved: the error is only logged, nothing is retried
+    except Exception:
+        logger.exception("An unexpected error occurred during Oracle insertion")
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+        elapsed = time.perf_counter() - start
+        ORACLE_PROVISIONING_SECONDS.observe(elapsed)
+        record_timing('oracle', elapsed)
+
+    return created_users
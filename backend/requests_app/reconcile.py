@@ -0,0 +1,189 @@
+"""
+Audit of completed requests against CM_WEB.WEB_USER / CM_WEB.RE_USER_ROLE.
+
+Completed requests are streamed from Postgres in chunks; for each chunk the
+matching Oracle rows are pulled in one query keyed by COMPANY_COD and the
+comparison is done in memory.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import UserRequest
+from .oracle import get_connection
+
+
+# Oracle does not accept more than 1000 expressions in an IN list
+MAX_IN_LIST = 1000
+
+COMPANY_USERS_SQL = """
+SELECT u.COMPANY_COD, u.USER_COD, UPPER(TRIM(u.USER_NAM)), LOWER(TRIM(u.EMAIL)), r.ROLE_COD
+FROM CM_WEB.WEB_USER u
+LEFT JOIN CM_WEB.RE_USER_ROLE r ON r.USER_COD = u.USER_COD
+WHERE u.COMPANY_COD IN ({binds})
+"""
+
+USERS_BY_NAME_SQL = """
+SELECT u.COMPANY_COD, u.USER_COD, UPPER(TRIM(u.USER_NAM))
+FROM CM_WEB.WEB_USER u
+WHERE UPPER(TRIM(u.USER_NAM)) IN ({binds})
+"""
+
+
+def _in_clause(values, prefix):
+    binds = ", ".join(f":{prefix}{i}" for i in range(len(values)))
+    params = {f"{prefix}{i}": value for i, value in enumerate(values)}
+    return binds, params
+
+
+def _fetch_company_users(cursor, company_codes):
+    """
+    Returns {COMPANY_COD: {USER_COD: {'name', 'email', 'roles'}}} for the
+    given companies.
+    """
+    binds, params = _in_clause(company_codes, "c")
+    cursor.execute(COMPANY_USERS_SQL.format(binds=binds), params)
+    companies = defaultdict(dict)
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        for company_cod, user_cod, user_nam, email, role_cod in rows:
+            user = companies[company_cod].setdefault(
+                user_cod, {'name': user_nam, 'email': email, 'roles': set()}
+            )
+            if role_cod:
+                user['roles'].add(role_cod)
+    return companies
+
+
+def _fetch_users_by_name(cursor, names):
+    """Returns {USER_NAM: [(COMPANY_COD, USER_COD), ...]} across all companies."""
+    found = defaultdict(list)
+    names = sorted(names)
+    for start in range(0, len(names), MAX_IN_LIST):
+        binds, params = _in_clause(names[start:start + MAX_IN_LIST], "n")
+        cursor.execute(USERS_BY_NAME_SQL.format(binds=binds), params)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for company_cod, user_cod, user_nam in rows:
+                found[user_nam].append((company_cod, user_cod))
+    return found
+
+
+def _match_person(person, users):
+    """Finds the WEB_USER row of a company that corresponds to an AuthorizedPerson."""
+    name = (person.name or "").strip().upper()
+    email = (person.email or "").strip().lower()
+    for user_cod, user in users.items():
+        if user['name'] == name:
+            return user_cod, user
+    if email:
+        for user_cod, user in users.items():
+            if user['email'] == email:
+                return user_cod, user
+    return None, None
+
+
+def _reconcile_chunk(cursor, requests_chunk, report):
+    company_codes = sorted({r.customer_code for r in requests_chunk})
+    companies = _fetch_company_users(cursor, company_codes)
+    missing = []
+
+    for user_request in requests_chunk:
+        users = companies.get(user_request.customer_code, {})
+        expected_roles = set(user_request.customer_role or [])
+        report['requests_checked'] += 1
+        for person in user_request.authorized_persons.all():
+            report['persons_checked'] += 1
+            user_cod, user = _match_person(person, users)
+            if user is None:
+                missing.append((user_request, person))
+                continue
+            report['persons_ok'] += 1
+            if user['roles'] != expected_roles:
+                report['issues'].append({
+                    'type': 'roles_mismatch',
+                    'request_id': user_request.id,
+                    'customer_code': user_request.customer_code,
+                    'person': person.name,
+                    'user_cod': user_cod,
+                    'missing_roles': sorted(expected_roles - user['roles']),
+                    'extra_roles': sorted(user['roles'] - expected_roles),
+                })
+
+    if not missing:
+        return
+
+    # Persons not found under their company: look them up by name in any company
+    elsewhere = _fetch_users_by_name(
+        cursor, {(person.name or "").strip().upper() for _, person in missing}
+    )
+    for user_request, person in missing:
+        matches = elsewhere.get((person.name or "").strip().upper(), [])
+        issue = {
+            'request_id': user_request.id,
+            'customer_code': user_request.customer_code,
+            'person': person.name,
+        }
+        if matches:
+            issue['type'] = 'wrong_company'
+            issue['found_in'] = [
+                {'company_cod': company_cod, 'user_cod': user_cod}
+                for company_cod, user_cod in matches
+            ]
+        else:
+            issue['type'] = 'missing_user'
+        report['issues'].append(issue)
+
+
+def reconcile_completed_requests(chunk_size=None, arraysize=None):
+    """
+    Checks every AuthorizedPerson of the active 'Completado' requests against
+    Oracle and returns a report dict with counters and the list of issues.
+    """
+    chunk_size = min(chunk_size or settings.RECONCILE_CHUNK_SIZE, MAX_IN_LIST)
+    arraysize = arraysize or settings.RECONCILE_ARRAYSIZE
+    start = time.perf_counter()
+    report = {
+        'requests_checked': 0,
+        'persons_checked': 0,
+        'persons_ok': 0,
+        'requests_without_code': 0,
+        'issues': [],
+    }
+
+    completed = UserRequest.objects.filter(active=True, status="Completado")
+    report['requests_without_code'] = completed.filter(Q(customer_code__isnull=True) | Q(customer_code="")).count()
+    qs = (
+        completed.exclude(customer_code__isnull=True)
+        .exclude(customer_code="")
+        .only("id", "customer_code", "customer_role")
+        .prefetch_related("authorized_persons")
+        .order_by("id")
+    )
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    cursor.arraysize = arraysize
+    cursor.prefetchrows = arraysize + 1
+    try:
+        chunk = []
+        for user_request in qs.iterator(chunk_size=chunk_size):
+            chunk.append(user_request)
+            if len(chunk) >= chunk_size:
+                _reconcile_chunk(cursor, chunk, report)
+                chunk = []
+        if chunk:
+            _reconcile_chunk(cursor, chunk, report)
+    finally:
+        cursor.close()
+        connection.close()
+
+    report['issue_count'] = len(report['issues'])
+    report['duration_seconds'] = round(time.perf_counter() - start, 3)
+    return report
@@ -0,0 +1,163 @@
+"""
+Read replica routing.
+
+With REPLICA_POSTGRES_HOST set, DATABASES gains a 'replica' alias and
+ReplicaRouter sends the reads of GET/HEAD requests there. Everything else
+(writes, reads of other methods, Celery tasks, commands) uses 'default'.
+Reads go back to 'default':
+
+- for REPLICA_PIN_SECONDS after the user last wrote, so they see their
+  own changes (the pin is in the shared cache, all workers honour it);
+- for the rest of a request once it has written, e.g. the WP sync of
+  list_requests;
+- while the replica lags more than REPLICA_MAX_LAG_SECONDS or can't be
+  reached. The lag is checked at most every REPLICA_LAG_CHECK_SECONDS per
+  process.
+"""
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .metrics import REPLICA_FALLBACKS
+
+
+logger = logging.getLogger(__name__)
+
+
+REPLICA = "replica"
+PRIMARY = "default"
+
+_routing = contextvars.ContextVar("db_routing", default=None)
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def _pin_key(user_id):
+    return f"db:pin:{user_id}"
+
+
+class RoutingState:
+    """What the router needs to know about the current request."""
+
+    def __init__(self, request):
+        self.request = request
+        self.read_only = request.method in ("GET", "HEAD")
+        self.wrote = False
+        self.pinned = None
+
+    def user_id(self):
+        # Set by ninja once the token is authenticated
+        return getattr(getattr(self.request, "auth", None), "pk", None)
+
+    def is_pinned(self):
+        if self.pinned is None:
+            user_id = self.user_id()
+            if user_id is None:
+                # Not authenticated yet, e.g. the query resolving the token's user
+                return False
+            try:
+                self.pinned = bool(cache.get(_pin_key(user_id)))
+            except Exception:
+                self.pinned = True
+        return self.pinned
+
+
+def start_routing(request):
+    return _routing.set(RoutingState(request))
+
+
+def finish_routing(token):
+    state = _routing.get()
+    _routing.reset(token)
+    return state
+
+
+def pin_after_write(state, response):
+    """Pins the user to the primary if their request changed data."""
+    if state is None or state.read_only or not state.wrote or response.status_code >= 400:
+        return
+    user_id = state.user_id()
+    if user_id is None:
+        return
+    try:
+        cache.set(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+    except Exception as e:
+        logger.warning("Could not pin user %s to the primary database: %s", user_id, e)
+
+
+class ReplicaLag:
+    """The replica's replication lag, checked at most every REPLICA_LAG_CHECK_SECONDS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = 0.0
+        self.healthy = False
+
+    def measure(self):
+        """Seconds behind the primary; raises if the replica can't be queried."""
+        with connections[REPLICA].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0])
+
+    def is_healthy(self):
+        if time.monotonic() - self.checked_at < settings.REPLICA_LAG_CHECK_SECONDS:
+            return self.healthy
+        with self.lock:
+            if time.monotonic() - self.checked_at >= settings.REPLICA_LAG_CHECK_SECONDS:
+                self.healthy = self._check()
+                self.checked_at = time.monotonic()
+        return self.healthy
+
+    def _check(self):
+        try:
+            lag = self.measure()
+        except Exception as e:
+            REPLICA_FALLBACKS.labels("unavailable").inc()
+            logger.warning("Replica unavailable, reading from the primary: %s", e)
+            return False
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            REPLICA_FALLBACKS.labels("lag").inc()
+            logger.warning("Replica %.1fs behind, reading from the primary", lag)
+            return False
+        return True
+
+
+replica_lag = ReplicaLag()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.read_only or state.wrote or not replica_configured():
+            return PRIMARY
+        if state.is_pinned() or not replica_lag.is_healthy():
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -1,6 +1,11 @@
+from django.conf import settings
+from django.urls import reverse
 from ninja import Schema
 from datetime import datetime
-from typing import Optional, List
+from uuid import UUID
+from typing import Any, Optional, List
+
+from .history import render_action
 
 
 # -----------------------------
@@ -30,21 +35,92 @@ class AuthorizedPersonCreateSchema(Schema):
 # -----------------------------
 # History
 # -----------------------------
+class HistoryChangeSchema(Schema):
+    field: str
+    old: Any = None
+    new: Any = None
+
+
 class RequestHistorySchema(Schema):
     id: int
+    action_type: str
     action: str
+    changes: List[HistoryChangeSchema] = []
     changed_at: datetime
     changed_by_username: Optional[str] = None
     changed_from_ip: Optional[str] = None
 
+    @staticmethod
+    def resolve_action(obj):
+        return render_action(obj)
+
     @staticmethod
     def resolve_changed_by_username(obj):
         return obj.changed_by.username if obj.changed_by else "System"
 
 
+# -----------------------------
+# Attachments
+# -----------------------------
+class AttachmentSchema(Schema):
+    id: int
+    original_filename: Optional[str] = None
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    status: str
+    url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+
+    @staticmethod
+    def resolve_url(obj):
+        # Local copy once mirrored, the WP original until then
+        if obj.status == "Descargado":
+            return reverse("api-1.0.0:download_attachment", args=[obj.user_request_id, obj.id])
+        return obj.source_url
+
+    @staticmethod
+    def resolve_thumbnail_url(obj):
+        if not obj.thumbnail:
+            return None
+        return reverse("api-1.0.0:attachment_preview", args=[obj.user_request_id, obj.id, "thumbnail"])
+
+    @staticmethod
+    def resolve_preview_url(obj):
+        if not obj.preview:
+            return None
+        return reverse("api-1.0.0:attachment_preview", args=[obj.user_request_id, obj.id, "preview"])
+
+
+class AttachmentUploadCreateSchema(Schema):
+    filename: str
+    size: int
+    sha256: str
+    content_type: Optional[str] = None
+
+
+class AttachmentUploadSchema(Schema):
+    id: UUID
+    filename: str
+    size: int
+    received: int
+    chunk_size: int
+
+    @staticmethod
+    def resolve_chunk_size(obj):
+        return settings.ATTACHMENT_UPLOAD_MAX_CHUNK
+
+
 # -----------------------------
 # User Requests
 # -----------------------------
+class DuplicateCandidateSchema(Schema):
+    id: int
+    score: float
+    reasons: List[str]
+
+
 class UserRequestListSchema(Schema):
     id: int
     company_name: str
@@ -66,6 +142,7 @@ class UserRequestListSchema(Schema):
     uploaded_files: List[str] = []
     customer_code: Optional[str] = None
     notes: Optional[str] = None
+    duplicate_score: Optional[float] = None
 
 
     @staticmethod
@@ -76,16 +153,41 @@ class UserRequestListSchema(Schema):
 class UserRequestSchema(UserRequestListSchema):
     history: List[RequestHistorySchema] = []
     authorized_persons: List[AuthorizedPersonSchema] = []
+    attachments: List[AttachmentSchema] = []
+    duplicate_candidates: List[DuplicateCandidateSchema] = []
 
     @staticmethod
     def resolve_history(obj):
         return obj.history.all()
 
+    @staticmethod
+    def resolve_attachments(obj):
+        return obj.attachments.all()
+
     @staticmethod
     def resolve_authorized_persons(obj):
         return obj.authorized_persons.all()
 
 
+class ArchivedRequestSchema(Schema):
+    id: int
+    company_name: str
+    email: str
+    tax_id: str
+    customer_code: Optional[str] = None
+    status: Optional[str] = None
+    active: bool
+    created_at: datetime
+    archived_at: datetime
+    # Every field of the request plus its authorized_persons and attachments
+    data: dict
+    history: List[RequestHistorySchema] = []
+
+    @staticmethod
+    def resolve_history(obj):
+        return obj.history.all()
+
+
 # -----------------------------
 # Create & Update
 # -----------------------------
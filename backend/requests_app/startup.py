@@ -0,0 +1,78 @@
+"""
+Import-time measurement of a cold worker start.
+
+Each measurement runs in a fresh interpreter with 'python -X importtime',
+so nothing already imported by the caller hides the real cost.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+
+# What each kind of worker imports before it can serve its first request/task
+STARTUP_SCRIPTS = {
+    "web": (
+        "import django; django.setup(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns"
+    ),
+    "celery": (
+        "import django; django.setup(); "
+        "from core.celery import app; app.loader.import_default_modules()"
+    ),
+}
+
+# Modules that must only be imported when first used
+LAZY_MODULES = ("oracledb", "httpx", "PIL", "pypdfium2")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{script}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _parse_importtime(stderr):
+    """Returns {module: cumulative seconds} for the top-level imports in -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        modules[name.strip()] = max(modules.get(name.strip(), 0), int(cumulative) / 1e6)
+    return modules
+
+
+def measure_startup(target="web", settings_module=None):
+    """
+    Starts a fresh interpreter, runs the startup of target ('web' or
+    'celery') and returns a dict with the elapsed seconds, the slowest
+    imports and which LAZY_MODULES got loaded anyway.
+    """
+    env = dict(os.environ)
+    env["DJANGO_SETTINGS_MODULE"] = settings_module or os.environ.get("DJANGO_SETTINGS_MODULE", "core.settings")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(script=STARTUP_SCRIPTS[target])],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{target} startup failed:\n{completed.stderr[-2000:]}")
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    imports = _parse_importtime(completed.stderr)
+    return {
+        "target": target,
+        "seconds": result["seconds"],
+        "slowest_imports": sorted(imports.items(), key=lambda item: item[1], reverse=True),
+        "lazy_modules_loaded": [name for name in LAZY_MODULES if name in result["modules"]],
+    }
@@ -1,8 +1,19 @@
-import os
+import logging
+
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.models import User
+from .reconcile import reconcile_completed_requests
+from .mail import build_message, get_mailer, send_email
+from .email_templates import EmailTemplateError, format_users_section, render_email
+from .outbox import dispatch_pending
+from .attachments import mirror_pending
+from .previews import generate_previews, missing_previews, schedule_previews
+from .archive import archive_requests
+
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task(name="send_2fa_email_task")
 def send_2fa_email_task(user_id, code):
@@ -13,19 +24,17 @@ def send_2fa_email_task(user_id, code):
         user = User.objects.get(id=user_id)
         subject = 'Código 2FA Clientes'
         message = f'Su código 2FA es: {code}'
-        from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [user.email]
         
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+        send_email(subject, message, recipient_list)
         
         return f"2FA email sent to {user.email}"
     except User.DoesNotExist:
         return f"User with id {user_id} not found."
-    except Exception as e:
-        # It's good practice to log the exception
-        print(f"Failed to send 2FA email to user {user_id}: {e}")
+    except Exception:
+        logger.exception("Failed to send 2FA email to user %s", user_id)
         # Optionally re-raise the exception if you want the task to be marked as 'FAILED'
-        # raise e
+        # raise
         return f"Failed to send email for user {user_id}."
 
 
@@ -39,68 +48,127 @@ def send_welcome_email_task(company_name, user_code, users, recipient_email):
     - recipient_email: Email address of the recipient
     """
     try:
-        # Construct the path to the template file
-        template_path = os.path.join(settings.BASE_DIR, 'requests_app', 'templates', 'requests_app', 'welcome_email.txt')
-
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-
-        # Create the string for users and passwords
-        users_section = ""
-        for user_info in users:
-            users_section += f"{user_info['user']:<12}{user_info['pass_user']}\n"
-
-        # Replace placeholders in the template
-        body = template_content.format(
+        body, html_body = render_email(
+            'welcome_email',
             company_name=company_name,
             user_code=user_code,
-            users_section=users_section
+            users_section=format_users_section(users)
         )
 
         subject = f'Alta de cliente: {company_name}'
-        from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [recipient_email]
 
-        send_mail(subject, body, from_email, recipient_list, fail_silently=False)
+        send_email(subject, body, recipient_list, html_body=html_body)
 
         return f"Welcome email sent to {recipient_email}"
-    except FileNotFoundError:
-        error_message = f"Email template not found at {template_path}"
-        print(error_message)
+    except EmailTemplateError as e:
+        error_message = str(e)
+        logger.error(error_message)
         return error_message
     except Exception as e:
         error_message = f"Failed to send welcome email to {recipient_email}: {e}"
-        print(error_message)
+        logger.exception(error_message)
         return error_message
 
+
 @shared_task(name="send_rejection_email_task")
 def send_rejection_email_task(company_name, rejection_reason, recipient_email):
     """
     Sends a rejection email to the user.
     """
     try:
-        template_path = os.path.join(settings.BASE_DIR, 'requests_app', 'templates', 'requests_app', 'reject_email.txt')
-
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-
-        body = template_content.format(
+        body, html_body = render_email(
+            'reject_email',
             company_name=company_name,
             rejection_reason=rejection_reason
         )
 
         subject = f'Solicitud Rechazada: {company_name}'
-        from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [recipient_email]
 
-        send_mail(subject, body, from_email, recipient_list, fail_silently=False)
+        send_email(subject, body, recipient_list, html_body=html_body)
 
         return f"Rejection email sent to {recipient_email}"
-    except FileNotFoundError:
-        error_message = f"Email template not found at {template_path}"
-        print(error_message)
+    except EmailTemplateError as e:
+        error_message = str(e)
+        logger.error(error_message)
         return error_message
     except Exception as e:
         error_message = f"Failed to send rejection email to {recipient_email}: {e}"
-        print(error_message)
-        return error_message
\ No newline at end of file
+        logger.exception(error_message)
+        return error_message
+
+
+@shared_task(name="send_email_batch_task")
+def send_email_batch_task(messages):
+    """
+    Sends several queued messages over the worker's shared SMTP connection.
+    - messages: a list of dicts with 'subject', 'body' and 'to' (list of addresses)
+    """
+    try:
+        sent = get_mailer().send_messages([
+            build_message(message['subject'], message['body'], message['to'])
+            for message in messages
+        ])
+        return f"{sent} of {len(messages)} emails sent"
+    except Exception as e:
+        error_message = f"Failed to send email batch: {e}"
+        logger.exception(error_message)
+        return error_message
+
+
+@shared_task(name="dispatch_email_outbox_task")
+def dispatch_email_outbox_task():
+    """
+    Sends the due messages of the email outbox in one batch over the
+    worker's shared SMTP connection.
+    """
+    summary = dispatch_pending()
+    if summary['sent'] or summary['retried'] or summary['dead']:
+        logger.info("Email outbox dispatched", extra=summary)
+    return summary
+
+
+@shared_task(name="reconcile_web_users_task", ignore_result=False)
+def reconcile_web_users_task(chunk_size=None):
+    """
+    Audits completed requests against CM_WEB.WEB_USER and returns a summary.
+    The full list of issues is logged so it ends up in the worker log.
+    """
+    report = reconcile_completed_requests(chunk_size=chunk_size)
+    for issue in report['issues']:
+        logger.warning("Reconciliation issue", extra={"issue": issue})
+    return {key: value for key, value in report.items() if key != 'issues'}
+
+
+@shared_task(name="mirror_attachments_task", bind=True)
+def mirror_attachments_task(self, request_ids=None):
+    """
+    Mirrors the uploaded files of the given requests into MEDIA_ROOT. While
+    downloads are left to retry, the task schedules itself again with
+    exponential backoff.
+    """
+    summary = mirror_pending(request_ids)
+    if summary['downloaded'] or summary['retry'] or summary['failed']:
+        logger.info("Attachments mirrored", extra=summary)
+    if summary['downloaded'] or summary['deduplicated']:
+        schedule_previews(missing_previews(request_ids))
+    if summary['retry']:
+        countdown = settings.ATTACHMENT_RETRY_BASE_SECONDS * 2 ** self.request.retries
+        self.retry(args=(request_ids,), countdown=countdown, max_retries=settings.ATTACHMENT_MAX_ATTEMPTS)
+    return summary
+
+
+@shared_task(name="generate_previews_task")
+def generate_previews_task(attachment_ids):
+    """Renders the thumbnail and first-page preview of image and PDF attachments."""
+    summary = generate_previews(attachment_ids)
+    if summary['rendered'] or summary['failed']:
+        logger.info("Attachment previews generated", extra=summary)
+    return summary
+
+
+@shared_task(name="archive_requests_task")
+def archive_requests_task(older_than_days=None):
+    """Moves closed, idle and soft-deleted requests to the archive tables."""
+    return archive_requests(older_than_days=older_than_days)
@@ -1,3 +1,556 @@
-from django.test import TestCase
+import hashlib
+import io
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from ninja_jwt.tokens import RefreshToken
+
+from . import outbox
+from .benchmark.stubs import FakeOracle
+from .authentication import resolve_user
+from .two_factor import EXPIRED, INVALID, LOCKED, VALID, RedisTwoFactorStore
+
+from .downloads import parse_range
+from .history import PERSONS_FIELD, action_type_for, apply_changes, render_action
+from .models import Attachment, AttachmentUpload, AuthorizedPerson, EmailOutbox, RequestHistory, TwoFactorAuth, UserRequest
+from .startup import measure_startup
+from .throttling import SlidingWindowLimiter
+from .provisioning import provision_oracle_users
+from .user_cod_index import UserCodIndex
+from .uploads import OffsetMismatch, UploadError, append_chunk, finalize_upload, part_path, start_upload
+
+
+class StartupTimeTests(SimpleTestCase):
+    """Cold start of web and Celery workers stays within STARTUP_IMPORT_BUDGET_SECONDS."""
+
+    def assert_startup_within_budget(self, target):
+        result = measure_startup(target)
+        self.assertEqual(result["lazy_modules_loaded"], [], f"{target} imports lazy modules at startup")
+        slowest = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in result["slowest_imports"][:5])
+        self.assertLessEqual(
+            result["seconds"], settings.STARTUP_IMPORT_BUDGET_SECONDS,
+            f"{target} startup took {result['seconds']:.3f}s; slowest imports: {slowest}",
+        )
+
+    def test_web_startup(self):
+        self.assert_startup_within_budget("web")
+
+    def test_celery_startup(self):
+        self.assert_startup_within_budget("celery")
+
+
+class ParseRangeTests(SimpleTestCase):
+    SIZE = 1000
+
+    def test_closed_range(self):
+        self.assertEqual(parse_range("bytes=0-99", self.SIZE), (0, 99))
+
+    def test_end_is_clamped_to_the_file(self):
+        self.assertEqual(parse_range("bytes=900-5000", self.SIZE), (900, 999))
+
+    def test_open_ended(self):
+        self.assertEqual(parse_range("bytes=100-", self.SIZE), (100, 999))
+
+    def test_suffix(self):
+        self.assertEqual(parse_range("bytes=-200", self.SIZE), (800, 999))
+
+    def test_suffix_longer_than_the_file(self):
+        self.assertEqual(parse_range("bytes=-5000", self.SIZE), (0, 999))
+
+    def test_unsatisfiable(self):
+        # attachment_response answers these with 416
+        for header in ("bytes=1000-", "bytes=1000-1200", "bytes=500-100", "bytes=-0"):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                parse_range(header, self.SIZE)
+
+    def test_multiple_ranges_send_the_whole_file(self):
+        self.assertIsNone(parse_range("bytes=0-99,200-299", self.SIZE))
+
+    def test_malformed_sends_the_whole_file(self):
+        for header in ("bytes=-", "bytes=a-b", "items=0-99", ""):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, self.SIZE))
+
+
+def create_request(**fields):
+    values = {
+        "company_name": "Empresa de Prueba", "address": "Calle 1", "city": "La Habana", "state": "La Habana",
+        "phone": "7000000", "email": "empresa@example.com", "tax_id": "123",
+        "contact_name": "Ana", "contact_position": "Gerente", "contact_phone": "7000001",
+        "contact_email": "ana@example.com", "status": "Pendiente",
+    }
+    values.update(fields)
+    return UserRequest.objects.create(**values)
+
+
+def auth_headers(user):
+    return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+
+class ChunkedUploadTests(TestCase):
+    CONTENT = b"0123456789abcdefghij"
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        # Small blocks so each chunk is read in several pieces
+        overrides = override_settings(MEDIA_ROOT=media_root.name, ATTACHMENT_CHUNK_SIZE=4)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user_request = create_request()
+        self.upload = start_upload(
+            self.user_request, "escaneo.pdf", len(self.CONTENT), hashlib.sha256(self.CONTENT).hexdigest(),
+        )
+
+    def append(self, offset, data, length=None):
+        return append_chunk(self.upload.id, offset, io.BytesIO(data), len(data) if length is None else length)
+
+    def test_chunks_are_appended(self):
+        self.append(0, self.CONTENT[:8])
+        upload = self.append(8, self.CONTENT[8:])
+        self.assertEqual(upload.received, len(self.CONTENT))
+        self.assertEqual(part_path(upload).read_bytes(), self.CONTENT)
+
+    def test_offset_mismatch(self):
+        self.append(0, self.CONTENT[:8])
+        for offset in (0, 12):
+            with self.subTest(offset=offset), self.assertRaises(OffsetMismatch) as raised:
+                self.append(offset, self.CONTENT[offset:offset + 4])
+            self.assertEqual(raised.exception.upload.received, 8)
+
+    def test_offset_mismatch_answers_409_with_the_expected_offset(self):
+        user = User.objects.create_user("operador", password="x")
+        self.append(0, self.CONTENT[:8])
+        response = self.client.put(
+            f"/api/requests/{self.user_request.id}/uploads/{self.upload.id}?offset=4",
+            data=self.CONTENT[4:8], content_type="application/octet-stream",
+            headers=auth_headers(user),
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["received"], 8)
+
+    def test_short_read_keeps_what_arrived(self):
+        # The client declared 10 bytes and went away after 6
+        upload = self.append(0, self.CONTENT[:6], length=10)
+        self.assertEqual(upload.received, 6)
+        self.assertEqual(part_path(upload).read_bytes(), self.CONTENT[:6])
+        upload = self.append(6, self.CONTENT[6:])
+        self.assertEqual(part_path(upload).read_bytes(), self.CONTENT)
+
+    def test_only_one_writer_of_an_offset_advances(self):
+        upload_id = self.upload.id
+        content = self.CONTENT
+
+        class RacedStream(io.BytesIO):
+            def read(self, size=-1):
+                # Another retry of this chunk finishes while we are still reading
+                if not AttachmentUpload.objects.get(id=upload_id).received:
+                    append_chunk(upload_id, 0, io.BytesIO(content[:8]), 8)
+                return super().read(size)
+
+        with self.assertRaises(OffsetMismatch) as raised:
+            append_chunk(upload_id, 0, RacedStream(content[:4]), 4)
+        self.assertEqual(raised.exception.upload.received, 8)
+        self.assertEqual(part_path(self.upload).read_bytes()[:8], content[:8])
+
+    def test_chunk_past_the_declared_size(self):
+        with self.assertRaises(UploadError):
+            self.append(0, self.CONTENT + b"!")
+
+    def test_finalize_before_all_bytes_arrived(self):
+        self.append(0, self.CONTENT[:8])
+        with self.assertRaises(OffsetMismatch):
+            finalize_upload(self.upload.id)
+
+    def test_checksum_mismatch_resets_the_upload(self):
+        self.append(0, self.CONTENT[::-1])
+        self.assertIsNone(finalize_upload(self.upload.id))
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.received, 0)
+        self.assertEqual(part_path(self.upload).read_bytes(), b"")
+        self.assertFalse(Attachment.objects.exists())
+
+    def test_finalize_stores_the_file_by_content(self):
+        self.append(0, self.CONTENT)
+        attachment = finalize_upload(self.upload.id)
+        self.assertEqual(attachment.user_request, self.user_request)
+        self.assertEqual(attachment.sha256, hashlib.sha256(self.CONTENT).hexdigest())
+        self.assertEqual((Path(settings.MEDIA_ROOT) / attachment.file.name).read_bytes(), self.CONTENT)
+        self.assertFalse(part_path(self.upload).exists())
+
+    def test_double_finalize_returns_the_same_attachment(self):
+        self.append(0, self.CONTENT)
+        first = finalize_upload(self.upload.id)
+        self.assertEqual(finalize_upload(self.upload.id), first)
+        self.assertEqual(Attachment.objects.count(), 1)
+
+    def test_no_chunks_after_finalize(self):
+        self.append(0, self.CONTENT)
+        finalize_upload(self.upload.id)
+        with self.assertRaises(UploadError):
+            self.append(len(self.CONTENT), b"")
+
+
+class HistoryTests(SimpleTestCase):
+    def test_apply_changes_returns_only_what_changed(self):
+        user_request = UserRequest(status="Pendiente", notes=None, city="La Habana")
+        changes = apply_changes(user_request, {"status": "Completado", "notes": "Listo", "city": "La Habana"})
+        self.assertEqual(changes, [
+            {"field": "status", "old": "Pendiente", "new": "Completado"},
+            {"field": "notes", "old": None, "new": "Listo"},
+        ])
+        self.assertEqual((user_request.status, user_request.notes), ("Completado", "Listo"))
+
+    def test_apply_changes_without_changes(self):
+        self.assertEqual(apply_changes(UserRequest(city="Matanzas"), {"city": "Matanzas"}), [])
+
+    def test_action_type_for(self):
+        status = {"field": "status", "old": "Pendiente", "new": "Rechazado"}
+        notes = {"field": "notes", "old": None, "new": "x"}
+        persons = {"field": PERSONS_FIELD, "old": 1, "new": 2}
+        self.assertEqual(action_type_for([notes, status]), "status_changed")
+        self.assertEqual(action_type_for([persons]), "persons_updated")
+        self.assertEqual(action_type_for([notes, persons]), "updated")
+
+    def test_render_action_uses_the_field_labels(self):
+        entry = RequestHistory(action_type="status_changed", changes=[
+            {"field": "status", "old": "Pendiente", "new": "Completado"},
+            {"field": PERSONS_FIELD, "old": 1, "new": 3},
+        ])
+        self.assertEqual(
+            render_action(entry),
+            "Estado cambiado de 'Pendiente' a 'Completado'. Personas autorizadas actualizadas (3).",
+        )
+
+    def test_render_action_of_an_unknown_field(self):
+        entry = RequestHistory(changes=[{"field": "campo_retirado", "old": "a", "new": "b"}])
+        self.assertEqual(render_action(entry), "campo_retirado cambiado de 'a' a 'b'.")
+
+    def test_render_action_of_legacy_rows(self):
+        legacy = RequestHistory(action_type="updated", changes=[], action="Estado cambiado a Completado.")
+        self.assertEqual(render_action(legacy), "Estado cambiado a Completado.")
+        self.assertEqual(render_action(RequestHistory(action_type="created", changes=[])), "Solicitud creada.")
+
+
+class FakeMailer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def send_messages(self, messages):
+        if self.fail:
+            raise OSError("SMTP no disponible")
+        self.sent.extend(messages)
+        return len(messages)
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_BASE_SECONDS=30, EMAIL_OUTBOX_LEASE_SECONDS=300)
+class EmailOutboxTests(TestCase):
+    CONTEXT = {"company_name": "Empresa de Prueba", "rejection_reason": "Falta el NIT"}
+
+    def setUp(self):
+        # No broker in tests; the dispatcher would reschedule itself
+        patcher = mock.patch.object(outbox, "schedule_dispatch")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, key="reject_email:1:1"):
+        return outbox.enqueue_email(key, "reject_email", "Solicitud Rechazada", ["ana@example.com"], self.CONTEXT)
+
+    def dispatch(self, mailer):
+        with mock.patch.object(outbox, "get_mailer", return_value=mailer):
+            return outbox.dispatch_pending()
+
+    def make_due(self, message):
+        EmailOutbox.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+
+    def test_same_key_is_queued_once(self):
+        first = self.enqueue()
+        second = outbox.enqueue_email(first.message_key, "reject_email", "Otro asunto", ["otro@example.com"], {})
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(EmailOutbox.objects.get().subject, "Solicitud Rechazada")
+
+    def test_sent_message_drops_its_context(self):
+        message = self.enqueue()
+        mailer = FakeMailer()
+        self.assertEqual(self.dispatch(mailer), {"sent": 1, "retried": 0, "dead": 0})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.context), ("Enviado", {}))
+        self.assertEqual(mailer.sent[0].to, ["ana@example.com"])
+
+    def test_retry_backoff_doubles(self):
+        message = self.enqueue()
+        for attempts, delay in ((1, 30), (2, 60)):
+            before = timezone.now()
+            self.assertEqual(self.dispatch(FakeMailer(fail=True))["retried"], 1)
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), ("Pendiente", attempts))
+            self.assertEqual(message.last_error, "SMTP no disponible")
+            self.assertGreaterEqual(message.next_attempt_at, before + timedelta(seconds=delay))
+            self.assertLess(message.next_attempt_at, before + timedelta(seconds=delay + 5))
+            # Not due yet: the next run leaves it alone
+            self.assertEqual(self.dispatch(FakeMailer()), {"sent": 0, "retried": 0, "dead": 0})
+            self.make_due(message)
+
+    def test_dead_letter_after_max_attempts_drops_the_context(self):
+        message = self.enqueue()
+        EmailOutbox.objects.filter(pk=message.pk).update(attempts=2)
+        self.assertEqual(self.dispatch(FakeMailer(fail=True))["dead"], 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.context), ("Fallido", 3, {}))
+        self.make_due(message)
+        self.assertEqual(self.dispatch(FakeMailer()), {"sent": 0, "retried": 0, "dead": 0})
+
+    def test_claimed_message_is_skipped_until_its_lease_expires(self):
+        message = self.enqueue()
+        claimed = outbox.claim_batch(10)
+        self.assertEqual([row.pk for row in claimed], [message.pk])
+        message.refresh_from_db()
+        self.assertEqual(message.status, "Enviando")
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=290))
+
+        # Another dispatcher leaves the live claim alone...
+        self.assertEqual(self.dispatch(FakeMailer())["sent"], 0)
+        # ...and takes it over once the claimant has died and the lease ran out
+        self.make_due(message)
+        self.assertEqual(self.dispatch(FakeMailer())["sent"], 1)
+        message.refresh_from_db()
+        self.assertEqual(message.status, "Enviado")
+
+
+class RejectionEmailTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("operador", password="x")
+        self.user_request = create_request()
+
+    def update(self, **payload):
+        response = self.client.put(
+            f"/api/requests/{self.user_request.id}", data=payload, content_type="application/json",
+            headers=auth_headers(self.user),
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def rejection_emails(self):
+        return EmailOutbox.objects.filter(template="reject_email")
+
+    def test_repeated_save_sends_once(self):
+        self.update(status="Rechazado", notes="Falta el NIT")
+        self.update(status="Rechazado", notes="Falta el NIT")
+        self.assertEqual(self.rejection_emails().count(), 1)
+
+    def test_rejecting_again_after_reopening_sends_again(self):
+        self.update(status="Rechazado", notes="Falta el NIT")
+        self.update(status="Pendiente")
+        self.update(status="Rechazado", notes="Falta el NIT")
+        self.assertEqual(self.rejection_emails().count(), 2)
+
+
+class CachedUserTests(TestCase):
+    def test_uncached_fields_load_from_the_database(self):
+        user = User.objects.create_user("operador", password="secreta", first_name="Ana")
+        cached = resolve_user(user.id)
+        self.assertEqual((cached.username, cached.is_active), ("operador", True))
+        self.assertEqual(cached.get_deferred_fields(), {
+            field.attname for field in User._meta.concrete_fields
+        } - {"id", "username", "is_active", "is_staff"})
+        self.assertEqual(cached.first_name, "Ana")
+        self.assertTrue(cached.check_password("secreta"))
+
+    def test_saving_does_not_blank_the_other_fields(self):
+        user = User.objects.create_user("operador", password="secreta", first_name="Ana")
+        cached = resolve_user(user.id)
+        cached.is_staff = True
+        cached.save()
+        user.refresh_from_db()
+        self.assertTrue(user.is_staff)
+        self.assertEqual(user.first_name, "Ana")
+        self.assertTrue(user.check_password("secreta"))
+
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TWO_FACTOR_MAX_ATTEMPTS=3, TWO_FACTOR_CODE_TTL=600)
+class TwoFactorStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("operador", password="x")
+        self.store = RedisTwoFactorStore()
+
+    def test_code_is_single_use(self):
+        self.store.issue(self.user, "1234")
+        self.assertEqual(self.store.verify("operador", "1234"), VALID)
+        self.assertEqual(self.store.verify("operador", "1234"), INVALID)
+
+    def test_codes_are_not_written_to_the_database(self):
+        self.store.issue(self.user, "1234")
+        self.assertFalse(TwoFactorAuth.objects.exists())
+
+    def test_lockout_after_max_attempts(self):
+        self.store.issue(self.user, "1234")
+        for _ in range(3):
+            self.assertEqual(self.store.verify("operador", "0000"), INVALID)
+        # Even the right code is refused once the attempts are used up, and it is gone
+        self.assertEqual(self.store.verify("operador", "1234"), LOCKED)
+        self.assertEqual(self.store.verify("operador", "1234"), INVALID)
+
+    def test_new_code_resets_the_attempts(self):
+        self.store.issue(self.user, "1234")
+        for _ in range(3):
+            self.store.verify("operador", "0000")
+        self.store.issue(self.user, "5678")
+        self.assertEqual(self.store.verify("operador", "5678"), VALID)
+
+    def test_code_expires(self):
+        self.store.issue(self.user, "1234")
+        later = timezone.now().timestamp() + 601
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(self.store.verify("operador", "1234"), INVALID)
+
+    def test_attempt_counter_expiring_first(self):
+        self.store.issue(self.user, "1234")
+        cache.delete(RedisTwoFactorStore._attempts_key("operador"))
+        self.assertEqual(self.store.verify("operador", "1234"), EXPIRED)
+
+    def test_fallback_to_the_model_when_the_cache_is_down(self):
+        down = mock.Mock(**{
+            "set_many.side_effect": ConnectionError("redis caído"),
+            "get.side_effect": ConnectionError("redis caído"),
+        })
+        with mock.patch("requests_app.two_factor.cache", down):
+            self.store.issue(self.user, "1234")
+            self.assertTrue(TwoFactorAuth.objects.filter(user=self.user, code="1234").exists())
+            self.assertEqual(self.store.verify("operador", "1234"), VALID)
+            self.assertEqual(self.store.verify("operador", "1234"), INVALID)
+
+    def test_code_issued_during_an_outage_verifies_once_the_cache_is_back(self):
+        with mock.patch("requests_app.two_factor.cache", mock.Mock(**{"set_many.side_effect": ConnectionError()})):
+            self.store.issue(self.user, "1234")
+        self.assertEqual(self.store.verify("operador", "1234"), VALID)
+        self.assertFalse(TwoFactorAuth.objects.exists())
+
+
+THROTTLE_RATES = {"login_ip": (4, 60), "login_user": (2, 60), "verify_ip": (4, 300), "verify_user": (2, 300)}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SlidingWindowLimiterTests(SimpleTestCase):
+    # Start of a 60 s window
+    NOW = 6000.0
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = SlidingWindowLimiter("login_user", 3, 60)
+
+    def hit(self, at, identity="operador", limiter=None):
+        with mock.patch("requests_app.throttling.time.time", return_value=at):
+            return (limiter or self.limiter).hit(identity)
+
+    def test_limit_within_a_window(self):
+        for _ in range(3):
+            self.assertEqual(self.hit(self.NOW), (True, 0))
+        self.assertEqual(self.hit(self.NOW + 15), (False, 45))
+
+    def test_retry_after_at_the_window_boundary(self):
+        for _ in range(3):
+            self.hit(self.NOW + 59)
+        # The previous window still weighs fully right at the boundary...
+        self.assertEqual(self.hit(self.NOW + 60), (False, 1))
+        # ...and a second later its weight has dropped below the limit
+        self.assertEqual(self.hit(self.NOW + 61), (True, 0))
+        self.assertFalse(self.hit(self.NOW + 61)[0])
+
+    def test_retry_after_while_the_previous_window_fades(self):
+        for _ in range(3):
+            self.hit(self.NOW + 30)
+        self.hit(self.NOW + 90)
+        # 3 * (1 - 30/60) + 1 = 2.5 allowed, then 3 * (1 - 30/60) + 2 >= 3 rejected
+        # until 3 * (1 - (30 + t)/60) + 2 < 3, i.e. t > 10
+        self.assertEqual(self.hit(self.NOW + 90), (True, 0))
+        self.assertEqual(self.hit(self.NOW + 90), (False, 10))
+
+    def test_limits_are_per_identity_and_scope(self):
+        for _ in range(3):
+            self.hit(self.NOW, "operador")
+        self.assertFalse(self.hit(self.NOW, "operador")[0])
+        self.assertTrue(self.hit(self.NOW, "otro")[0])
+        self.assertTrue(self.hit(self.NOW, "operador", SlidingWindowLimiter("verify_user", 3, 60))[0])
+
+    def test_allows_when_the_cache_is_down(self):
+        with mock.patch("requests_app.throttling.cache", mock.Mock(**{"get_many.side_effect": ConnectionError()})):
+            self.assertEqual(self.hit(self.NOW), (True, 0))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, AUTH_THROTTLE_RATES=THROTTLE_RATES)
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user("operador", password="secreta")
+        clock = mock.patch("requests_app.throttling.time.time", return_value=SlidingWindowLimiterTests.NOW)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def post(self, path, **payload):
+        return self.client.post(f"/api/auth/{path}", data=payload, content_type="application/json")
+
+    def test_login_is_limited_per_username(self):
+        for _ in range(2):
+            self.assertEqual(self.post("login/", username="operador", password="mal").status_code, 200)
+        response = self.post("login/", username="Operador", password="secreta")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+        self.assertEqual(self.post("login/", username="otro", password="mal").status_code, 200)
+
+    def test_login_is_limited_per_ip(self):
+        for name in ("a", "b", "c", "d"):
+            self.assertEqual(self.post("login/", username=name, password="mal").status_code, 200)
+        self.assertEqual(self.post("login/", username="e", password="mal").status_code, 429)
+
+    def test_verify_2fa_is_limited_separately_from_login(self):
+        for _ in range(2):
+            self.post("login/", username="operador", password="mal")
+        for _ in range(2):
+            self.assertEqual(self.post("verify-2fa/", username="operador", code="0000").status_code, 404)
+        response = self.post("verify-2fa/", username="operador", code="0000")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "300")
+
+
+@override_settings(USER_COD_INDEX_REFRESH_SECONDS=0, USER_COD_INDEX_RELOAD_SECONDS=3600)
+class UserCodIndexTests(TestCase):
+    def setUp(self):
+        self.oracle = FakeOracle(existing_users=2)
+        self.cursor = self.oracle.connect().cursor()
+        self.index = UserCodIndex()
+        self.index.load(self.cursor)
+
+    def test_load(self):
+        self.assertEqual(self.index.stats()["size"], 2)
+        self.assertIn("bench0", self.index)
+        self.assertEqual(self.index.next_free("BENCH"), ("BENCH", 0))
+
+    def test_next_free_skips_taken_codes(self):
+        self.index.add("APEREZ")
+        self.index.add("APEREZ1")
+        self.assertEqual(self.index.next_free("APEREZ"), ("APEREZ2", 2))
+
+    def test_refresh_sees_codes_provisioned_by_another_worker(self):
+        user_request = create_request(customer_code="C-001")
+        # Provisioning happens days after the request came in
+        UserRequest.objects.filter(pk=user_request.pk).update(created_at=timezone.now() - timedelta(days=5))
+        user_request.refresh_from_db()
+        person = AuthorizedPerson(user_request=user_request, name="Ana Pérez", phone="7000001", email="ana@example.com")
+        with self.oracle:
+            created = provision_oracle_users(user_request, [person])
+        self.assertEqual([user["user"] for user in created], ["ANAP"])
+
+        self.index.refresh(self.cursor)
+        self.assertIn("ANAP", self.index)
+        self.assertEqual(self.index.next_free("ANAP"), ("ANAP1", 1))
@@ -0,0 +1,113 @@
+"""
+Storage of the 2FA codes sent by email at login.
+
+RedisTwoFactorStore keeps one entry per username in the cache with a TTL
+equal to the code lifetime and an attempt counter, so logins do not write
+to Postgres. ModelTwoFactorStore is the original TwoFactorAuth table and is
+used as a fallback whenever the cache is unavailable.
+"""
+import hashlib
+import hmac
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import TwoFactorAuth
+
+
+logger = logging.getLogger(__name__)
+
+
+VALID = "valid"
+INVALID = "invalid"
+EXPIRED = "expired"
+LOCKED = "locked"
+
+
+def _hash_code(username, code):
+    key = settings.SECRET_KEY.encode()
+    return hmac.new(key, f"{username}:{code}".encode(), hashlib.sha256).hexdigest()
+
+
+class ModelTwoFactorStore:
+    """Codes stored in the TwoFactorAuth table (one row per user)."""
+
+    def issue(self, user, code):
+        TwoFactorAuth.objects.update_or_create(
+            user=user,
+            defaults={
+                "code": code,
+                "expires_at": timezone.now() + timedelta(seconds=settings.TWO_FACTOR_CODE_TTL),
+                "created_at": timezone.now(),
+            },
+        )
+
+    def verify(self, username, code):
+        two_factor_auth = (
+            TwoFactorAuth.objects.select_related("user")
+            .filter(user__username=username, code=code)
+            .first()
+        )
+        if two_factor_auth is None:
+            return INVALID
+        # Used or expired codes are removed so the table does not keep growing
+        two_factor_auth.delete()
+        if two_factor_auth.is_expired():
+            return EXPIRED
+        return VALID
+
+
+class RedisTwoFactorStore:
+    """Codes stored in the Redis cache, keyed by username, with an attempt limit."""
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or ModelTwoFactorStore()
+
+    @staticmethod
+    def _code_key(username):
+        return f"2fa:code:{username}"
+
+    @staticmethod
+    def _attempts_key(username):
+        return f"2fa:attempts:{username}"
+
+    def issue(self, user, code):
+        ttl = settings.TWO_FACTOR_CODE_TTL
+        try:
+            cache.set_many({
+                self._code_key(user.username): _hash_code(user.username, code),
+                self._attempts_key(user.username): 0,
+            }, timeout=ttl)
+        except Exception as e:
+            logger.warning("2FA cache unavailable, storing code in the database: %s", e)
+            self.fallback.issue(user, code)
+
+    def verify(self, username, code):
+        try:
+            stored = cache.get(self._code_key(username))
+            if stored is None:
+                # Not in Redis: the code may have been issued during a cache outage
+                return self.fallback.verify(username, code)
+            attempts = cache.incr(self._attempts_key(username))
+            if attempts > settings.TWO_FACTOR_MAX_ATTEMPTS:
+                cache.delete_many([self._code_key(username), self._attempts_key(username)])
+                return LOCKED
+            if not hmac.compare_digest(stored, _hash_code(username, code)):
+                return INVALID
+            cache.delete_many([self._code_key(username), self._attempts_key(username)])
+            return VALID
+        except ValueError:
+            # The attempt counter expired between get and incr, so did the code
+            return EXPIRED
+        except Exception as e:
+            logger.warning("2FA cache unavailable, checking the database: %s", e)
+            return self.fallback.verify(username, code)
+
+
+def get_two_factor_store():
+    if settings.TWO_FACTOR_STORE == "redis":
+        return RedisTwoFactorStore()
+    return ModelTwoFactorStore()
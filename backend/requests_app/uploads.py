@@ -0,0 +1,167 @@
+"""
+Chunked, resumable attachment uploads.
+
+The client declares the file (name, size, SHA-256), then PUTs it in pieces,
+each at the offset the server has received so far. Chunks are read from
+the request in ATTACHMENT_CHUNK_SIZE blocks and appended to a part file, so
+memory per upload stays bounded whatever the file size. After a disconnect
+the client asks for the current offset and continues from there. Finalizing
+hashes the part file and, if it matches, stores it by content like the
+mirrored files.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .attachments import ATTACHMENTS_DIR, guess_content_type, store_file
+from .models import Attachment, AttachmentUpload
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """The chunk doesn't start where the received bytes end; the client should resume from upload.received."""
+
+    def __init__(self, upload):
+        super().__init__(f"Se esperaba el desplazamiento {upload.received}.")
+        self.upload = upload
+
+
+def part_path(upload):
+    return Path(settings.MEDIA_ROOT) / ATTACHMENTS_DIR / "uploads" / f"{upload.id}.part"
+
+
+def start_upload(user_request, filename, size, sha256, content_type=None, user=None):
+    """Registers a new upload for user_request and creates its empty part file."""
+    if size > settings.ATTACHMENT_MAX_BYTES:
+        raise UploadError(f"El archivo supera el máximo de {settings.ATTACHMENT_MAX_BYTES} bytes.")
+    sha256 = sha256.lower()
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise UploadError("sha256 debe ser el resumen hexadecimal del archivo.")
+
+    purge_stale_uploads()
+    upload = AttachmentUpload.objects.create(
+        user_request=user_request,
+        filename=os.path.basename(filename)[:255],
+        content_type=content_type,
+        size=size,
+        sha256=sha256,
+        created_by=user,
+    )
+    path = part_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return upload
+
+
+def append_chunk(upload_id, offset, stream, length):
+    """
+    Appends length bytes read from stream at offset. Raises OffsetMismatch
+    if offset isn't the number of bytes received so far, which is what the
+    client must resume from. Returns the updated upload.
+    """
+    if length > settings.ATTACHMENT_UPLOAD_MAX_CHUNK:
+        raise UploadError(f"Cada fragmento puede tener como máximo {settings.ATTACHMENT_UPLOAD_MAX_CHUNK} bytes.")
+
+    upload = AttachmentUpload.objects.get(id=upload_id)
+    if upload.attachment_id:
+        raise UploadError("La subida ya fue finalizada.")
+    if offset != upload.received:
+        raise OffsetMismatch(upload)
+    if offset + length > upload.size:
+        raise UploadError("El fragmento excede el tamaño declarado del archivo.")
+
+    # No transaction while reading: a slow client must not hold a row lock
+    # or a connection. Bytes past 'received' are left over from an
+    # interrupted chunk and are overwritten.
+    written = 0
+    with open(part_path(upload), "r+b") as part:
+        part.seek(offset)
+        while written < length:
+            block = stream.read(min(settings.ATTACHMENT_CHUNK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+
+    # A short read means the client went away mid-chunk: keep what arrived.
+    # Only one writer of this offset gets to move 'received'; the row stays
+    # locked until the part file is cut to match, so the next chunk can't
+    # start before that.
+    with transaction.atomic():
+        claimed = AttachmentUpload.objects.filter(id=upload_id, received=offset, attachment__isnull=True).update(
+            received=offset + written, updated_at=timezone.now(),
+        )
+        if claimed:
+            os.truncate(part_path(upload), offset + written)
+    upload.refresh_from_db()
+    if not claimed:
+        if upload.attachment_id:
+            raise UploadError("La subida ya fue finalizada.")
+        raise OffsetMismatch(upload)
+    return upload
+
+
+def finalize_upload(upload_id):
+    """
+    Checks the part file against the declared size and SHA-256 and stores it
+    as an Attachment of the request. Finalizing twice returns the same
+    attachment. On a checksum mismatch the received bytes are discarded and
+    None is returned.
+    """
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().select_related("attachment").get(id=upload_id)
+        if upload.attachment:
+            return upload.attachment
+        if upload.received != upload.size:
+            raise OffsetMismatch(upload)
+
+        path = part_path(upload)
+        digest = hashlib.sha256()
+        with open(path, "rb") as part:
+            while block := part.read(settings.ATTACHMENT_CHUNK_SIZE):
+                digest.update(block)
+        if digest.hexdigest() != upload.sha256:
+            path.write_bytes(b"")
+            upload.received = 0
+            upload.save(update_fields=["received", "updated_at"])
+            return None
+
+        attachment = Attachment.objects.create(
+            user_request=upload.user_request,
+            file=store_file(str(path), upload.sha256),
+            original_filename=upload.filename,
+            sha256=upload.sha256,
+            size=upload.size,
+            content_type=guess_content_type(upload.content_type, upload.filename),
+            status="Descargado",
+            downloaded_at=timezone.now(),
+        )
+        upload.attachment = attachment
+        upload.save(update_fields=["attachment", "updated_at"])
+    return attachment
+
+
+def purge_stale_uploads():
+    """
+    Deletes uploads idle for more than ATTACHMENT_UPLOAD_EXPIRY_HOURS with
+    their part files. Attachments of finalized uploads are kept.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.ATTACHMENT_UPLOAD_EXPIRY_HOURS)
+    stale = list(AttachmentUpload.objects.filter(updated_at__lt=cutoff))
+    for upload in stale:
+        part_path(upload).unlink(missing_ok=True)
+    if stale:
+        AttachmentUpload.objects.filter(id__in=[upload.id for upload in stale]).delete()
+        logger.info("Purged %s stale attachment uploads", len(stale))
@@ -0,0 +1,165 @@
+"""
+Per-process cache of the USER_COD values that already exist in CM_WEB.WEB_USER.
+
+The index is loaded once with a bulk array fetch and then refreshed
+incrementally using REC_TIM/UPD_TIM, so generate_user_cod only has to ask
+Oracle to confirm the final candidate. The WEB_USER primary key remains the
+safety net for anything the cache has not seen yet.
+"""
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+LOAD_SQL = """
+SELECT USER_COD, GREATEST(NVL(REC_TIM, DATE '1900-01-01'), NVL(UPD_TIM, DATE '1900-01-01'))
+FROM CM_WEB.WEB_USER
+"""
+
+REFRESH_SQL = """
+SELECT USER_COD, GREATEST(NVL(REC_TIM, DATE '1900-01-01'), NVL(UPD_TIM, DATE '1900-01-01'))
+FROM CM_WEB.WEB_USER
+WHERE REC_TIM >= :since OR UPD_TIM >= :since
+"""
+
+
+class UserCodIndex:
+    """
+    Set of existing USER_COD values plus the newest REC_TIM/UPD_TIM seen.
+
+    Deleted users are only dropped on the periodic full reload; a stale entry
+    just makes generate_user_cod skip a code that would have been free.
+    Rows inserted with a back-dated REC_TIM can be missed by the incremental
+    refresh, which is why Oracle still confirms every candidate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = set()
+        self._watermark = None
+        self._loaded_at = None
+        self._refreshed_at = None
+        self.load_count = 0
+        self.refresh_count = 0
+        self.last_load_seconds = 0.0
+        self.last_refresh_seconds = 0.0
+        self.last_refresh_rows = 0
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def _fetch(self, cursor, sql, params=None, watermark=None):
+        """Returns the codes of the query's rows, its row count and the newest change seen."""
+        cursor.arraysize = settings.USER_COD_INDEX_ARRAYSIZE
+        cursor.execute(sql, params or {})
+        codes = set()
+        rows = 0
+        while True:
+            batch = cursor.fetchmany()
+            if not batch:
+                break
+            rows += len(batch)
+            for user_cod, changed_at in batch:
+                if user_cod:
+                    codes.add(user_cod.upper())
+                if changed_at and (watermark is None or changed_at > watermark):
+                    watermark = changed_at
+        return codes, rows, watermark
+
+    # The published set is never modified in place: writers build a new one
+    # and swap it in under the lock, so readers need no lock and never see a
+    # half-loaded index.
+
+    def load(self, cursor):
+        """Replaces the index with a full bulk fetch of WEB_USER."""
+        start = time.perf_counter()
+        with self._lock:
+            self._codes, rows, self._watermark = self._fetch(cursor, LOAD_SQL)
+            self._loaded_at = self._refreshed_at = time.monotonic()
+            self.load_count += 1
+            self.last_load_seconds = time.perf_counter() - start
+            self.last_refresh_rows = rows
+        logger.info("USER_COD index loaded: %s codes in %.3fs", rows, self.last_load_seconds)
+
+    def refresh(self, cursor):
+        """
+        Brings the index up to date. Does a full load the first time and
+        every USER_COD_INDEX_RELOAD_SECONDS, otherwise only fetches rows
+        created or updated since the last watermark.
+        """
+        now = time.monotonic()
+        if not self.loaded or now - self._loaded_at >= settings.USER_COD_INDEX_RELOAD_SECONDS:
+            self.load(cursor)
+            return
+        if now - self._refreshed_at < settings.USER_COD_INDEX_REFRESH_SECONDS:
+            return
+
+        start = time.perf_counter()
+        with self._lock:
+            if self._watermark is None:
+                codes, rows, self._watermark = self._fetch(cursor, LOAD_SQL)
+            else:
+                codes, rows, self._watermark = self._fetch(
+                    cursor, REFRESH_SQL, {'since': self._watermark}, self._watermark
+                )
+            if not codes <= self._codes:
+                self._codes = self._codes | codes
+            self._refreshed_at = time.monotonic()
+            self.refresh_count += 1
+            self.last_refresh_seconds = time.perf_counter() - start
+            self.last_refresh_rows = rows
+
+    def __contains__(self, user_cod):
+        return user_cod.upper() in self._codes
+
+    def add(self, user_cod):
+        """Records a code that is now taken (inserted by us or found in Oracle)."""
+        with self._lock:
+            self._codes = self._codes | {user_cod.upper()}
+
+    def next_free(self, base_code, counter=0):
+        """
+        Returns the first candidate (base_code, base_code1, base_code2, ...)
+        starting at ``counter`` that is not in the index, and the counter used.
+        """
+        codes = self._codes
+        while True:
+            candidate = base_code if counter == 0 else f"{base_code}{counter}"
+            if candidate.upper() not in codes:
+                return candidate, counter
+            counter += 1
+
+    def stats(self):
+        """Size and cost figures for the metrics endpoint and logs."""
+        codes = self._codes
+        approx_bytes = sys.getsizeof(codes) + sum(sys.getsizeof(c) for c in codes)
+        return {
+            'size': len(codes),
+            'approx_bytes': approx_bytes,
+            'load_count': self.load_count,
+            'refresh_count': self.refresh_count,
+            'last_load_seconds': self.last_load_seconds,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'last_refresh_rows': self.last_refresh_rows,
+            'watermark': self._watermark.isoformat() if self._watermark else None,
+        }
+
+
+_index = None
+
+
+def get_user_cod_index():
+    """Returns this process's index, or None when USER_COD_INDEX_ENABLED is off."""
+    global _index
+    if not settings.USER_COD_INDEX_ENABLED:
+        return None
+    if _index is None:
+        _index = UserCodIndex()
+    return _index
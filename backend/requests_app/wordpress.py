@@ -0,0 +1,103 @@
+"""
+Client for the WordPress 'user-record' endpoints on tcmariel.cu.
+
+httpx is imported on first use, so importing this module (and the API
+that uses it) stays cheap for workers that never sync with WordPress.
+"""
+import asyncio
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+WP_RECORDS_URL = "https://www.tcmariel.cu/wp-json/user-record/v1/records"
+# Files are only ever fetched from the WP site itself
+WP_HOST = urlsplit(WP_RECORDS_URL).hostname
+MAX_FILE_REDIRECTS = 3
+
+
+class UntrustedFileURL(ValueError):
+    """A file URL (or a redirect target) outside the WP site."""
+
+
+def is_wp_file_url(url):
+    """True for plain http(s) URLs on WP_HOST, without credentials or a custom port."""
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except (TypeError, ValueError):
+        return False
+    return (
+        parts.scheme in ("http", "https")
+        and parts.hostname == WP_HOST
+        and port is None
+        and parts.username is None
+        and parts.password is None
+    )
+
+
+def _httpx():
+    import httpx
+
+    return httpx
+
+
+async def fetch_records():
+    """Returns the records published by the WP form, or [] if WP is unreachable."""
+    httpx = _httpx()
+    try:
+        async with httpx.AsyncClient(timeout=15) as client:
+            response = await client.get(WP_RECORDS_URL)
+            response.raise_for_status()
+            return response.json()
+    except Exception as e:
+        logger.warning("No se pudo sincronizar con WP: %s", e)
+        return []
+
+
+async def _confirm_record(client, record_id):
+    httpx = _httpx()
+    try:
+        response = await client.get(f"{WP_RECORDS_URL}/{record_id}")
+        response.raise_for_status()
+        logger.info("Consumido endpoint de WP para solicitud importada %s. Estado: %s", record_id, response.status_code)
+    except httpx.HTTPError as e:
+        logger.error("Fallo al consumir endpoint de WP para solicitud importada %s: %s", record_id, e)
+
+
+async def confirm_records(record_ids):
+    """Tells WP that the given records were imported, all calls in parallel."""
+    if not record_ids:
+        return
+    async with _httpx().AsyncClient(timeout=10) as client:
+        await asyncio.gather(*(_confirm_record(client, record_id) for record_id in record_ids))
+
+
+@contextmanager
+def open_file(url, timeout=30):
+    """
+    Opens a file uploaded through the WP form as a streamed response; read it
+    with response.iter_bytes(). Raises UntrustedFileURL if the URL, or any
+    redirect, leaves WP_HOST, and httpx.HTTPError if it can't be fetched.
+    """
+    httpx = _httpx()
+    # Redirects are followed by hand so every hop is checked before it is requested
+    with httpx.Client(timeout=timeout, follow_redirects=False) as client:
+        for _ in range(MAX_FILE_REDIRECTS + 1):
+            if not is_wp_file_url(url):
+                raise UntrustedFileURL(f"{url} no pertenece a {WP_HOST}")
+            response = client.send(client.build_request("GET", url), stream=True)
+            if not response.is_redirect:
+                break
+            response.close()
+            url = str(response.url.join(response.headers["location"]))
+        else:
+            raise httpx.TooManyRedirects(f"Más de {MAX_FILE_REDIRECTS} redirecciones", request=response.request)
+        try:
+            response.raise_for_status()
+            yield response
+        finally:
+            response.close()